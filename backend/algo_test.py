@@ -54,12 +54,12 @@ deliveries = [
   { "location": [9, 9],  "time_window": ["12:05", "13:00"] }
 ]
 def add_deliveries():
-    for i, delivery in enumerate(deliveries):
-        res = requests.post(f"{BASE_URL}/add-delivery", json=delivery)
-        if res.status_code == 200:
-            print(f"✅ 添加第 {i+1} 个送货点: {delivery['location']} 成功")
-        else:
-            print(f"❌ 添加失败: {delivery['location']}, 返回: {res.text}")
+    # 一次请求批量添加全部送货点
+    res = requests.post(f"{BASE_URL}/deliveries/bulk", json=deliveries)
+    if res.status_code == 200 and res.json().get("status") == "ok":
+        print(f"✅ 批量添加 {res.json()['added']} 个送货点成功")
+    else:
+        print(f"❌ 批量添加失败, 返回: {res.text}")
 
 if __name__ == "__main__":
     add_deliveries()
\ No newline at end of file
@@ -0,0 +1,317 @@
+"""
+性能基准：地图构建、get_effective_graph、距离矩阵、点到点最短路径和各求解器。
+所有输入由固定种子生成，结果（耗时 + 内存峰值）保存为 JSON，与上一次的基线对比即可发现性能回退。
+
+用法（在 backend 目录下）：
+    python benchmark.py --quick                        # 小规模，约半分钟
+    python benchmark.py --save bench_baseline.json     # 完整运行并保存基线
+    python benchmark.py --compare bench_baseline.json  # 与基线对比，变慢超过阈值时返回非 0
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ch import CustomizableCH
+from csr_graph import CSRGraph
+from delivery import Delivery
+from dijkstra import compute_distance_matrix
+from graph_map import GraphMap
+from planner import SOLVERS, plan_route
+from search_monitor import SearchMonitor
+
+# 地图尺寸、封路比例
+SIZES = [(20, 10), (100, 100), (300, 300), (1000, 1000)]
+QUICK_SIZES = [(20, 10), (100, 100)]
+BLOCK_DENSITIES = [0.0, 0.02, 0.1]
+QUICK_BLOCK_DENSITIES = [0.0, 0.1]
+
+# networkx 图和收缩层次只在不超过这些节点数的地图上测量（更大的地图内存 / 预处理时间过大）
+MAX_NETWORKX_NODES = 40_000
+MAX_CH_NODES = 10_000
+
+# 送货点数量、时间窗宽度（分钟）
+DELIVERY_COUNTS = [8, 12, 20, 50]
+QUICK_DELIVERY_COUNTS = [8, 12]
+WINDOW_WIDTHS = {"loose": 240, "tight": 30}
+
+# 精确求解器（dfs / dp）适用的最大送货点数
+MAX_EXACT = {"dfs": 12, "dp": 16}
+
+KEY_POINTS = 50
+PATH_QUERIES = 20
+
+
+# ===============================
+# 输入生成（固定种子）
+# ===============================
+def make_map(width: int, height: int, density: float, seed: int) -> GraphMap:
+    """csr 后端地图，随机封锁 density 比例的边（耗时保持默认）"""
+    rng = np.random.default_rng(seed)
+    csr = CSRGraph.from_grid(width, height)
+    csr.blocked = rng.random(csr.num_edges) < density
+    sources = csr.edge_sources()[csr.blocked].tolist()
+    targets = csr.targets[csr.blocked].tolist()
+    blocked_edges = {(csr.node_xy(u), csr.node_xy(v)) for u, v in zip(sources, targets)}
+    return GraphMap.from_csr(csr, backend="csr", blocked_edges=blocked_edges)
+
+
+def random_points(gmap: GraphMap, count: int, seed: int) -> List[Tuple[int, int]]:
+    rng = random.Random(seed)
+    cells = rng.sample(range(gmap.width * gmap.height), min(count, gmap.width * gmap.height))
+    return [(c % gmap.width, c // gmap.width) for c in cells]
+
+
+def make_deliveries(gmap: GraphMap, start: Tuple[int, int], count: int, window: int,
+                    seed: int) -> List[Delivery]:
+    """
+    在地图上随机取 count 个送货点，沿一条随机顺序的路线计算到达时间，
+    时间窗以到达时间为中心、宽 window 分钟，保证至少有一个可行解。
+    """
+    rng = random.Random(seed)
+    points = [p for p in random_points(gmap, count + 1, seed) if p != start][:count]
+    matrix = compute_distance_matrix(gmap, [start] + points, dense=True)
+    order = points[:]
+    rng.shuffle(order)
+    base = 8 * 60
+    deliveries, t, here = [], 0.0, start
+    for point in order:
+        t += matrix[here, point]
+        here = point
+        center = base + int(t)
+        earliest = max(0, center - rng.randint(0, window))
+        deliveries.append(Delivery.from_minutes(point, earliest, earliest + window, base))
+    rng.shuffle(deliveries)
+    return deliveries
+
+
+def algo_test_deliveries() -> List[Delivery]:
+    """algo_test.py 中的 49 个送货点（20x10 地图，起点 (0, 0)）"""
+    from algo_test import deliveries
+    return [Delivery(tuple(d["location"]), tuple(d["time_window"])) for d in deliveries]
+
+
+# ===============================
+# 计时与内存
+# ===============================
+class Deadline(SearchMonitor):
+    """求解器超过 seconds 秒后停止，返回已找到的最好解"""
+
+    def __init__(self, seconds: float):
+        self.deadline = time.perf_counter() + seconds
+        self.stopped = False
+
+    def should_stop(self) -> bool:
+        if not self.stopped and time.perf_counter() >= self.deadline:
+            self.stopped = True
+        return self.stopped
+
+
+def measure(fn: Callable, repeat: int = 1, memory: bool = True):
+    """
+    运行 fn repeat 次，返回 (最后一次的结果, {seconds: 最快一次, peak_bytes: Python / NumPy 分配的内存峰值})。
+    内存峰值用 tracemalloc 单独再运行一次测量，不影响计时。
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    record = {"seconds": round(min(times), 6)}
+    if memory:
+        tracemalloc.start()
+        fn()
+        record["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, record
+
+
+class Benchmark:
+    def __init__(self, quick: bool = False, memory: bool = True, time_limit: float = 10.0,
+                 seed: int = 2024):
+        self.quick = quick
+        self.memory = memory
+        self.time_limit = time_limit
+        self.seed = seed
+        self.results: List[Dict] = []
+
+    def record(self, group: str, name: str, params: Dict, record: Dict, **extra):
+        entry = {"group": group, "name": name, "params": params, **record, **extra}
+        self.results.append(entry)
+        peak = f"{record['peak_bytes'] / 2 ** 20:8.1f} MB" if "peak_bytes" in record else ""
+        print(f"{group:8} {name:28} {json.dumps(params):60} {record.get('seconds', 0):10.4f} s {peak}"
+              + (f"  {extra}" if extra else ""), flush=True)
+
+    # ===============================
+    # 地图与最短路径
+    # ===============================
+    def run_graph(self):
+        sizes = QUICK_SIZES if self.quick else SIZES
+        densities = QUICK_BLOCK_DENSITIES if self.quick else BLOCK_DENSITIES
+        for width, height in sizes:
+            nodes = width * height
+            params = {"size": f"{width}x{height}"}
+            gmap, rec = measure(lambda: GraphMap(width, height, backend="csr"), memory=self.memory)
+            self.record("graph", "build", params, rec, nbytes=gmap.nbytes())
+
+            for density in densities:
+                params = {"size": f"{width}x{height}", "blocked": density}
+                seed = self.seed + nodes + int(density * 1000)
+                gmap = make_map(width, height, density, seed)
+
+                if nodes <= MAX_NETWORKX_NODES:
+                    # 每次在新快照上构建 networkx 图（快照会缓存结果）
+                    _, rec = measure(lambda: gmap.snapshot().with_ch(None).effective_graph(),
+                                     memory=self.memory)
+                    self.record("graph", "get_effective_graph", params, rec)
+
+                key_points = random_points(gmap, KEY_POINTS, seed)
+                _, rec = measure(lambda: compute_distance_matrix(gmap, key_points, use_cache=False, dense=True),
+                                 memory=self.memory)
+                self.record("matrix", "distance_matrix_cold", {**params, "keys": len(key_points)}, rec)
+                compute_distance_matrix(gmap, key_points, dense=True)
+                _, rec = measure(lambda: compute_distance_matrix(gmap, key_points, dense=True),
+                                 repeat=3, memory=self.memory)
+                self.record("matrix", "distance_matrix_cached", {**params, "keys": len(key_points)}, rec)
+
+                pairs = list(zip(random_points(gmap, PATH_QUERIES, seed + 1),
+                                 random_points(gmap, PATH_QUERIES, seed + 2)))
+                methods = ["astar", "bidirectional", "dijkstra"]
+                if nodes <= MAX_CH_NODES:
+                    _, rec = measure(lambda: CustomizableCH(gmap.csr), memory=False)
+                    self.record("path", "ch_preprocess", params, rec)
+                    gmap.build_hierarchy()
+                    methods.append("ch")
+                for method in methods:
+                    _, rec = measure(lambda: [gmap.shortest_path(a, b, method=method) for a, b in pairs],
+                                     memory=self.memory)
+                    rec["seconds"] = round(rec["seconds"] / len(pairs), 6)  # 每次查询
+                    self.record("path", f"shortest_path_{method}", params, rec)
+
+    # ===============================
+    # 求解器
+    # ===============================
+    def run_planner(self):
+        gmap = GraphMap(20, 10, backend="csr")
+        start = (0, 0)
+        scenarios = [("algo_test_49", algo_test_deliveries())]
+        counts = QUICK_DELIVERY_COUNTS if self.quick else DELIVERY_COUNTS
+        for count in counts:
+            for tightness, window in WINDOW_WIDTHS.items():
+                seed = self.seed + count * 10 + window
+                scenarios.append((f"random_{count}_{tightness}",
+                                  make_deliveries(gmap, start, count, window, seed)))
+
+        for name, deliveries in scenarios:
+            key_points = [start] + [d.location for d in deliveries]
+            matrix = compute_distance_matrix(gmap, key_points, dense=True)
+            for solver in SOLVERS:
+                params = {"scenario": name, "deliveries": len(deliveries), "solver": solver}
+                if len(deliveries) > MAX_EXACT.get(solver, len(deliveries)) and name != "algo_test_49":
+                    continue
+                monitors = []
+
+                def run():
+                    monitor = Deadline(self.time_limit)
+                    monitors.append(monitor)
+                    return plan_route(start, deliveries, matrix, solver=solver, monitor=monitor,
+                                      time_budget=min(1.0, self.time_limit), workers=2)
+                try:
+                    result, rec = measure(run, memory=self.memory and solver != "parallel")
+                except (ValueError, MemoryError) as e:  # 如 DP 状态数超限
+                    self.record("planner", solver, params, {}, error=str(e))
+                    continue
+                self.record("planner", solver, params, rec,
+                            total_time=result["total_time"] if result else None,
+                            stopped=monitors[0].stopped)
+
+    def run(self):
+        self.run_graph()
+        self.run_planner()
+        return {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "quick": self.quick,
+                "seed": self.seed,
+                "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            },
+            "results": self.results,
+        }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _key(entry: Dict) -> str:
+    return f"{entry['group']}/{entry['name']}/{json.dumps(entry['params'], sort_keys=True)}"
+
+
+def compare(report: Dict, baseline: Dict, threshold: float = 1.25, min_seconds: float = 0.001) -> List[str]:
+    """返回比基线慢 threshold 倍以上的项目（耗时低于 min_seconds 的忽略，避免计时噪声）"""
+    old = {_key(e): e for e in baseline["results"]}
+    regressions = []
+    for entry in report["results"]:
+        before = old.get(_key(entry))
+        if not before or "seconds" not in entry or "seconds" not in before:
+            continue
+        if entry["seconds"] >= min_seconds and entry["seconds"] > before["seconds"] * threshold:
+            regressions.append(f"{_key(entry)}: {before['seconds']:.4f} s → {entry['seconds']:.4f} s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OrionPath 性能基准")
+    parser.add_argument("--quick", action="store_true", help="只运行小规模场景")
+    parser.add_argument("--no-memory", action="store_true", help="不测量内存峰值（更快）")
+    parser.add_argument("--time-limit", type=float, default=10.0, help="每次求解的时间上限（秒）")
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--only", choices=["graph", "planner"], help="只运行其中一组")
+    parser.add_argument("--save", help="保存结果 JSON 的路径")
+    parser.add_argument("--compare", help="对比的基线 JSON 路径")
+    parser.add_argument("--threshold", type=float, default=1.25, help="判定为回退的变慢倍数")
+    args = parser.parse_args(argv)
+
+    bench = Benchmark(quick=args.quick, memory=not args.no_memory, time_limit=args.time_limit, seed=args.seed)
+    if args.only == "graph":
+        bench.run_planner = lambda: None
+    elif args.only == "planner":
+        bench.run_graph = lambda: None
+    report = bench.run()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"saved {len(report['results'])} results to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"❌ regression {line}")
+        if regressions:
+            return 1
+        print("✅ no regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
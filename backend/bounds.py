@@ -0,0 +1,201 @@
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from route_problem import RouteProblem
+
+
+class MinEdgeBound:
+    """
+    基于预计算最小入边 / 出边的下界：
+    每个未访问点至少还要被进入一次、离开一次（最后一个点除外）。
+    DFS 访问 / 回溯时调用 visit / unvisit 增量维护剩余和，estimate 为 O(1)。
+    """
+
+    def __init__(self, problem: RouteProblem):
+        n = problem.n
+        dist = problem.dist
+        inf = float("inf")
+        self.n = n
+        # 下标与 RouteProblem 一致：0 为起点，i + 1 为第 i 个送货点
+        self.min_in = [0.0] + [min((dist[i][j] for i in range(n + 1) if i != j), default=inf)
+                               for j in range(1, n + 1)]
+        self.min_out = [min((dist[i][j] for j in range(1, n + 1) if j != i), default=0.0)
+                        for i in range(n + 1)]
+        self.max_out = max(self.min_out[1:], default=0.0)
+        self.remaining = n
+        self.remaining_in = sum(self.min_in[1:])
+        self.remaining_out = sum(self.min_out[1:])
+        self.mask = 0
+
+    def visit(self, i: int):
+        """送货点 i（0 起）被加入路径。"""
+        self.mask |= 1 << i
+        self.remaining -= 1
+        self.remaining_in -= self.min_in[i + 1]
+        self.remaining_out -= self.min_out[i + 1]
+
+    def unvisit(self, i: int):
+        self.mask &= ~(1 << i)
+        self.remaining += 1
+        self.remaining_in += self.min_in[i + 1]
+        self.remaining_out += self.min_out[i + 1]
+
+    def estimate(self, current: int, time: float) -> float:
+        """当前在节点 current、时间为 time 时，总耗时的下界。"""
+        if self.remaining == 0:
+            return time
+        out_bound = self.min_out[current] + self.remaining_out - self.max_out
+        return time + max(self.remaining_in, out_bound)
+
+
+class MSTBound(MinEdgeBound):
+    """
+    在最小边下界之外，加上最小生成树下界：
+    剩余路线 = 当前点到第一个未访问点的一条边 + 经过所有未访问点的一条路径，
+    而路径本身是一棵生成树，耗时不小于未访问点的 MST（按双向较小耗时计算）。
+    MST 随 DFS 增量维护：访问一个点时从上一层的树中删除它——叶子直接去掉它的边
+    （剩下的树仍是最小的），否则删除后分成的几棵子树之间只补上最短的连接边；
+    回溯后退回仍然有效的那一层。MST 耗时另按未访问集合做 LRU 缓存，不同顺序到达同一集合时
+    不再计算（此时树也不展开，下次未命中时再从栈顶的树依次删除）。
+    """
+
+    def __init__(self, problem: RouteProblem, cache_size: int = 200_000):
+        super().__init__(problem)
+        n = problem.n
+        dist = problem.dist
+        self.sym = [[min(dist[i][j], dist[j][i]) for j in range(n + 1)] for i in range(n + 1)]
+        # 每个节点的出边按耗时排序，用于快速找到最近的未访问点
+        self.nearest = [sorted(range(n), key=lambda j: dist[i][j + 1]) for i in range(n + 1)]
+        self.dist = dist
+        self.cache_size = cache_size
+        self._mst_cache: "OrderedDict[int, float]" = OrderedDict()
+        # 每层为 (已访问集合, MST 的边 [(耗时, a, b)], 总耗时)，集合逐层增大
+        edges = self._prim(list(range(n)))
+        self._trees = [(0, edges, sum(w for w, _, _ in edges))]
+
+    def estimate(self, current: int, time: float) -> float:
+        if self.remaining == 0:
+            return time
+        bound = super().estimate(current, time)
+        mask = self.mask
+        first = next(j for j in self.nearest[current] if not mask >> j & 1)
+        mst = self._mst_cache.get(mask)
+        if mst is None:
+            mst = self.mst()
+        else:
+            self._mst_cache.move_to_end(mask)
+        return max(bound, time + self.dist[current][first + 1] + mst)
+
+    def mst(self) -> float:
+        """未访问点的 MST 耗时：先查缓存，未命中时从栈顶的树依次删除之后访问的点。"""
+        cache = self._mst_cache
+        total = cache.get(self.mask)
+        if total is not None:
+            cache.move_to_end(self.mask)
+            return total
+        # 回溯后（不要求与 visit 后进先出）丢掉含有已回溯的点的层，栈顶的集合即为当前 mask 的子集
+        trees = self._trees
+        while trees[-1][0] & ~self.mask:
+            trees.pop()
+        mask, edges, total = trees[-1]
+        missing = self.mask & ~mask
+        while missing:
+            low = missing & -missing
+            missing ^= low
+            mask |= low
+            edges, total = self._remove(edges, low.bit_length() - 1)
+            trees.append((mask, edges, total))
+        cache[mask] = total
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return total
+
+    def _remove(self, edges: List[Tuple[float, int, int]], v: int) -> Tuple[List[Tuple[float, int, int]], float]:
+        """从 MST 中删除点 v，返回剩余点的 MST (边, 总耗时)。"""
+        kept = [e for e in edges if e[1] != v and e[2] != v]
+        neighbours = [a if b == v else b for _, a, b in edges if a == v or b == v]
+        if len(neighbours) > 1:
+            kept += self._reconnect(kept, neighbours)
+        return kept, sum(w for w, _, _ in kept)
+
+    def _reconnect(self, kept: List[Tuple[float, int, int]], neighbours: List[int]) -> List[Tuple[float, int, int]]:
+        """
+        删除度数 d > 1 的点后树分成 d 棵子树（各含一个原邻居）。
+        在子树之间取最短的连接边，再对 d 个子树做 Kruskal，返回补上的 d - 1 条边。
+        """
+        adjacent: Dict[int, List[int]] = {}
+        for _, a, b in kept:
+            adjacent.setdefault(a, []).append(b)
+            adjacent.setdefault(b, []).append(a)
+        components = []
+        for root in neighbours:
+            component, stack, seen = [], [root], {root}
+            while stack:
+                node = stack.pop()
+                component.append(node)
+                for other in adjacent.get(node, ()):
+                    if other not in seen:
+                        seen.add(other)
+                        stack.append(other)
+            components.append(component)
+
+        sym = self.sym
+        inf = float("inf")
+        candidates = []
+        for p in range(len(components)):
+            for q in range(p + 1, len(components)):
+                best = (inf, -1, -1)
+                for a in components[p]:
+                    row = sym[a + 1]
+                    for b in components[q]:
+                        if row[b + 1] < best[0]:
+                            best = (row[b + 1], a, b)
+                if best[1] < 0:
+                    best = (inf, components[p][0], components[q][0])
+                candidates.append((best, p, q))
+        candidates.sort()
+        group = list(range(len(components)))
+
+        def find(x):
+            while group[x] != x:
+                group[x] = group[group[x]]
+                x = group[x]
+            return x
+
+        added = []
+        for edge, p, q in candidates:
+            p, q = find(p), find(q)
+            if p != q:
+                group[p] = q
+                added.append(edge)
+        return added
+
+    def _prim(self, nodes: List[int]) -> List[Tuple[float, int, int]]:
+        """Prim 算法，O(k²)，返回 MST 的边 (耗时, a, b)。"""
+        if not nodes:
+            return []
+        sym = self.sym
+        best = {j: (sym[nodes[0] + 1][j + 1], nodes[0]) for j in nodes[1:]}
+        edges = []
+        while best:
+            j = min(best, key=lambda k: best[k][0])
+            w, parent = best.pop(j)
+            edges.append((w, parent, j))
+            row = sym[j + 1]
+            for k in best:
+                if row[k + 1] < best[k][0]:
+                    best[k] = (row[k + 1], j)
+        return edges
+
+
+BOUNDS = {
+    "min_edge": MinEdgeBound,
+    "mst": MSTBound,
+}
+
+
+def make_bound(name: str, problem: RouteProblem) -> MinEdgeBound:
+    """按名称创建下界对象（"min_edge" / "mst"）。"""
+    if name not in BOUNDS:
+        raise ValueError(f"unknown bound: {name}")
+    return BOUNDS[name](problem)
@@ -0,0 +1,150 @@
+from typing import Callable, List, Optional, Sequence
+
+from bounds import make_bound
+from route_problem import RouteProblem
+
+
+class BranchAndBound:
+    """
+    在 RouteProblem 上做深度优先分支定界：按 (最早时间, 到起点距离) 的顺序扩展，
+    超出时间窗或下界不优于当前最优解的分支直接剪掉。
+
+    外部可通过三个钩子参与搜索（每 poll_interval 个节点检查一次）：
+    - external_best：返回其他搜索者找到的最优耗时（并行时共享上界）
+    - should_stop：返回 True 时中止搜索，保留已找到的最优解
+    - on_improve：找到更优解时回调 (总耗时, 下标顺序, 到达时间列表)
+    """
+
+    def __init__(self, problem: RouteProblem, bound: str = "mst",
+                 best_time: float = float("inf"), best_order: Optional[List[int]] = None,
+                 best_arrival_times: Optional[List[float]] = None,
+                 external_best: Optional[Callable[[], float]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 on_improve: Optional[Callable[[float, List[int], List[float]], None]] = None,
+                 poll_interval: int = 256):
+        self.problem = problem
+        self.lower_bound = make_bound(bound, problem)
+        self.best_time = best_time
+        self.best_order = best_order
+        self.best_arrival_times = best_arrival_times or []
+        self.external_best = external_best
+        self.should_stop = should_stop
+        self.on_improve = on_improve
+        self.poll_interval = poll_interval
+
+        dist, earliest = problem.dist, problem.earliest
+        self.search_order = sorted(range(problem.n), key=lambda i: (earliest[i + 1], dist[0][i + 1]))
+
+        # 统计信息
+        self.nodes = 0
+        self.window_prunes = 0
+        self.bound_prunes = 0
+        self.improvements = 0
+        self.stopped = False
+
+    def prefix_state(self, prefix: Sequence[int]):
+        """模拟按 prefix 顺序访问，返回 (当前节点, 时间, 到达时间列表)；不可行返回 None。"""
+        result = self.problem.evaluate(prefix)
+        if result is None:
+            return None
+        time, arrival_times = result
+        return (prefix[-1] + 1 if prefix else 0), time, arrival_times
+
+    def search(self, prefix: Sequence[int] = ()) -> bool:
+        """
+        搜索以 prefix 开头的所有顺序（prefix 为送货点下标）。
+        :return: 搜索是否完整结束（被 should_stop 中止时为 False）
+        """
+        state = self.prefix_state(prefix)
+        if state is None:
+            return True
+        current, current_time, prefix_arrivals = state
+
+        problem = self.problem
+        n = problem.n
+        dist, earliest, latest = problem.dist, problem.earliest, problem.latest
+        lower_bound = self.lower_bound
+        search_order = self.search_order
+        external_best, should_stop = self.external_best, self.should_stop
+        poll_interval = self.poll_interval
+
+        path = list(prefix)
+        arrival_times = list(prefix_arrivals)
+        visited_mask = 0
+        for i in prefix:
+            visited_mask |= 1 << i
+            lower_bound.visit(i)
+        limit = self.best_time
+
+        def dfs(current, current_time, visited_mask, depth):
+            nonlocal limit
+            self.nodes += 1
+            if self.nodes % poll_interval == 0:
+                if external_best is not None:
+                    limit = min(limit, external_best())
+                if should_stop is not None and should_stop():
+                    self.stopped = True
+            if self.stopped:
+                return
+
+            if depth == n:
+                if current_time < limit:
+                    self._improve(current_time, path, arrival_times)
+                    limit = current_time
+                return
+
+            row = dist[current]
+            for i in search_order:
+                if visited_mask >> i & 1:
+                    continue
+
+                # 不可达时距离为 inf，同样会超出最晚时间
+                arrive_time = current_time + row[i + 1]
+                if arrive_time > latest[i + 1]:
+                    self.window_prunes += 1
+                    continue
+
+                real_arrival = max(arrive_time, earliest[i + 1])
+
+                # ✂️ 剪枝：总耗时下界不优于当前最优路径
+                lower_bound.visit(i)
+                if lower_bound.estimate(i + 1, real_arrival) >= limit:
+                    lower_bound.unvisit(i)
+                    self.bound_prunes += 1
+                    continue
+
+                path.append(i)
+                arrival_times.append(real_arrival)
+
+                dfs(i + 1, real_arrival, visited_mask | 1 << i, depth + 1)
+
+                path.pop()
+                arrival_times.pop()
+                lower_bound.unvisit(i)
+                if self.stopped:
+                    return
+
+        try:
+            dfs(current, current_time, visited_mask, len(prefix))
+        finally:
+            for i in prefix:
+                lower_bound.unvisit(i)
+        return not self.stopped
+
+    def _improve(self, total_time, path, arrival_times):
+        self.best_time = total_time
+        self.best_order = path[:]
+        self.best_arrival_times = arrival_times[:]
+        self.improvements += 1
+        if self.on_improve is not None:
+            self.on_improve(total_time, self.best_order, self.best_arrival_times)
+
+    def stats(self) -> dict:
+        """搜索统计：扩展节点数、时间窗剪枝 / 下界剪枝次数、最优解更新次数"""
+        return {"nodes": self.nodes, "window_prunes": self.window_prunes,
+                "bound_prunes": self.bound_prunes, "improvements": self.improvements}
+
+    def result(self) -> Optional[dict]:
+        if self.best_order is None:
+            return None
+        return self.problem.to_result(self.best_order, self.best_arrival_times, self.best_time)
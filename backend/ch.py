@@ -0,0 +1,353 @@
+import copy
+import heapq
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from csr_graph import PAGE_MASK, PAGE_SHIFT, CSRGraph, PagedArray
+
+INF = float("inf")
+
+# 嵌套剖分时不再切分的最大区域节点数
+LEAF_SIZE = 16
+
+
+def nested_dissection_order(width: int, height: int) -> List[int]:
+    """
+    网格的嵌套剖分顺序：沿较长的一边从中间切一行 / 一列作为分隔线，
+    两侧子区域先排（递归），分隔线上的节点排在最后（重要性最高）。
+    8 连通网格中整行 / 整列就能把两侧完全隔开。
+    """
+    order = []
+    stack = [(0, width, 0, height, False)]
+    while stack:
+        x0, x1, y0, y1, emit = stack.pop()
+        w, h = x1 - x0, y1 - y0
+        if w <= 0 or h <= 0:
+            continue
+        if emit or w * h <= LEAF_SIZE:
+            order.extend(y * width + x for y in range(y0, y1) for x in range(x0, x1))
+            continue
+        # 栈后进先出：先压分隔线，再压两侧，使两侧先输出
+        if w >= h:
+            mid = x0 + w // 2
+            stack.append((mid, mid + 1, y0, y1, True))
+            stack.append((mid + 1, x1, y0, y1, False))
+            stack.append((x0, mid, y0, y1, False))
+        else:
+            mid = y0 + h // 2
+            stack.append((x0, x1, mid, mid + 1, True))
+            stack.append((x0, x1, mid + 1, y1, False))
+            stack.append((x0, x1, y0, mid, False))
+    return order
+
+
+class CustomizableCH:
+    """
+    可定制收缩层次（Customizable Contraction Hierarchy）。
+
+    预处理分两步：
+    - 构建（只依赖网格拓扑，与耗时 / 封路无关）：按嵌套剖分顺序收缩节点，
+      得到每个节点的上行弧（含捷径）和消去树 parent；
+    - 定制（customize，依赖当前耗时）：按秩从低到高枚举下三角形，
+      计算每条弧的上行 / 下行耗时及其中间节点。
+    单条边改耗时 / 封路后由 update_edge 只重算受影响的弧，不需要重新构建。
+
+    查询沿消去树向上分别扫描起点和终点的祖先，在公共祖先处相遇。
+
+    弧属于秩较低的端点 v = tail[e]：v 的弧编号为 [arc_begin[v], arc_end[v])，终点 head[e] 按秩升序。
+    up_weight[e] 为 v → head[e] 的耗时，down_weight[e] 为 head[e] → v 的耗时。
+    弧耗时和中间节点保存为分页的写时复制数组（csr_graph.PagedArray），with_graph 的副本共享所有页。
+    """
+
+    def __init__(self, graph: CSRGraph):
+        self.graph = graph
+        n = graph.num_nodes
+        self.order = nested_dissection_order(graph.width, graph.height)
+        self.rank = [0] * n
+        for r, v in enumerate(self.order):
+            self.rank[v] = r
+        rank = self.rank
+
+        # 符号收缩：v 的上行邻居并入其消去树父节点（秩最小的上行邻居）
+        sources, targets = graph.edge_sources().tolist(), graph.targets.tolist()
+        upward = [set() for _ in range(n)]
+        for u, v in zip(sources, targets):
+            if rank[u] < rank[v]:
+                upward[u].add(v)
+            else:
+                upward[v].add(u)
+        self.parent = [-1] * n
+        self.arc_begin = [0] * n
+        self.arc_end = [0] * n
+        self.arc_of = [None] * n  # arc_of[v][a]：弧 v → a 的编号
+        self.down: List[List[int]] = [[] for _ in range(n)]  # down[a]：以 a 为上行邻居的节点
+        head = []
+        tail = []
+        for v in self.order:
+            neighbors = sorted(upward[v], key=rank.__getitem__)
+            upward[v] = None
+            start = len(head)
+            head.extend(neighbors)
+            tail.extend([v] * len(neighbors))
+            self.arc_begin[v], self.arc_end[v] = start, len(head)
+            self.arc_of[v] = dict(zip(neighbors, range(start, len(head))))
+            for a in neighbors:
+                self.down[a].append(v)
+            if neighbors:
+                self.parent[v] = neighbors[0]
+                upward[neighbors[0]].update(neighbors[1:])
+        self.head = head
+        self.tail = tail
+        self.num_arcs = len(head)
+        self._head_rank = np.array(rank, dtype=np.int64)[np.array(head, dtype=np.int64)]
+
+        # 原图边 ↔ 弧
+        arc_ids = np.empty(graph.num_edges, dtype=np.int64)
+        is_up = np.empty(graph.num_edges, dtype=bool)
+        for e, (u, v) in enumerate(zip(sources, targets)):
+            if rank[u] < rank[v]:
+                arc_ids[e], is_up[e] = self.arc_of[u][v], True
+            else:
+                arc_ids[e], is_up[e] = self.arc_of[v][u], False
+        self._edge_arcs = (arc_ids, is_up)
+        self._orig_up = [-1] * self.num_arcs
+        self._orig_down = [-1] * self.num_arcs
+        for e, (arc, up) in enumerate(zip(arc_ids.tolist(), is_up.tolist())):
+            (self._orig_up if up else self._orig_down)[arc] = e
+
+        self.customize()
+
+    # ===============================
+    # 定制
+    # ===============================
+    def customize(self):
+        """
+        按图的当前耗时 / 封路状态重新计算所有弧的耗时。
+        *_mid 为取得该耗时的中间节点，-1 表示原图的边。
+        """
+        graph = self.graph
+        arc_ids, is_up = self._edge_arcs
+        costs = np.where(graph.blocked, INF, graph.weights)
+        up_weight = np.full(self.num_arcs, INF)
+        down_weight = np.full(self.num_arcs, INF)
+        up_weight[arc_ids[is_up]] = costs[is_up]
+        down_weight[arc_ids[~is_up]] = costs[~is_up]
+        # 定制时在 Python 列表上计算（逐元素访问更快），完成后转为分页数组
+        up_weight, down_weight = up_weight.tolist(), down_weight.tolist()
+        up_mid, down_mid = [-1] * self.num_arcs, [-1] * self.num_arcs
+
+        head, arc_of = self.head, self.arc_of
+        for v in self.order:
+            start, end = self.arc_begin[v], self.arc_end[v]
+            for ea in range(start, end):
+                a_to_v, v_to_a = down_weight[ea], up_weight[ea]
+                if a_to_v == INF and v_to_a == INF:
+                    continue
+                row = arc_of[head[ea]]
+                for eb in range(ea + 1, end):
+                    e = row[head[eb]]
+                    # 三角形 (v, a, b)，秩 v < a < b：a → v → b 与 b → v → a
+                    via = a_to_v + up_weight[eb]
+                    if via < up_weight[e]:
+                        up_weight[e], up_mid[e] = via, v
+                    via = down_weight[eb] + v_to_a
+                    if via < down_weight[e]:
+                        down_weight[e], down_mid[e] = via, v
+
+        # 列表供逐弧的增量定制和路径展开读取，NumPy 副本供查询时向量化松弛
+        self.up_weight, self.down_weight = PagedArray(up_weight), PagedArray(down_weight)
+        self.up_mid, self.down_mid = PagedArray(up_mid), PagedArray(down_mid)
+        self._up_np = PagedArray(np.array(up_weight, dtype=np.float64))
+        self._down_np = PagedArray(np.array(down_weight, dtype=np.float64))
+
+    def with_graph(self, graph: CSRGraph) -> "CustomizableCH":
+        """
+        写时复制：返回挂在新版本图上的副本，共享只依赖拓扑的结构；弧耗时和中间节点的分页数组
+        只复制页列表，之后对副本 update_edge 只复制被改的页，不影响正在使用旧版本查询的读者。
+        """
+        ch = copy.copy(self)
+        ch.graph = graph
+        ch.up_weight, ch.down_weight = self.up_weight.copy(), self.down_weight.copy()
+        ch.up_mid, ch.down_mid = self.up_mid.copy(), self.down_mid.copy()
+        ch._up_np, ch._down_np = self._up_np.copy(), self._down_np.copy()
+        return ch
+
+    def update_edge(self, eid: int):
+        """
+        原图边 eid 的耗时 / 封路状态改变后增量定制：
+        按低端点的秩从小到大重算受影响的弧，值不变的弧不再向上传播。
+        """
+        arc = int(self._edge_arcs[0][eid])
+        owner = {}  # 待重算的弧 → 低端点
+        heap = []
+
+        def mark(e, v):
+            if e not in owner:
+                owner[e] = v
+                heapq.heappush(heap, (self.rank[v], e))
+
+        mark(arc, self.tail[arc])
+        head, arc_of = self.head, self.arc_of
+        while heap:
+            _, e = heapq.heappop(heap)
+            v = owner.pop(e)
+            if not self._recompute(e, v):
+                continue
+            # 弧 (v, a) 参与三角形 (v, a, b)，影响 a 与 b 之间的弧
+            a = head[e]
+            for eb in range(self.arc_begin[v], self.arc_end[v]):
+                b = head[eb]
+                if b == a:
+                    continue
+                if self.rank[a] < self.rank[b]:
+                    mark(arc_of[a][b], a)
+                else:
+                    mark(arc_of[b][a], b)
+
+    def _recompute(self, e: int, v: int) -> bool:
+        """从原图边和所有下三角形重算弧 e = (v, a)，返回耗时是否改变。"""
+        weights, blocked = self.graph.edge_arrays()
+        up_best, down_best, up_via, down_via = INF, INF, -1, -1
+        orig = self._orig_up[e]
+        if orig >= 0 and not blocked[orig]:
+            up_best = float(weights[orig])
+        orig = self._orig_down[e]
+        if orig >= 0 and not blocked[orig]:
+            down_best = float(weights[orig])
+
+        a = self.head[e]
+        # 直接按页读取（内层循环的热点），写入时再经 PagedArray 复制页
+        up, down, arc_of = self.up_weight.pages, self.down_weight.pages, self.arc_of
+        for w in self.down[v]:
+            row = arc_of[w]
+            ea = row.get(a)
+            if ea is None:
+                continue
+            ev = row[v]
+            down_ev, up_ea = down[ev >> PAGE_SHIFT][ev & PAGE_MASK], up[ea >> PAGE_SHIFT][ea & PAGE_MASK]
+            down_ea, up_ev = down[ea >> PAGE_SHIFT][ea & PAGE_MASK], up[ev >> PAGE_SHIFT][ev & PAGE_MASK]
+            # 三角形 (w, v, a)：v → w → a 与 a → w → v
+            via = down_ev + up_ea
+            if via < up_best:
+                up_best, up_via = via, w
+            via = down_ea + up_ev
+            if via < down_best:
+                down_best, down_via = via, w
+
+        changed = up_best != self.up_weight[e] or down_best != self.down_weight[e]
+        if changed:
+            self.up_weight[e], self.down_weight[e] = up_best, down_best
+            self._up_np[e], self._down_np[e] = up_best, down_best
+        if up_via != self.up_mid[e] or down_via != self.down_mid[e]:
+            self.up_mid[e], self.down_mid[e] = up_via, down_via
+        return changed
+
+    # ===============================
+    # 查询
+    # ===============================
+    def _scan(self, node: int, weights):
+        """
+        沿消去树扫描 node 的所有祖先（按秩升序），每个祖先的上行弧一次向量化松弛。
+        weights 决定方向（上行 = 从 node 出发，下行 = 到达 node）。
+        :return: (祖先节点 id 数组, 祖先的秩, 距离, 前驱在数组中的位置)
+        """
+        chain = []
+        x = node
+        while x >= 0:
+            chain.append(x)
+            x = self.parent[x]
+        ranks = np.array([self.rank[x] for x in chain], dtype=np.int64)
+        dist = np.full(len(chain), INF)
+        dist[0] = 0.0
+        pred = np.full(len(chain), -1, dtype=np.int64)
+        head_rank = self._head_rank
+        for i, x in enumerate(chain):
+            d = dist[i]
+            start, end = self.arc_begin[x], self.arc_end[x]
+            if d == INF or start == end:
+                continue
+            slots = np.searchsorted(ranks, head_rank[start:end])
+            cand = d + weights[start:end]
+            better = cand < dist[slots]
+            if better.any():
+                dist[slots[better]] = cand[better]
+                pred[slots[better]] = i
+        return np.array(chain, dtype=np.int64), ranks, dist, pred
+
+    def forward(self, source: int):
+        """source 到其各祖先的耗时。"""
+        return self._scan(source, self._up_np.reader())
+
+    def backward(self, target: int):
+        """各祖先到 target 的耗时。"""
+        return self._scan(target, self._down_np.reader())
+
+    @staticmethod
+    def _meet(forward, backward) -> Tuple[float, int, int]:
+        """在公共祖先处相遇，返回 (耗时, 正向位置, 反向位置)。"""
+        _, i, j = np.intersect1d(forward[1], backward[1], assume_unique=True, return_indices=True)
+        if len(i) == 0:
+            return INF, -1, -1
+        totals = forward[2][i] + backward[2][j]
+        k = int(np.argmin(totals))
+        if totals[k] == INF:
+            return INF, -1, -1
+        return float(totals[k]), int(i[k]), int(j[k])
+
+    def distance(self, source: int, target: int) -> float:
+        return self._meet(self.forward(source), self.backward(target))[0]
+
+    def path(self, source: int, target: int) -> Tuple[float, List[int]]:
+        """返回 (耗时, 节点 id 路径)，捷径展开为原图的边；不可达为 (inf, [])。"""
+        forward, backward = self.forward(source), self.backward(target)
+        best, i, j = self._meet(forward, backward)
+        if i < 0:
+            return INF, []
+        hops = []
+        while i >= 0:
+            hops.append(int(forward[0][i]))
+            i = forward[3][i]
+        hops.reverse()
+        j = backward[3][j]
+        while j >= 0:
+            hops.append(int(backward[0][j]))
+            j = backward[3][j]
+        path = [source]
+        for p, q in zip(hops, hops[1:]):
+            path.extend(self._unpack(p, q))
+        return best, path
+
+    def _unpack(self, p: int, q: int) -> List[int]:
+        """把 p → q 的弧展开为原图路径（不含 p）。"""
+        result = []
+        stack = [(p, q)]
+        while stack:
+            a, b = stack.pop()
+            if self.rank[a] < self.rank[b]:
+                mid = self.up_mid[self.arc_of[a][b]]
+            else:
+                mid = self.down_mid[self.arc_of[b][a]]
+            if mid < 0:
+                result.append(b)
+            else:
+                stack.append((mid, b))
+                stack.append((a, mid))
+        return result
+
+    def distance_table(self, sources: Sequence[int], targets: Sequence[int]) -> np.ndarray:
+        """多对多耗时表：每个起点 / 终点各扫描一次祖先，再在公共祖先处两两相遇。"""
+        forward = [self.forward(s) for s in sources]
+        backward = [self.backward(t) for t in targets]
+        table = np.empty((len(sources), len(targets)), dtype=np.float64)
+        for i, f in enumerate(forward):
+            for j, b in enumerate(backward):
+                table[i, j] = self._meet(f, b)[0]
+        return table
+
+    def nbytes(self) -> int:
+        """
+        估算占用的内存字节数：按实测每条弧约 240 字节（arc_of 字典项、head / tail 列表、
+        弧耗时和中间节点的列表及 NumPy 副本），每个节点约 200 字节。
+        """
+        return 240 * self.num_arcs + 200 * self.graph.num_nodes
@@ -0,0 +1,266 @@
+import math
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from delivery import Delivery
+from heuristic_solver import _RouteSearch
+from planner import greedy_order, plan_route
+from route_problem import RouteProblem
+from search_monitor import SearchMonitor
+
+# 工作进程内的全局状态，由 _init_worker 设置（送货点和距离表每个进程只传一次）
+_worker_deliveries: Optional[List[Delivery]] = None
+_worker_matrix = None
+
+
+def _init_worker(deliveries: List[Delivery], distance_matrix):
+    global _worker_deliveries, _worker_matrix
+    _worker_deliveries = deliveries
+    _worker_matrix = distance_matrix
+
+
+def _solve_cluster_task(task):
+    return solve_cluster(_worker_deliveries, _worker_matrix, *task)
+
+
+def solve_cluster(deliveries: List[Delivery], distance_matrix, cluster: List[int],
+                  start: Tuple[int, int], start_time: float, solver: str, time_budget: float):
+    """
+    用已有的 plan_route 求解一个簇（cluster 为送货点下标），
+    返回 (送货点下标顺序或 None, 搜索统计)。
+    """
+    subset = [deliveries[i] for i in cluster]
+    stats = {}
+    try:
+        result = plan_route(start, subset, distance_matrix, start_time, solver=solver,
+                            time_budget=time_budget, stats=stats)
+    except RuntimeError:  # dp 状态数超限，交给拼接后的修复
+        result = None
+    if result is None:
+        return None, stats
+    index = {id(d): i for i, d in zip(cluster, subset)}
+    return [index[id(d)] for d in result["sequence"]], stats
+
+
+# ===============================
+# 划分
+# ===============================
+def _kmeans(features: np.ndarray, k: int, init: Sequence[int], iterations: int = 20) -> np.ndarray:
+    """Lloyd 迭代，init 为初始中心的下标（确定性，不依赖随机数）；返回每个点的簇编号。"""
+    centers = features[list(init)].copy()
+    labels = np.zeros(len(features), dtype=np.int64)
+    for step in range(iterations):
+        distances = ((features[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        new_labels = distances.argmin(axis=1)
+        if step > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for c in range(k):
+            members = features[labels == c]
+            if len(members):
+                centers[c] = members.mean(axis=0)
+    return labels
+
+
+def _evenly(order: np.ndarray, k: int) -> List[int]:
+    return [int(order[int(i)]) for i in np.linspace(0, len(order) - 1, k)]
+
+
+def split_vehicles(problem: RouteProblem, indices: List[int], vehicles: int) -> List[List[int]]:
+    """按位置把送货点划分给各车辆（初始中心按相对起点的方位角均匀选取）。"""
+    if vehicles <= 1:
+        return [list(indices)]
+    if len(indices) <= vehicles:
+        return [[i] for i in indices] + [[] for _ in range(vehicles - len(indices))]
+    points = np.array([problem.deliveries[i].location for i in indices], dtype=np.float64)
+    offsets = points - np.array(problem.start, dtype=np.float64)
+    angles = np.arctan2(offsets[:, 1], offsets[:, 0])
+    labels = _kmeans(points, vehicles, _evenly(np.argsort(angles, kind="stable"), vehicles))
+    return [[i for i, label in zip(indices, labels) if label == v] for v in range(vehicles)]
+
+
+def partition(problem: RouteProblem, indices: List[int], cluster_size: int,
+              time_weight: float = 1.0) -> List[List[int]]:
+    """
+    按位置和时间窗中点把送货点划分成不超过 cluster_size 个点的簇，按时间先后排序。
+    特征按标准差归一化，time_weight 调节时间相对位置的权重；
+    k-means 得到的簇过大时按时间顺序切开。
+    """
+    if len(indices) <= cluster_size:
+        return [list(indices)] if indices else []
+    earliest, latest = problem.earliest, problem.latest
+    mids = np.array([(earliest[i + 1] + latest[i + 1]) / 2 for i in indices], dtype=np.float64)
+    points = np.array([problem.deliveries[i].location for i in indices], dtype=np.float64)
+    features = np.column_stack([points, mids])
+    scale = features.std(axis=0)
+    scale[scale == 0] = 1.0
+    features /= scale
+    features[:, 2] *= time_weight
+
+    k = math.ceil(len(indices) / cluster_size)
+    labels = _kmeans(features, k, _evenly(np.argsort(mids, kind="stable"), k))
+    clusters = []
+    for c in range(k):
+        members = sorted((i for i, label in zip(indices, labels) if label == c),
+                         key=lambda i: (earliest[i + 1] + latest[i + 1], i))
+        for first in range(0, len(members), cluster_size):
+            clusters.append(members[first:first + cluster_size])
+    clusters.sort(key=lambda cluster: sum(earliest[i + 1] + latest[i + 1] for i in cluster) / len(cluster))
+    return clusters
+
+
+# ===============================
+# 拼接与修复
+# ===============================
+def repair(problem: RouteProblem, order: List[int], deadline: float,
+           rng: random.Random) -> Tuple[List[int], List[int]]:
+    """
+    对拼接后的路线做局部搜索（修复簇之间衔接处的迟到并缩短总耗时），
+    仍然迟到的送货点依次移出，返回 (可行路线, 移出的送货点)。
+    """
+    search = _RouteSearch(problem, deadline, rng)
+    order, _ = search.local_search(order, search.cost(order))
+    return search.drop_late(order)
+
+
+def solve_clustered(
+    start: Tuple[int, int],
+    deliveries: List[Delivery],
+    distance_matrix: Dict[Tuple, float],
+    start_time: int = 0,
+    vehicles: int = 1,
+    cluster_size: int = 10,
+    cluster_solver: str = "dp",
+    time_weight: float = 1.0,
+    time_budget: float = 1.0,
+    cluster_time_budget: float = 0.2,
+    workers: Optional[int] = None,
+    seed: int = 0,
+    incumbent: Optional[Dict] = None,
+    monitor: Optional[SearchMonitor] = None,
+    stats: Optional[Dict] = None
+) -> Optional[Dict]:
+    """
+    先分簇后排路线（cluster-first route-second），适合一天几百个送货点：
+    1. 按位置把送货点分给 vehicles 辆车，每辆车的送货点再按位置 + 时间窗分成小簇，簇按时间先后排列；
+    2. 所有簇作为互相独立的小问题，在进程池中用已有的 plan_route（cluster_solver）并行求解。
+       第一个簇从起点出发，之后的簇从上一簇中时间窗最晚的送货点、按其最早时间出发（估计值）；
+    3. 每辆车按簇的顺序拼接路线，在 time_budget 秒内局部搜索修复衔接处，
+       仍然迟到的送货点尝试插入任意车辆路线中耗时增加最少的可行位置。
+
+    :param vehicles: 车辆数；为 1 时结果格式与 find_best_valid_path 相同，
+                     否则为 {"routes": [每辆车的结果], "unassigned": [无法安排的送货点], "total_time": 最晚结束时间}
+    :param cluster_size: 每个簇的送货点数上限
+    :param cluster_solver: 求解每个簇使用的求解器（见 planner.SOLVERS）
+    :param time_weight: 分簇时时间窗相对位置的权重
+    :param workers: 进程数，默认为 CPU 核数；为 1 或只有一个簇时在当前进程求解
+    :param incumbent: 已知可行解（如增量修复的上次路线），单车时与贪心解一起作为保底结果
+    :param monitor: 每个簇求解完报告进度，可在簇之间提前停止（返回 None）
+    :param stats: 传入字典时累加各簇的搜索统计，并记录簇数和各阶段耗时
+    :return: 单车时无法安排所有送货点则返回 None（若贪心解可行则返回贪心解）
+    """
+    counters = {"nodes": 0, "window_prunes": 0, "bound_prunes": 0, "improvements": 0}
+    stats = {} if stats is None else stats
+    stats.update(counters)
+    stages = stats.setdefault("stages", {})
+    deadline = time.perf_counter() + time_budget
+    problem = RouteProblem(start, deliveries, distance_matrix, start_time)
+    earliest, latest = problem.earliest, problem.latest
+
+    if vehicles == 1:
+        started = time.perf_counter()
+        greedy_result = greedy_order(problem)
+        stages["greedy"] = time.perf_counter() - started
+        if greedy_result and (incumbent is None or greedy_result[0] < incumbent["total_time"]):
+            incumbent = problem.to_result(greedy_result[1], greedy_result[2], greedy_result[0])
+        if incumbent is not None and monitor is not None:
+            monitor.on_improve(incumbent)
+    else:
+        incumbent = None
+
+    # ✅ 划分：车辆 → 簇
+    started = time.perf_counter()
+    groups = split_vehicles(problem, list(range(problem.n)), vehicles)
+    chains = [partition(problem, group, cluster_size, time_weight) for group in groups]
+    tasks = []
+    for v, clusters in enumerate(chains):
+        for c, cluster in enumerate(clusters):
+            if c == 0:
+                entry, entry_time = start, start_time
+            else:
+                last = max(chains[v][c - 1], key=lambda i: (earliest[i + 1], latest[i + 1]))
+                entry, entry_time = deliveries[last].location, max(start_time, earliest[last + 1])
+            tasks.append(((v, c), (cluster, entry, entry_time, cluster_solver, cluster_time_budget)))
+    stats["clusters"] = len(tasks)
+    stages["partition"] = time.perf_counter() - started
+
+    # ✅ 并行求解每个簇
+    started = time.perf_counter()
+    orders: Dict[Tuple[int, int], Optional[List[int]]] = {}
+
+    def collect(key, found, searched):
+        orders[key] = found
+        for name in counters:
+            stats[name] += searched.get(name, 0)
+        if monitor is not None:
+            monitor.on_progress(stats["nodes"], incumbent["total_time"] if incumbent else float("inf"))
+
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        for key, task in tasks:
+            if monitor is not None and monitor.should_stop():
+                return incumbent
+            collect(key, *solve_cluster(deliveries, distance_matrix, *task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(deliveries, distance_matrix)) as pool:
+            pending = {pool.submit(_solve_cluster_task, task): key for key, task in tasks}
+            while pending:
+                done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(pending.pop(future), *future.result())
+                if pending and monitor is not None and monitor.should_stop():
+                    for future in pending:
+                        future.cancel()
+                    return incumbent
+    stages["clusters"] = time.perf_counter() - started
+
+    # ✅ 拼接 + 修复；簇无可行解时先按最晚时间排列，交给修复
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    routes, dropped = [], []
+    for v, clusters in enumerate(chains):
+        route = []
+        for c, cluster in enumerate(clusters):
+            found = orders[(v, c)]
+            route += found if found is not None else sorted(cluster, key=lambda i: (latest[i + 1], earliest[i + 1]))
+        route, late = repair(problem, route, deadline, rng)
+        routes.append(route)
+        dropped += late
+    # 仍然迟到的送货点插入任意车辆路线中耗时增加最少的可行位置
+    unassigned = _RouteSearch(problem, deadline, rng).insert(routes, dropped)
+    stages["repair"] = time.perf_counter() - started
+
+    results = []
+    for route in routes:
+        total_time, arrival_times = problem.evaluate(route)
+        results.append(problem.to_result(route, arrival_times, total_time))
+    if vehicles == 1:
+        result = results[0] if not unassigned else None
+        if result is None or (incumbent is not None and incumbent["total_time"] < result["total_time"]):
+            return incumbent
+        stats["improvements"] += 1
+    else:
+        result = {
+            "routes": results,
+            "unassigned": [deliveries[i] for i in unassigned],
+            "total_time": max(r["total_time"] for r in results),
+        }
+    if monitor is not None:
+        monitor.on_improve(result)
+    return result
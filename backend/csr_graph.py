@@ -0,0 +1,513 @@
+import copy
+import heapq
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 8 个方向，顺序与 GraphMap._build_graph 保持一致
+DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1),
+              (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+# 写时复制的分页大小（元素个数）：修改一个元素只复制它所在的一页
+PAGE_SHIFT = 12
+PAGE_SIZE = 1 << PAGE_SHIFT
+PAGE_MASK = PAGE_SIZE - 1
+
+
+class PagedArray:
+    """
+    写时复制的一维分页数组：copy() 只复制页列表，所有页与原数组共享；
+    写入时只复制被写的那一页，因此每个版本的修改是 O(PAGE_SIZE) 而不是 O(数组长度)。
+
+    data 为 NumPy 数组时，按下标 / 切片读取直接访问页，向量化计算需要整个数组时，
+    array() 把各页合并为只读的连续数组并缓存，各页随之改为它的视图（之后的副本继续共享）。
+    data 也可以是 Python 列表（逐元素访问更快），此时各页为列表，可以直接用 pages 按
+    pages[i >> PAGE_SHIFT][i & PAGE_MASK] 读取，不支持 array()。
+    """
+
+    def __init__(self, data):
+        if isinstance(data, np.ndarray):
+            data.setflags(write=False)  # 连续数组被多个版本共享，只能通过 __setitem__ 修改
+            self._array = data
+        else:
+            self._array = None
+        self.size = len(data)
+        self.itemsize = data.dtype.itemsize if isinstance(data, np.ndarray) else 8  # 列表每项为一个指针
+        self._empty = data[:0]
+        self.pages = [data[i:i + PAGE_SIZE] for i in range(0, len(data), PAGE_SIZE)]
+        self._owned = set()  # 本对象复制过、可以原地写入的页
+        self._lock = threading.Lock()
+
+    def copy(self) -> "PagedArray":
+        other = PagedArray.__new__(PagedArray)
+        other.size, other.itemsize, other._empty = self.size, self.itemsize, self._empty
+        other._array, other.pages = self._array, list(self.pages)
+        other._owned = set()
+        other._lock = threading.Lock()
+        self._owned = set()  # 页已共享，原对象之后写入同样要先复制
+        return other
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        return self.size * self.itemsize
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            i = int(index)
+            if i < 0:
+                i += self.size
+            return self.pages[i >> PAGE_SHIFT][i & PAGE_MASK]
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+            if step == 1:
+                first, last = start >> PAGE_SHIFT, (stop - 1) >> PAGE_SHIFT
+                base = first << PAGE_SHIFT
+                if stop <= start:
+                    return self._empty
+                if first == last:
+                    return self.pages[first][start - base:stop - base]
+                parts = self.pages[first:last + 1]
+                if isinstance(parts[0], np.ndarray):
+                    return np.concatenate(parts)[start - base:stop - base]
+                return [x for part in parts for x in part][start - base:stop - base]
+        return self.array()[index]
+
+    def __setitem__(self, index, value):
+        i = int(index)
+        page = i >> PAGE_SHIFT
+        if page not in self._owned:
+            self.pages[page] = self.pages[page].copy()
+            self._owned.add(page)
+        self.pages[page][i & PAGE_MASK] = value
+        self._array = None
+
+    def array(self) -> np.ndarray:
+        """合并为连续的只读数组（没有修改过时直接返回原数组）；仅用于 NumPy 数据。"""
+        array = self._array
+        if array is None:
+            with self._lock:
+                if self._array is None:
+                    merged = np.concatenate(self.pages) if self.pages else self._empty
+                    merged.setflags(write=False)
+                    self.pages = [merged[i:i + PAGE_SIZE] for i in range(0, len(merged), PAGE_SIZE)]
+                    self._owned = set()
+                    self._array = merged
+                array = self._array
+        return array
+
+    def reader(self):
+        """按下标 / 切片读取的对象：已合并时为连续数组（更快），否则为自身（不触发合并）。"""
+        array = self._array
+        return array if array is not None else self
+
+
+class CSRGraph:
+    """
+    基于 NumPy CSR 数组的有向网格图。
+    节点为稠密整数 id（y * width + x），边按起点连续存放：
+    节点 u 的出边为 targets[offsets[u]:offsets[u + 1]]。
+    封路状态用 blocked 布尔掩码表示，路径计算时跳过。
+    """
+
+    def __init__(self, width: int, height: int,
+                 offsets: np.ndarray, targets: np.ndarray,
+                 weights: np.ndarray, blocked: Optional[np.ndarray] = None):
+        self.width = width
+        self.height = height
+        self.num_nodes = width * height
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.blocked = blocked if blocked is not None else np.zeros(len(targets), dtype=bool)
+        self._reverse = None
+
+    @property
+    def weights(self) -> np.ndarray:
+        """每条边的耗时（只读的连续数组，修改用 set_edge）"""
+        return self._weights.array()
+
+    @weights.setter
+    def weights(self, weights: np.ndarray):
+        self._weights = PagedArray(np.asanyarray(weights, dtype=np.float64))
+
+    @property
+    def blocked(self) -> np.ndarray:
+        """每条边是否封路（只读的连续数组，修改用 set_edge）"""
+        return self._blocked.array()
+
+    @blocked.setter
+    def blocked(self, blocked: np.ndarray):
+        self._blocked = PagedArray(np.asanyarray(blocked, dtype=bool))
+
+    @classmethod
+    def from_grid(cls, width: int, height: int,
+                  straight: float = 5, diagonal: float = 7) -> "CSRGraph":
+        """
+        向量化构建 8 连通网格图，默认耗时为 5（直线）或 7（对角线）。
+        """
+        ys, xs = np.divmod(np.arange(width * height, dtype=np.int64), width)
+        all_targets = np.empty((width * height, len(DIRECTIONS)), dtype=np.int32)
+        all_weights = np.empty((width * height, len(DIRECTIONS)), dtype=np.float64)
+        valid = np.empty((width * height, len(DIRECTIONS)), dtype=bool)
+        for k, (dx, dy) in enumerate(DIRECTIONS):
+            nx_, ny_ = xs + dx, ys + dy
+            valid[:, k] = (nx_ >= 0) & (nx_ < width) & (ny_ >= 0) & (ny_ < height)
+            all_targets[:, k] = ny_ * width + nx_
+            all_weights[:, k] = diagonal if dx != 0 and dy != 0 else straight
+
+        offsets = np.zeros(width * height + 1, dtype=np.int64)
+        np.cumsum(valid.sum(axis=1), out=offsets[1:])
+        return cls(width, height, offsets,
+                   all_targets[valid], all_weights[valid])
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.targets)
+
+    def copy(self) -> "CSRGraph":
+        """
+        写时复制：weights / blocked 为分页数组，副本共享所有页，之后 set_edge 只复制被改的一页；
+        不变的 offsets / targets 和反向索引直接共享。数组来自只读的内存映射文件时同样适用。
+        """
+        graph = copy.copy(self)
+        graph._weights = self._weights.copy()
+        graph._blocked = self._blocked.copy()
+        return graph
+
+    def set_edge(self, eid: int, weight: Optional[float] = None, blocked: Optional[bool] = None):
+        """修改一条边的耗时 / 封路状态（只应在尚未发布的副本上调用）。"""
+        if weight is not None:
+            self._weights[eid] = weight
+        if blocked is not None:
+            self._blocked[eid] = blocked
+
+    def edge_arrays(self):
+        """
+        (耗时, 封路)，支持按下标和切片读取：已合并为连续数组时直接返回 NumPy 数组，
+        否则返回分页数组。读取单条边或一个节点的出边不会触发合并，逐条修改后的增量修复只用它读取。
+        """
+        return self._weights.reader(), self._blocked.reader()
+
+    def nbytes(self) -> int:
+        """返回图数组占用的字节数（用于内存统计）。"""
+        return (self.offsets.nbytes + self.targets.nbytes
+                + self._weights.nbytes + self._blocked.nbytes)
+
+    # ===============================
+    # 节点 / 边索引
+    # ===============================
+    def node_id(self, node: Tuple[int, int]) -> int:
+        x, y = node
+        return y * self.width + x
+
+    def node_xy(self, node_id: int) -> Tuple[int, int]:
+        y, x = divmod(int(node_id), self.width)
+        return x, y
+
+    def has_node(self, node: Tuple[int, int]) -> bool:
+        x, y = node
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def edge_index(self, from_node: Tuple[int, int], to_node: Tuple[int, int]) -> int:
+        """返回边 from→to 在 CSR 数组中的下标，不存在时返回 -1。"""
+        if not (self.has_node(from_node) and self.has_node(to_node)):
+            return -1
+        u, v = self.node_id(from_node), self.node_id(to_node)
+        start, end = self.offsets[u], self.offsets[u + 1]
+        hits = np.flatnonzero(self.targets[start:end] == v)
+        return int(start + hits[0]) if len(hits) else -1
+
+    def edge_sources(self) -> np.ndarray:
+        """返回每条边的起点 id 数组（与 targets 对齐）。"""
+        return np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(self.offsets))
+
+    def iter_edges(self) -> Iterable[Tuple[Tuple[int, int], Tuple[int, int], float, bool]]:
+        """按 CSR 顺序遍历所有边：(起点, 终点, 耗时, 是否封路)。"""
+        sources = self.edge_sources().tolist()
+        targets = self.targets.tolist()
+        weights = self.weights.tolist()
+        blocked = self.blocked.tolist()
+        for u, v, w, b in zip(sources, targets, weights, blocked):
+            yield self.node_xy(u), self.node_xy(v), w, b
+
+    def reverse_index(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        入边索引（按终点分组的 CSR），首次调用时构建并缓存。
+        节点 v 的入边为 edge_ids[rev_offsets[v]:rev_offsets[v + 1]]，对应起点为 sources 同一区间。
+        """
+        if self._reverse is None:
+            order = np.argsort(self.targets, kind="stable")
+            rev_offsets = np.zeros(self.num_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=self.num_nodes), out=rev_offsets[1:])
+            self._reverse = (rev_offsets, self.edge_sources()[order], order.astype(np.int64))
+        return self._reverse
+
+    def successors(self, node: Tuple[int, int]) -> List[Tuple[int, int]]:
+        u = self.node_id(node)
+        return [self.node_xy(v) for v in self.targets[self.offsets[u]:self.offsets[u + 1]].tolist()]
+
+    # ===============================
+    # 最短路径
+    # ===============================
+    def dijkstra(self, source: int, targets: Optional[Iterable[int]] = None) -> np.ndarray:
+        """
+        从 source 出发的单源 Dijkstra，忽略封路边。
+        若给定 targets，则所有目标都确定后提前结束（其余节点的距离可能不是最终值）。
+
+        :return: 长度为 num_nodes 的距离数组，不可达为 inf
+        """
+        tree = ShortestPathTree(self, source)
+        tree.settle(targets)
+        return np.array(tree.dist)
+
+    def to_networkx(self, include_blocked: bool = True):
+        """转换为 networkx.DiGraph（仅用于小图的可视化 / 调试）。"""
+        import networkx as nx
+        g = nx.DiGraph()
+        g.add_nodes_from(self.node_xy(i) for i in range(self.num_nodes))
+        for u, v, w, b in self.iter_edges():
+            if include_blocked or not b:
+                g.add_edge(u, v, weight=w)
+        return g
+
+
+class ShortestPathTree:
+    """
+    可续算的单源 Dijkstra 搜索状态（距离 + 前驱 + 堆）。
+    settle() 只搜索到给定目标全部确定为止，之后新增目标时从上次的堆继续，
+    不需要从头重新搜索。
+    """
+
+    def __init__(self, graph: CSRGraph, source: int):
+        self.graph = graph
+        self.source = source
+        n = graph.num_nodes
+        self.dist = [float("inf")] * n
+        self.pred = [-1] * n  # 最短路径树中的前驱节点 id
+        self.settled = bytearray(n)
+        self.dist[source] = 0.0
+        self.heap = [(0.0, source)]
+        self.reached = 1  # 已获得有限距离的节点数（用于内存估算）
+        self.radius = 0.0  # 已确定节点中的最大距离
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_arrays(cls, graph: CSRGraph, source: int, dist: np.ndarray, pred: np.ndarray,
+                    limit: Optional[float] = None) -> "ShortestPathTree":
+        """
+        由 scipy.sparse.csgraph.dijkstra 的单源结果构建搜索树。距离和前驱直接保存为 NumPy 数组
+        （每个节点 12 字节；Python 列表中每个已到达的节点还要约 50 字节的对象），pred 中的负数表示没有前驱。
+
+        limit 为搜索时的距离上限（None 表示搜索了整张图）：距离不超过它的节点都已确定，
+        再从它们的出边把边界外的节点放入堆中，之后 settle() 从边界继续搜索。
+        """
+        tree = cls.__new__(cls)
+        tree.graph = graph
+        tree.source = source
+        dist = np.array(dist, dtype=np.float64)
+        pred = np.where(pred < 0, -1, pred).astype(np.int32)
+        finite = np.isfinite(dist)
+        tree.settled = bytearray(finite.astype(np.uint8).tobytes())
+        tree.reached = int(finite.sum())
+        tree.radius = float(dist[finite].max()) if tree.reached else 0.0
+        tree.heap = []
+        if limit is not None:
+            # 边界：从已确定节点出发、指向未确定节点的可通行边，每个终点取最小的候选距离
+            sources, targets = graph.edge_sources(), graph.targets
+            edges = np.flatnonzero(finite[sources] & ~finite[targets]
+                                   & ~graph.blocked & np.isfinite(graph.weights))
+            candidates = dist[sources[edges]] + graph.weights[edges]
+            order = np.lexsort((candidates, targets[edges]))
+            ends = targets[edges][order]
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = ends[1:] != ends[:-1]
+            pick = order[first]
+            nodes = targets[edges][pick]
+            dist[nodes] = candidates[pick]
+            pred[nodes] = sources[edges][pick]
+            tree.heap = list(zip(candidates[pick].tolist(), nodes.tolist()))
+            heapq.heapify(tree.heap)
+            tree.reached += len(nodes)
+        tree.dist = dist
+        tree.pred = pred
+        tree.lock = threading.Lock()
+        return tree
+
+    def __getstate__(self):
+        # 跨进程传递时不带图数组和锁，由接收方重新挂上 graph
+        state = self.__dict__.copy()
+        state["graph"] = None
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def settle(self, targets: Optional[Iterable[int]] = None):
+        """继续搜索直到 targets 全部确定；targets 为 None 时搜索整张图。"""
+        with self.lock:
+            remaining = None
+            if targets is not None:
+                remaining = {t for t in targets if not self.settled[t]}
+                if not remaining:
+                    return
+            self._run(remaining=remaining)
+
+    def _run(self, remaining: Optional[set] = None, max_dist: Optional[float] = None):
+        """
+        Dijkstra 主循环：remaining 清空或堆顶距离超过 max_dist 时停止。
+        距离被改善的已确定节点会重新入堆（只在增量修复后出现）。
+        """
+        graph = self.graph
+        offsets, tgt_arr = graph.offsets, graph.targets
+        w_arr, blocked = graph.edge_arrays()
+        dist, pred, settled, heap = self.dist, self.pred, self.settled, self.heap
+        while heap:
+            if max_dist is not None and heap[0][0] > max_dist:
+                return
+            d, u = heapq.heappop(heap)
+            if settled[u] or d != dist[u]:
+                continue  # 已确定或是修复后过期的堆条目
+            settled[u] = 1
+            if d > self.radius:
+                self.radius = d
+            start, end = offsets[u], offsets[u + 1]
+            for v, w, b in zip(tgt_arr[start:end].tolist(), w_arr[start:end].tolist(),
+                               blocked[start:end].tolist()):
+                if b:
+                    continue
+                nd = d + w
+                if nd < dist[v]:
+                    if dist[v] == float("inf"):
+                        self.reached += 1
+                    dist[v] = nd
+                    pred[v] = u
+                    settled[v] = 0
+                    heapq.heappush(heap, (nd, v))
+            if remaining is not None:
+                remaining.discard(u)
+                if not remaining:
+                    return
+
+    def lookup(self, targets: List[int], graph: CSRGraph, paths: bool = False):
+        """
+        在 graph 上搜索到 targets 全部确定并返回它们的距离；
+        树已被修复到其他版本的图（graph 不同）时返回 None。整个过程持有锁，读到的距离不会被并发修复打断。
+        paths=True 时返回 (距离列表, 通往 targets 的路径树)，路径树见 path_tree()。
+        """
+        with self.lock:
+            if self.graph is not graph:
+                return None
+            remaining = {t for t in targets if not self.settled[t]}
+            if remaining:
+                self._run(remaining=remaining)
+            dist = self.dist
+            row = [dist[t] for t in targets]
+            return (row, self.path_tree(targets)) if paths else row
+
+    def path_tree(self, targets: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        最短路径树中通往 targets 的部分（targets 需已确定）：(节点 id 升序, 对应的前驱)。
+        只保留这些路径上的节点，比完整的前驱数组小得多，之后树被修复也不受影响。
+        """
+        pred, source = self.pred, self.source
+        kept = {}
+        for t in targets:
+            x = t
+            while x != source and x not in kept and pred[x] >= 0:
+                kept[x] = pred[x]
+                x = pred[x]
+        nodes = np.array(sorted(kept), dtype=np.int64)
+        return nodes, np.array([kept[x] for x in nodes.tolist()], dtype=np.int64)
+
+    def repair_edge(self, u: int, v: int, old_cost: float, new_cost: float,
+                    graph: Optional[CSRGraph] = None):
+        """
+        边 u→v 的耗时从 old_cost 变为 new_cost（封路为 inf）后增量修复搜索树。
+        图数组需已更新；graph 为写时复制产生的新版本图时，树改为挂在新图上。
+        只重置 / 更新受影响的节点，并把 radius 以内重新搜索到确定，
+        保证“距离不超过 radius 的节点都已确定”；更远的部分留给之后的 settle()。
+        """
+        with self.lock:
+            if graph is not None:
+                self.graph = graph
+            if new_cost > old_cost:
+                # 变慢 / 封路：只有经过该边的子树受影响
+                if self.pred[v] != u:
+                    return
+                self._reset_subtree(v)
+            elif new_cost < old_cost:
+                # 变快 / 解封：u 未确定时，之后扩展 u 自然会用到新耗时
+                if not self.settled[u] or self.dist[u] + new_cost >= self.dist[v]:
+                    return
+                self.dist[v] = self.dist[u] + new_cost
+                self.pred[v] = u
+                self.settled[v] = 0
+                heapq.heappush(self.heap, (self.dist[v], v))
+            else:
+                return
+            self._run(max_dist=self.radius)
+
+    def _reset_subtree(self, root: int):
+        """重置以 root 为根的子树，再从未受影响的已确定入邻居重新播种。"""
+        graph = self.graph
+        offsets, targets = graph.offsets, graph.targets
+        dist, pred, settled = self.dist, self.pred, self.settled
+
+        affected = []
+        stack = [root]
+        while stack:
+            x = stack.pop()
+            affected.append(x)
+            for y in targets[offsets[x]:offsets[x + 1]].tolist():
+                if pred[y] == x:
+                    stack.append(y)
+        for x in affected:
+            dist[x] = float("inf")
+            pred[x] = -1
+            settled[x] = 0
+
+        rev_offsets, rev_sources, rev_edges = graph.reverse_index()
+        weights, blocked = graph.edge_arrays()
+        for x in affected:
+            start, end = rev_offsets[x], rev_offsets[x + 1]
+            best, best_pred = float("inf"), -1
+            for p, e in zip(rev_sources[start:end].tolist(), rev_edges[start:end].tolist()):
+                if settled[p] and not blocked[e]:
+                    nd = dist[p] + float(weights[e])
+                    if nd < best:
+                        best, best_pred = nd, p
+            if best_pred >= 0:
+                dist[x] = best
+                pred[x] = best_pred
+                heapq.heappush(self.heap, (best, x))
+
+    def distance(self, target: int) -> float:
+        """返回到 target 的最短距离（需先 settle），不可达为 inf。"""
+        return self.dist[target]
+
+    def path(self, target: int) -> List[int]:
+        """沿前驱回溯出 source → target 的节点 id 路径，不可达返回空列表。"""
+        if self.dist[target] == float("inf"):
+            return []
+        path = [target]
+        while path[-1] != self.source:
+            path.append(self.pred[path[-1]])
+        path.reverse()
+        return path
+
+    def nbytes(self) -> int:
+        """
+        搜索状态占用的内存字节数（缓存按它限制总内存）。
+        NumPy 数组按实际大小计算；Python 列表每项 8 字节，另外每个已到达的节点
+        有一个 float 对象（24 字节）和一个 int 对象（28 字节）；每个堆条目约 116 字节。
+        """
+        size = len(self.settled) + 116 * len(self.heap)
+        if isinstance(self.dist, np.ndarray):
+            return size + self.dist.nbytes + self.pred.nbytes
+        return size + 16 * len(self.dist) + 52 * self.reached
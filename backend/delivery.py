@@ -1,6 +1,53 @@
-from typing import Tuple
+from functools import lru_cache
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+
+@lru_cache(maxsize=4096)
+def parse_time(time_str: str) -> int:
+    """
+    "HH:MM" 24小时制时间字符串 → 当天的绝对分钟数（批量导入时大量重复，结果缓存）
+    """
+    h, m = map(int, time_str.split(":"))
+    return h * 60 + m
+
+
+def valid_time(time_str: str) -> bool:
+    """是否为合法的 "HH:MM" 24小时制时间（00:00 ~ 23:59），批量导入时在写入前逐条校验"""
+    try:
+        h, m = map(int, time_str.split(":"))
+    except ValueError:
+        return False
+    return 0 <= h < 24 and 0 <= m < 60
+
+
+def format_times(minutes: Sequence[float], base: int = 0) -> List[str]:
+    """
+    批量把分钟偏移量（相对 base 绝对分钟数）转换为 24 小时格式字符串，整条路线一次完成：
+    在 (n, 5) 的字节数组上逐列写入 "HH:MM" 的 ASCII 码，不逐个调用字符串格式化
+    """
+    total = base + np.trunc(np.asarray(minutes, dtype=np.float64)).astype(np.int64)
+    h, m = np.divmod(total, 60)
+    if total.size == 0 or total.min() < 0 or h.max() >= 100:
+        # 两位小时放不下（负数 / 超过 99 小时）时逐个格式化
+        return [f"{a:02d}:{b:02d}" for a, b in zip(h.tolist(), m.tolist())]
+    chars = np.empty((total.size, 5), dtype=np.uint8)
+    chars[:, 0], chars[:, 1] = np.divmod(h, 10)
+    chars[:, 3], chars[:, 4] = np.divmod(m, 10)
+    chars += ord("0")
+    chars[:, 2] = ord(":")
+    return chars.view("S5").ravel().astype("U5").tolist()
+
 
 class Delivery:
+    """
+    一个送货点。时间窗只保存一次绝对分钟数（start / end），base 为出发时间的绝对分钟数，
+    earliest / latest（相对出发时间的偏移）按需由两者相减得到。使用 __slots__，不带实例字典。
+    DeliveryManager 不保存 Delivery，只保存坐标和绝对时间窗，读取快照时才按快照的出发时间生成。
+    """
+    __slots__ = ("location", "start", "end", "base")
+
     def __init__(self, location: Tuple[int, int], time_window: Tuple[str, str], base_time: str = "08:00"):
         """
         :param location: 坐标
@@ -8,29 +55,40 @@ class Delivery:
         :param base_time: 出发时间，默认 08:00
         """
         self.location = location
-        self.base_hour, self.base_minute = map(int, base_time.split(":"))
-        self.earliest, self.latest = self._convert_window(time_window)
+        self.start = parse_time(time_window[0])
+        self.end = parse_time(time_window[1])
+        self.base = parse_time(base_time)
 
-    def _convert_window(self, time_window: Tuple[str, str]) -> Tuple[int, int]:
-        """
-        把时间窗字符串转为偏移分钟数
-        """
-        base_minutes = self.base_hour * 60 + self.base_minute
-        t1 = self._time_str_to_minutes(time_window[0]) - base_minutes
-        t2 = self._time_str_to_minutes(time_window[1]) - base_minutes
-        return t1, t2
+    @classmethod
+    def from_minutes(cls, location: Tuple[int, int], start: int, end: int, base: int) -> "Delivery":
+        """直接由绝对分钟数构建，不解析字符串"""
+        d = cls.__new__(cls)
+        d.location, d.start, d.end, d.base = location, start, end, base
+        return d
 
-    def _time_str_to_minutes(self, time_str: str) -> int:
-        h, m = map(int, time_str.split(":"))
-        return h * 60 + m
+    @property
+    def earliest(self) -> int:
+        """最早到达时间（相对出发时间的分钟数）"""
+        return self.start - self.base
+
+    @property
+    def latest(self) -> int:
+        """最晚到达时间（相对出发时间的分钟数）"""
+        return self.end - self.base
 
     def format_minutes(self, minutes: int) -> str:
         """
         把分钟偏移量转换为 24 小时格式字符串
         """
-        total = self.base_hour * 60 + self.base_minute + int(minutes)
+        total = self.base + int(minutes)
         h, m = divmod(total, 60)
         return f"{h:02d}:{m:02d}"
 
+    def __getstate__(self):
+        return self.location, self.start, self.end, self.base
+
+    def __setstate__(self, state):
+        self.location, self.start, self.end, self.base = state
+
     def __repr__(self):
-        return f"Delivery({self.location}, time=[{self.earliest}, {self.latest}])"
\ No newline at end of file
+        return f"Delivery({self.location}, time=[{self.earliest}, {self.latest}])"
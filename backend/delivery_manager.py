@@ -1,54 +1,213 @@
 # delivery_manager.py
 
-from typing import List, Tuple
-from delivery import Delivery
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from delivery import Delivery, format_times, parse_time
+
+# 快照中的一个送货点：(坐标, 最早绝对分钟数, 最晚绝对分钟数)，不含出发时间
+Entry = Tuple[Tuple[int, int], int, int]
+
+
+class DeliverySnapshot:
+    """
+    某个版本的送货点列表和出发时间（不可变）。
+    规划时先取快照，计算距离矩阵和求解都使用同一份数据，不受并发增删影响。
+    送货点只保存坐标和绝对时间窗（entries），出发时间 base（绝对分钟数）在快照上只保存一次，
+    相对偏移在读取时按 base 计算：修改出发时间只发布新的 base，送货点、index 和绝对时间窗数组原样复用。
+    Delivery 对象（deliveries）和时间窗的列数组（windows()）按需生成并缓存。
+    """
+
+    def __init__(self, version: int, base_time: str, entries: Tuple[Entry, ...],
+                 index: Optional[Dict[Tuple[int, int], int]] = None,
+                 absolute: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        """
+        :param index: 坐标 → 下标 的索引，entries 未变时沿用上个版本的
+        :param absolute: 绝对时间窗的列数组，entries 未变时沿用上个版本的
+        """
+        self.version = version
+        self.base_time = base_time
+        self.base = parse_time(base_time)
+        self.entries = entries
+        self.index: Dict[Tuple[int, int], int] = \
+            {e[0]: i for i, e in enumerate(entries)} if index is None else index
+        self._absolute = absolute
+        self._deliveries: Optional[Tuple[Delivery, ...]] = None
+        self._windows = None
+
+    @property
+    def deliveries(self) -> Tuple[Delivery, ...]:
+        """以快照出发时间为 base 的 Delivery，第一次读取时生成（并发读取时可能各生成一次，结果相同）"""
+        if self._deliveries is None:
+            base = self.base
+            self._deliveries = tuple(Delivery.from_minutes(location, start, end, base)
+                                     for location, start, end in self.entries)
+        return self._deliveries
+
+    def get(self, location: Tuple[int, int]) -> Optional[Delivery]:
+        i = self.index.get(location)
+        if i is None:
+            return None
+        if self._deliveries is not None:
+            return self._deliveries[i]
+        location, start, end = self.entries[i]
+        return Delivery.from_minutes(location, start, end, self.base)
+
+    def absolute(self) -> Tuple[np.ndarray, np.ndarray]:
+        """所有送货点的 (最早, 最晚) 绝对分钟数，与 entries 顺序一致，不随出发时间变化。"""
+        if self._absolute is None:
+            n = len(self.entries)
+            start = np.fromiter((e[1] for e in self.entries), dtype=np.int64, count=n)
+            end = np.fromiter((e[2] for e in self.entries), dtype=np.int64, count=n)
+            self._absolute = (start, end)
+        return self._absolute
+
+    def windows(self) -> Tuple[np.ndarray, np.ndarray]:
+        """所有送货点的 (最早, 最晚) 到达时间（相对 base_time 的分钟数），与 entries 顺序一致。"""
+        if self._windows is None:
+            start, end = self.absolute()
+            self._windows = (start - self.base, end - self.base)
+        return self._windows
+
+    def format_times(self, minutes) -> List[str]:
+        """把相对出发时间的分钟数批量转换为 "HH:MM" """
+        return format_times(minutes, self.base)
+
 
 class DeliveryManager:
     def __init__(self, base_time: str = "08:00"):
         """
-        管理送货任务的类，统一 base_time，并存储所有 Delivery 实例
+        管理送货任务的类，统一 base_time，并存储所有送货点。
+        写操作在锁内生成新的 DeliverySnapshot 并整体替换（写时复制），读操作不加锁。
         """
-        self.deliveries: List[Delivery] = []
-        self.base_time = base_time
+        self._lock = threading.Lock()
+        self._snapshot = DeliverySnapshot(0, base_time, ())
+
+    def _publish(self, entries=None, base_time=None):
+        # 调用方持有 self._lock
+        old = self._snapshot
+        if entries is None:
+            # 只改出发时间：送货点和索引原样复用
+            self._snapshot = DeliverySnapshot(old.version + 1, base_time, old.entries, old.index, old._absolute)
+        else:
+            self._snapshot = DeliverySnapshot(old.version + 1, old.base_time, tuple(entries))
+
+    def snapshot(self) -> DeliverySnapshot:
+        """当前版本的只读快照"""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    @property
+    def deliveries(self) -> List[Delivery]:
+        return list(self._snapshot.deliveries)
+
+    @property
+    def base_time(self) -> str:
+        return self._snapshot.base_time
 
     def set_base_time(self, base_time: str):
-        """设置统一的出发时间（如 08:00）"""
-        self.base_time = base_time
+        """
+        设置统一的出发时间（如 08:00），已有送货点的时间窗（绝对时间）不变，相对偏移随之更新。
+        只发布新的出发时间，不重建送货点，与送货点数量无关。
+        """
+        parse_time(base_time)  # 格式错误时在发布前抛出 ValueError
+        with self._lock:
+            self._publish(base_time=base_time)
 
     def get_base_time(self) -> str:
         """返回当前 base_time"""
-        return self.base_time
+        return self._snapshot.base_time
 
     def add_delivery(self, location: Tuple[int, int], time_window: Tuple[str, str]) -> Delivery:
         """
-        添加一个送货点任务（坐标 + 时间窗）
+        添加一个送货点任务（坐标 + 时间窗），同一坐标已有送货点时更新它的时间窗
+        """
+        entry = (location, parse_time(time_window[0]), parse_time(time_window[1]))
+        with self._lock:
+            self._publish(entries=_merged(self._snapshot.entries, [entry]))
+            return Delivery.from_minutes(*entry, self._snapshot.base)
+
+    def add_deliveries(self, items: Iterable[Tuple[Tuple[int, int], Tuple[str, str]]],
+                       replace: bool = False) -> int:
+        """
+        批量添加送货点（坐标, 时间窗），只发布一个新版本。
+        :param replace: 为 True 时替换掉现有的全部送货点
+        :return: 添加后的送货点数量
         """
-        d = Delivery(location, time_window, base_time=self.base_time)
-        self.deliveries.append(d)
-        return d
+        return self.upsert_deliveries(items, replace=replace)["total"]
+
+    def upsert_deliveries(self, items: Iterable[Tuple[Tuple[int, int], Tuple[str, str]]],
+                          replace: bool = False) -> Dict[str, int]:
+        """
+        同 add_deliveries，另外统计新增和更新（坐标已存在，时间窗被替换）的送货点数量。
+        items 内同一坐标重复出现时只计一次。
+        :return: {"added": 新增数量, "updated": 更新数量, "total": 添加后的送货点数量}
+        """
+        new = [(location, parse_time(time_window[0]), parse_time(time_window[1])) for location, time_window in items]
+        with self._lock:
+            existing = () if replace else self._snapshot.entries
+            entries = _merged(existing, new)
+            self._publish(entries=entries)
+            added = len(entries) - len(existing)
+            return {"added": added, "updated": len({e[0] for e in new}) - added, "total": len(entries)}
 
     def remove_delivery(self, location: Tuple[int, int]):
         """
         移除指定位置的送货点（按坐标）
         """
-        self.deliveries = [d for d in self.deliveries if d.location != location]
+        with self._lock:
+            i = self._snapshot.index.get(location)
+            if i is not None:
+                entries = self._snapshot.entries
+                self._publish(entries=entries[:i] + entries[i + 1:])
 
     def clear_all(self):
         """清空所有送货点"""
-        self.deliveries.clear()
+        with self._lock:
+            self._publish(entries=())
 
     def get_all(self) -> List[Delivery]:
-        """获取所有送货点任务"""
-        return self.deliveries
+        """获取所有送货点任务（当前版本的副本）"""
+        return list(self._snapshot.deliveries)
+
+    def get(self, location: Tuple[int, int]) -> Optional[Delivery]:
+        """按坐标取出送货点，不存在时返回 None"""
+        return self._snapshot.get(location)
 
     def exists(self, location: Tuple[int, int]) -> bool:
         """判断某个位置是否已被添加为送货点"""
-        return any(d.location == location for d in self.deliveries)
+        return location in self._snapshot.index
+
+    def windows(self) -> Tuple[np.ndarray, np.ndarray]:
+        """当前版本所有送货点的时间窗列数组 (earliest, latest)"""
+        return self._snapshot.windows()
 
     def to_dict_list(self) -> List[dict]:
         """返回 JSON 友好的格式（用于前端展示或调试）"""
+        snapshot = self._snapshot
+        earliest, latest = snapshot.windows()
         return [{
-            "location": d.location,
-            "earliest": d.earliest,
-            "latest": d.latest
-        } for d in self.deliveries]
\ No newline at end of file
+            "location": e[0],
+            "earliest": a,
+            "latest": b
+        } for e, a, b in zip(snapshot.entries, earliest.tolist(), latest.tolist())]
+
+
+def _merged(entries: Tuple[Entry, ...], new: List[Entry]) -> List[Entry]:
+    """把 new 合并进 entries：坐标已存在的原位替换，其余按顺序追加（new 内重复时后者为准）"""
+    result = list(entries)
+    index = {e[0]: i for i, e in enumerate(result)}
+    for e in new:
+        i = index.get(e[0])
+        if i is None:
+            index[e[0]] = len(result)
+            result.append(e)
+        else:
+            result[i] = e
+    return result
+
@@ -1,31 +1,200 @@
-import networkx as nx
-from typing import List, Tuple, Dict
+import os
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
+
+import telemetry
+from csr_graph import CSRGraph, ShortestPathTree
 from graph_map import GraphMap
+from key_matrix import KeyPointMatrix, LegPaths
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+except ImportError:  # scipy 为可选依赖
+    csr_matrix = None
+    csgraph_dijkstra = None
+
+# scipy 批量计算时每批的源点数上限；每批的 (源点数 × 节点数) 结果数组不超过 SCIPY_BATCH_BYTES
+SCIPY_BATCH_SIZE = 16
+SCIPY_BATCH_BYTES = 64 * 1024 * 1024
+# scipy 搜索的距离上限 = LIMIT_SLACK × 源点到最远关键点的 octile 估计，超出上限的关键点重新完整搜索
+LIMIT_SLACK = 1.5
+
+# 进程池工作进程中的图，由 _init_worker 设置
+_worker_graph: Optional[CSRGraph] = None
 
 
-def compute_distance_matrix(graph_map: GraphMap, key_points: List[Tuple[int, int]]) -> Dict[Tuple[Tuple[int, int], Tuple[int, int]], float]:
+def compute_distance_matrix(graph_map: GraphMap, key_points: List[Tuple[int, int]],
+                            use_cache: bool = True, dense: bool = False,
+                            workers: Optional[int] = None, paths: bool = False
+                            ) -> Union[KeyPointMatrix, Dict[Tuple[Tuple[int, int], Tuple[int, int]], float]]:
     """
     计算关键点之间的最短路径时间（基于 Dijkstra）
+    在 GraphMap 的 CSR 数组上搜索，所有关键点确定后即提前结束。
+    搜索树按 (地图版本, 源点) 缓存在 graph_map.sp_cache 中：地图未变时重复规划
+    不再搜索，新增送货点只需为新源点建树，旧源点的树从上次的堆继续搜索。
+    若地图已构建收缩层次（graph_map.ch），则改用它的多对多查询。
+
+    缓存中没有的源点批量建树：安装了 scipy 时用 scipy.sparse.csgraph 按距离上限批量搜索，
+    否则 workers > 1 时在进程池中并行搜索，再否则逐个搜索。建好的树逐个取出距离后放入缓存并按内存上限淘汰，
+    不会在淘汰前同时持有所有源点的树。
 
     :param graph_map: GraphMap 对象
     :param key_points: 所有关键点（起点 + 所有目的地）
-    :return: 以 (from, to) 为键的最短距离表 {(p1, p2): time}
+    :param use_cache: 是否使用 / 填充最短路径缓存
+    :param dense: 为 True 时返回 KeyPointMatrix（NumPy 稠密矩阵 + 关键点下标）
+    :param workers: 无 scipy 时并行建树的进程数
+    :param paths: 为 True 时从每个源点的搜索树中保留通往各关键点的前驱（需 dense=True），
+                  之后可用 KeyPointMatrix.path / legs 取出逐节点路径，不需要再次搜索
+    :return: KeyPointMatrix，或以 (from, to) 为键的最短距离表 {(p1, p2): time}
+    """
+    if paths and not dense:
+        raise ValueError("paths require dense=True")
+    with telemetry.span("matrix", points=len(key_points)):
+        # 整个计算只读同一个快照：并发的封路 / 改耗时不会让矩阵混用两个版本
+        snapshot = graph_map.snapshot()
+        csr, version = snapshot.csr, snapshot.version
+        for point in key_points:
+            if not csr.has_node(point):
+                raise ValueError(f"key point {point} is outside the map")
+        key_ids = [csr.node_id(p) for p in key_points]
+        if snapshot.ch is not None:
+            # 已构建收缩层次：直接多对多查询，不需要搜索树
+            array = np.round(snapshot.ch.distance_table(key_ids, key_ids), 2)
+            # 路径按需从该版本的收缩层次展开（写入时收缩层次写时复制，这一份不会再改变）
+            matrix = KeyPointMatrix(key_points, array, LegPaths(csr.width, ch=snapshot.ch) if paths else None)
+            return matrix if dense else matrix.to_dict()
+        source_ids = list(dict.fromkeys(key_ids))
+
+        rows = {}
+        path_trees = {}
+        if use_cache:
+            for source_id in source_ids:
+                tree = graph_map.sp_cache.get(version, source_id)
+                if tree is not None:
+                    # 读取期间树可能已被修复到更新的版本，此时改为重新建树
+                    found = tree.lookup(key_ids, csr, paths=paths)
+                    if found is not None:
+                        if paths:
+                            found, path_trees[source_id] = found
+                        rows[source_id] = found
+        missing = [s for s in source_ids if s not in rows]
+        # 每个源点一行，用 itemgetter 一次取出所有关键点的距离
+        getter = itemgetter(*key_ids)
+        for source_id, tree in build_trees(csr, missing, key_ids, workers):
+            tree.settle(key_ids)
+            rows[source_id] = getter(tree.dist)
+            if paths:
+                path_trees[source_id] = tree.path_tree(key_ids)
+            if use_cache:
+                graph_map.sp_cache.put(version, source_id, tree)
+                graph_map.sp_cache.trim()
+        array = np.round(np.array([rows[s] for s in key_ids], dtype=np.float64)
+                         .reshape(len(key_ids), len(key_ids)), 2)
+
+        matrix = KeyPointMatrix(key_points, array, LegPaths(csr.width, path_trees) if paths else None)
+        return matrix if dense else matrix.to_dict()
+
+
+def build_trees(graph: CSRGraph, sources: List[int], targets: List[int],
+                workers: Optional[int] = None) -> Iterator[Tuple[int, ShortestPathTree]]:
+    """为多个源点建立最短路径树（scipy 批量 > 进程池 > 逐个），建好一批产出一批 (源点, 树)。"""
+    if not sources:
+        return
+    if csgraph_dijkstra is not None:
+        yield from _scipy_trees(graph, sources, targets)
+    elif workers is not None and workers > 1 and len(sources) > 1:
+        yield from _pool_trees(graph, sources, targets, workers)
+    else:
+        for source in sources:
+            tree = ShortestPathTree(graph, source)
+            tree.settle(targets)
+            yield source, tree
+
+
+def _octile_limits(graph: CSRGraph, active: np.ndarray, sources: List[int],
+                   targets: List[int]) -> np.ndarray:
+    """
+    每个源点的搜索距离上限：按可通行直线 / 对角线边的平均耗时估计到最远关键点的 octile 距离，
+    乘以 LIMIT_SLACK。只是估计值，不保证覆盖所有关键点（由调用方检查后重新搜索）。
     """
-    distance_matrix = {}
-
-    graph = graph_map.get_effective_graph()
-    for source in key_points:
-        length_dict = nx.single_source_dijkstra_path_length(
-            graph, source=source, weight="weight"
-        )
-        for target in key_points:
-            if source == target:
-                continue
-            if target in length_dict:
-                distance_matrix[(source, target)] = round(length_dict[target], 2)
-            else:
-                # 不可达的情况，设为 None 或 float('inf')
-                distance_matrix[(source, target)] = float("inf")
-
-    return distance_matrix
\ No newline at end of file
+    edge_sources, edge_targets = graph.edge_sources()[active], graph.targets[active]
+    diagonal = (edge_sources % graph.width != edge_targets % graph.width) \
+        & (edge_sources // graph.width != edge_targets // graph.width)
+    weights = graph.weights[active]
+    straight = float(weights[~diagonal].mean()) if (~diagonal).any() else float("inf")
+    diag = float(weights[diagonal].mean()) if diagonal.any() else float("inf")
+    diag = min(diag, 2 * straight)
+
+    sy, sx = np.divmod(np.asarray(sources, dtype=np.int64), graph.width)
+    ty, tx = np.divmod(np.asarray(targets, dtype=np.int64), graph.width)
+    dx = np.abs(sx[:, None] - tx[None, :])
+    dy = np.abs(sy[:, None] - ty[None, :])
+    low, high = np.minimum(dx, dy), np.maximum(dx, dy)
+    # 两种边都没有时估计为 inf，即不设上限
+    with np.errstate(invalid="ignore"):
+        estimate = np.where(low > 0, diag * low, 0) + np.where(high > low, straight * (high - low), 0)
+    return LIMIT_SLACK * estimate.max(axis=1)
+
+
+def _scipy_trees(graph: CSRGraph, sources: List[int],
+                 targets: List[int]) -> Iterator[Tuple[int, ShortestPathTree]]:
+    """
+    用 scipy.sparse.csgraph.dijkstra 批量计算单源最短路径和前驱。
+    搜索带距离上限（见 _octile_limits），上限内的节点都已确定，所有关键点都在上限内时不再扩展更远的节点；
+    有关键点超出上限（或不可达）的源点再不设上限完整搜索一次。
+    """
+    active = ~graph.blocked & np.isfinite(graph.weights)
+    # 去掉封路边后重新计算每个节点的出边区间
+    rows = graph.edge_sources()
+    counts = np.bincount(rows[active], minlength=graph.num_nodes)
+    indptr = np.zeros(graph.num_nodes + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    matrix = csr_matrix((graph.weights[active], graph.targets[active], indptr),
+                        shape=(graph.num_nodes, graph.num_nodes))
+    limits = dict(zip(sources, _octile_limits(graph, active, sources, targets).tolist()))
+
+    # 每批的距离 (float64) 和前驱 (int32) 数组不超过 SCIPY_BATCH_BYTES
+    batch_size = max(1, min(SCIPY_BATCH_SIZE, SCIPY_BATCH_BYTES // (12 * graph.num_nodes)))
+    pending = list(sources)
+    for limited in (True, False):
+        retry = []
+        for first in range(0, len(pending), batch_size):
+            batch = pending[first:first + batch_size]
+            limit = max(limits[s] for s in batch) if limited else np.inf
+            dist, pred = csgraph_dijkstra(matrix, directed=True, indices=batch,
+                                          return_predecessors=True, limit=limit)
+            complete = np.isfinite(dist[:, targets]).all(axis=1)
+            for row, source in enumerate(batch):
+                if limit == np.inf:
+                    yield source, ShortestPathTree.from_arrays(graph, source, dist[row], pred[row])
+                elif complete[row]:
+                    yield source, ShortestPathTree.from_arrays(graph, source, dist[row], pred[row], limit)
+                else:
+                    retry.append(source)
+        pending = retry
+
+
+def _init_worker(graph: CSRGraph):
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _settle_tree(args):
+    source, targets = args
+    tree = ShortestPathTree(_worker_graph, source)
+    tree.settle(targets)
+    return tree
+
+
+def _pool_trees(graph: CSRGraph, sources: List[int], targets: List[int],
+                workers: int) -> Iterator[Tuple[int, ShortestPathTree]]:
+    """在进程池中并行搜索各源点，搜索树传回后重新挂到本进程的图上。"""
+    with ProcessPoolExecutor(max_workers=min(workers, len(sources), os.cpu_count() or 1),
+                             initializer=_init_worker, initargs=(graph,)) as pool:
+        for source, tree in zip(sources, pool.map(_settle_tree, [(s, targets) for s in sources])):
+            tree.graph = graph
+            yield source, tree
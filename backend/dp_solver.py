@@ -0,0 +1,131 @@
+from typing import Dict, List, Optional, Tuple
+
+from delivery import Delivery
+from route_problem import RouteProblem
+from search_monitor import SearchMonitor
+
+
+def solve_held_karp(
+    start: Tuple[int, int],
+    deliveries: List[Delivery],
+    distance_matrix: Dict[Tuple, float],
+    start_time: int = 0,
+    incumbent: Optional[Dict] = None,
+    max_states: int = 2_000_000,
+    monitor: Optional[SearchMonitor] = None,
+    stats: Optional[Dict] = None
+) -> Optional[Dict]:
+    """
+    Held-Karp 状态压缩 DP：状态为 (已访问集合, 最后一个点)，值为最早到达时间。
+    按已访问点数逐层扩展，同一状态只保留最早的到达时间（时间窗支配），
+    并剪掉无法再按时到达剩余点、或下界不优于当前最优解的状态。
+
+    :param incumbent: 已知可行解（如贪心结果），用作初始上界
+    :param max_states: 单层状态数上限，超出时抛出 RuntimeError
+    :param monitor: 每层结束时报告进度，被取消时返回 incumbent
+    :param stats: 传入字典时填写状态数、时间窗剪枝 / 下界剪枝次数
+    :return: 与 find_best_valid_path 相同格式的结果；无可行解时返回 incumbent
+    """
+    counters = {"nodes": 0, "window_prunes": 0, "bound_prunes": 0, "improvements": 0}
+    if stats is not None:
+        stats.update(counters)
+        counters = stats
+    problem = RouteProblem(start, deliveries, distance_matrix, start_time)
+    n = problem.n
+    if n == 0:
+        return problem.to_result([], [], start_time)
+
+    dist, earliest, latest = problem.dist, problem.earliest, problem.latest
+    closure = problem.closure()
+    best_time = incumbent["total_time"] if incumbent else float("inf")
+
+    def lower_bound(mask, last, t):
+        # 剩余的每个点都必须仍能按时到达，总耗时至少为到达最远剩余点的时间
+        bound = t
+        row = closure[last + 1]
+        for j in range(n):
+            if mask >> j & 1:
+                continue
+            reach = t + row[j + 1]
+            if reach > latest[j + 1]:
+                return float("inf")
+            bound = max(bound, reach, earliest[j + 1])
+        return bound
+
+    def prune(candidates):
+        # 下界为 inf 说明某个剩余点已无法按时到达（时间窗剪枝），否则为下界剪枝
+        kept = {}
+        for key, value in candidates.items():
+            bound = lower_bound(key[0], key[1], value[0])
+            if bound < best_time:
+                kept[key] = value
+            elif bound == float("inf"):
+                counters["window_prunes"] += 1
+            else:
+                counters["bound_prunes"] += 1
+        return kept
+
+    first = {}
+    for j in range(n):
+        arrive = start_time + dist[0][j + 1]
+        if arrive > latest[j + 1]:
+            counters["window_prunes"] += 1
+            continue
+        first[(1 << j, j)] = (max(arrive, earliest[j + 1]), -1)
+    layer = prune(first)
+    layers = [layer]
+    if not layer:
+        return incumbent
+    states = len(layer)
+    counters["nodes"] = states
+
+    for _ in range(1, n):
+        candidates = {}
+        window_prunes = bound_prunes = 0
+        for (mask, last), (t, _) in layer.items():
+            row = dist[last + 1]
+            for j in range(n):
+                if mask >> j & 1:
+                    continue
+                arrive = t + row[j + 1]
+                if arrive > latest[j + 1]:
+                    window_prunes += 1
+                    continue
+                arrival = max(arrive, earliest[j + 1])
+                if arrival >= best_time:
+                    bound_prunes += 1
+                    continue
+                key = (mask | 1 << j, j)
+                old = candidates.get(key)
+                if old is None or arrival < old[0]:
+                    candidates[key] = (arrival, last)
+
+        counters["window_prunes"] += window_prunes
+        counters["bound_prunes"] += bound_prunes
+        layer = prune(candidates)
+        if len(layer) > max_states:
+            raise RuntimeError(f"held-karp state limit exceeded ({len(layer)} > {max_states})")
+        layers.append(layer)
+        if not layer:
+            return incumbent
+        states += len(layer)
+        counters["nodes"] = states
+        if monitor is not None:
+            monitor.on_progress(states, best_time)
+            if monitor.should_stop():
+                return incumbent
+
+    (mask, last), (total_time, _) = min(layer.items(), key=lambda item: item[1][0])
+
+    # 沿父指针回溯访问顺序
+    order = []
+    for depth in range(n - 1, -1, -1):
+        order.append(last)
+        prev = layers[depth][(mask, last)][1]
+        mask ^= 1 << last
+        last = prev
+    order.reverse()
+
+    total_time, arrival_times = problem.evaluate(order)
+    counters["improvements"] = 1
+    return problem.to_result(order, arrival_times, total_time)
@@ -1,102 +1,424 @@
+import threading
+from collections import deque
+
 import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
-from typing import List, Tuple, Optional, Dict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import telemetry
+from ch import CustomizableCH
+from csr_graph import CSRGraph, ShortestPathTree
+from point_search import astar, bidirectional_astar, step_weights
+from sp_cache import ShortestPathCache
+
+class MapSnapshot:
+    """
+    地图在某个版本的不可变快照：CSR 数组、封路集合和可选的收缩层次。
+    写操作在副本上修改后整体替换 GraphMap 的当前快照，读者拿到的快照永远不会被修改，
+    因此读取不需要加锁，也不会看到改了一半的状态。
+    A* 启发参数按需在快照上构建并缓存；networkx 图和过滤封路边的视图只在 networkx 后端缓存，
+    csr 后端每次调用新建、由调用方持有，用完即释放，不在地图上常驻一份 networkx 图。
+    """
+
+    def __init__(self, version: int, csr: CSRGraph, blocked_edges: frozenset,
+                 removes_edges: bool, ch: Optional[CustomizableCH] = None):
+        self.version = version
+        self.csr = csr
+        self.blocked_edges = blocked_edges
+        self.removes_edges = removes_edges  # networkx 后端：set_block_edge 真正删除边（CSR 中耗时为 inf）
+        self.ch = ch
+        self._graph = None
+        self._effective_view = None
+        self._step_weights = None
+        self._columnar = None
+
+    def with_ch(self, ch: Optional[CustomizableCH]) -> "MapSnapshot":
+        return MapSnapshot(self.version, self.csr, self.blocked_edges, self.removes_edges, ch)
+
+    def has_edge(self, from_node, to_node) -> bool:
+        eid = self.csr.edge_index(from_node, to_node)
+        if eid < 0:
+            return False
+        return not self.removes_edges or bool(self.csr.edge_arrays()[0][eid] != float("inf"))
+
+    def edge_cost(self, eid: int) -> float:
+        """CSR 中某条边的实际通行耗时，封路视为无穷大。"""
+        weights, blocked = self.csr.edge_arrays()
+        return float("inf") if blocked[eid] else float(weights[eid])
+
+    def edge_mask(self) -> np.ndarray:
+        """CSR 中实际存在的边（networkx 后端去掉已删除、耗时为 inf 的边）"""
+        if self.removes_edges:
+            return np.isfinite(self.csr.weights)
+        return np.ones(self.csr.num_edges, dtype=bool)
+
+    def edges(self) -> List[Dict]:
+        """所有边的 {from, to, weight, blocked} 列表（与 GraphMap.get_edges 相同）"""
+        blocked_edges = self.blocked_edges
+        return [{
+            "from": u,
+            "to": v,
+            "weight": w,
+            "blocked": (u, v) in blocked_edges
+        } for u, v, w, _ in self.csr.iter_edges()
+            if not (self.removes_edges and w == float("inf"))]
+
+    def edges_columnar(self) -> Dict:
+        """
+        列式边表：from / to 为节点 id（x = id % width, y = id // width），
+        weight / blocked 与之一一对应。比逐条的字典小得多，按快照缓存。
+        """
+        if self._columnar is None:
+            csr = self.csr
+            mask = self.edge_mask()
+            self._columnar = {
+                "width": csr.width,
+                "height": csr.height,
+                "version": self.version,
+                "from": csr.edge_sources()[mask].tolist(),
+                "to": csr.targets[mask].tolist(),
+                "weight": csr.weights[mask].tolist(),
+                "blocked": csr.blocked[mask].tolist(),
+            }
+        return self._columnar
+
+    def graph(self) -> nx.DiGraph:
+        """
+        该版本的 networkx 图（不含已删除的边，含封路边）。
+        networkx 后端首次访问时构建并缓存；csr 后端每次新建，不缓存在快照上。
+        """
+        if self._graph is not None:
+            return self._graph
+        graph = _build_graph(self)
+        if self.removes_edges:
+            self._graph = graph
+        return graph
+
+    def effective_graph(self, graph: Optional[nx.DiGraph] = None) -> nx.DiGraph:
+        """
+        去掉封路边的只读视图（缓存规则同 graph()）。
+        graph 为调用方已取得的 self.graph() 时直接在其上构建，csr 后端不必再建一次。
+        """
+        if self._effective_view is not None:
+            return self._effective_view
+        blocked = self.blocked_edges
+        # 需要时构建该版本的 networkx 图，计时记入 effective_graph 阶段
+        with telemetry.span("effective_graph", version=self.version):
+            view = nx.subgraph_view(graph if graph is not None else self.graph(),
+                                    filter_edge=lambda u, v: (u, v) not in blocked)
+        if self.removes_edges:
+            self._effective_view = view
+        return view
+
+    def step_weights(self):
+        if self._step_weights is None:
+            self._step_weights = step_weights(self.csr)
+        return self._step_weights
+
+
+def _build_graph(snapshot: MapSnapshot) -> nx.DiGraph:
+    """
+    由快照构建 networkx 图：每个点与周围 8 个方向相邻点相连（上下左右 + 对角线），
+    边的耗时取自 CSR（默认 5 / 7）。networkx 后端中被 set_block_edge 删除的边不加入。
+    """
+    csr = snapshot.csr
+    graph = nx.DiGraph()
+    graph.add_nodes_from(csr.node_xy(i) for i in range(csr.num_nodes))
+    for u, v, w, _ in csr.iter_edges():
+        if not (snapshot.removes_edges and w == float("inf")):
+            graph.add_edge(u, v, weight=w)
+    return graph
+
+
+class ChangeLog:
+    """
+    地图的修改记录：每个版本改动了哪些边。前端只需拉取某个版本之后改动过的边，
+    不必每次重新获取整张边表。记录的边总数超过 max_edges 时丢弃最早的版本，
+    floor 为仍能回答的最早版本（since < floor 的查询需要重新获取全部边）。
+    """
+
+    def __init__(self, version: int = 0, max_edges: int = 10000):
+        self.max_edges = max_edges
+        self.floor = version
+        self._entries = deque()  # (版本号, 该版本改动的边)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def record(self, version: int, edges: Tuple):
+        with self._lock:
+            self._entries.append((version, edges))
+            self._size += len(edges)
+            while self._size > self.max_edges and self._entries:
+                dropped, old_edges = self._entries.popleft()
+                self._size -= len(old_edges)
+                self.floor = dropped
+
+    def since(self, version: int, upto: int) -> Optional[List]:
+        """版本 (version, upto] 中改动过的边（去重，按首次改动的顺序）；记录已被丢弃时返回 None。"""
+        with self._lock:
+            if version < self.floor:
+                return None
+            edges = dict.fromkeys(edge for v, changed in self._entries if version < v <= upto
+                                  for edge in changed)
+        return list(edges)
+
 
 class GraphMap:
-    def __init__(self, width, height):
+    def __init__(self, width, height, backend: str = "networkx"):
         """
         初始化地图图结构，创建 width x height 的有向图。
         每个节点代表一个坐标点，边代表路径，默认连接 8 个方向。
-        """
-        self.width = width
-        self.height = height
-        self.graph = nx.DiGraph()
-        self.blocked_edges = set()  # 记录被封锁的边（用作前端标记）
-        self._build_graph()
 
-    def _build_graph(self):
-        """
-        构建初始图，每个点与周围 8 个方向相邻点相连（上下左右 + 对角线）。
-        默认耗时为 5（直线）或 7（对角线）。
+        地图状态保存在不可变的 MapSnapshot 中（写时复制）：读者通过 snapshot() 取得某个版本，
+        写者持有写锁在副本上修改，修复缓存后原子地发布新快照。
+
+        :param backend: "networkx"（默认，set_block_edge 会删除边，networkx 图按需构建供可视化）
+                        或 "csr"（仅使用 NumPy CSR 数组，适合大地图）
         """
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1),
-                      (-1, -1), (-1, 1), (1, -1), (1, 1)]
-        for y in range(self.height):
-            for x in range(self.width):
-                self.graph.add_node((x, y))
-                for dx, dy in directions:
-                    nx_, ny_ = x + dx, y + dy
-                    if self.in_bounds(nx_, ny_):
-                        weight = 7 if dx != 0 and dy != 0 else 5
-                        self.graph.add_edge((x, y), (nx_, ny_), weight=weight)
+        # 路径计算统一使用 CSR 数组（整数节点 id）
+        self._setup(CSRGraph.from_grid(width, height), backend, frozenset(), 0)
+
+    @classmethod
+    def from_csr(cls, csr: CSRGraph, backend: str = "networkx",
+                 blocked_edges: Iterable = (), version: int = 0) -> "GraphMap":
+        """由已有的 CSR 数组（如从文件映射的地图快照）创建地图，不重新生成网格。"""
+        gmap = cls.__new__(cls)
+        gmap._setup(csr, backend, frozenset(blocked_edges), version)
+        return gmap
+
+    def _setup(self, csr: CSRGraph, backend: str, blocked_edges: frozenset, version: int):
+        if backend not in ("networkx", "csr"):
+            raise ValueError(f"unknown backend: {backend}")
+        self.width = csr.width
+        self.height = csr.height
+        self.backend = backend
+        self.sp_cache = ShortestPathCache()
+        self._write_lock = threading.Lock()
+        self._snapshot = MapSnapshot(version, csr, blocked_edges, removes_edges=backend == "networkx")
+        self.change_log = ChangeLog(version)
+
+    # ===============================
+    # 快照读取
+    # ===============================
+    def snapshot(self) -> MapSnapshot:
+        """当前版本的只读快照；需要多次读取时应先取快照，保证读到同一个版本。"""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        """每次封路 / 改耗时后递增，用于判断缓存是否过期。"""
+        return self._snapshot.version
+
+    @property
+    def csr(self) -> CSRGraph:
+        return self._snapshot.csr
+
+    @property
+    def blocked_edges(self) -> frozenset:
+        """被封锁的边（用作前端标记）。"""
+        return self._snapshot.blocked_edges
+
+    @property
+    def ch(self) -> Optional[CustomizableCH]:
+        """可选的收缩层次，build_hierarchy() 后用于点到点查询和距离矩阵。"""
+        return self._snapshot.ch
+
+    @property
+    def graph(self) -> Optional[nx.DiGraph]:
+        """networkx 后端的当前版本图（按需构建），csr 后端为 None。"""
+        if self.backend != "networkx":
+            return None
+        return self._snapshot.graph()
 
     def in_bounds(self, x, y):
         """判断节点坐标是否在地图范围内。"""
         return 0 <= x < self.width and 0 <= y < self.height
 
+    def has_edge(self, from_node, to_node):
+        """判断边是否存在。"""
+        return self._snapshot.has_edge(from_node, to_node)
+
+    def _edge_weight(self, from_node, to_node, snapshot: Optional[MapSnapshot] = None):
+        csr = (snapshot or self._snapshot).csr
+        return float(csr.edge_arrays()[0][csr.edge_index(from_node, to_node)])
+
+    # ===============================
+    # 写操作（写时复制）
+    # ===============================
+    def _write(self, from_node, to_node, change):
+        """
+        在当前快照的副本上执行 change(csr, blocked_edges, eid)，然后原子地发布新版本。
+        change 返回 None 表示没有改动（不发布新版本）。发布前最短路径缓存中的树按改动的边
+        做增量修复并迁移到新图，已构建的收缩层次复制后增量定制，旧快照保持不变。
+        CSR 的耗时 / 封路和收缩层次的弧数组都是分页的写时复制数组，副本只复制被改的页，
+        单次修改不随地图大小增长；修复和定制只按下标读取，不会合并出整个数组。
+        """
+        with self._write_lock:
+            old = self._snapshot
+            csr = old.csr.copy()
+            blocked_edges = set(old.blocked_edges)
+            eid = csr.edge_index(from_node, to_node)
+            result = change(csr, blocked_edges, eid)
+            if result is None:
+                return None
+            new = MapSnapshot(old.version + 1, csr, frozenset(blocked_edges), old.removes_edges)
+            if old.ch is not None:
+                new.ch = old.ch.with_graph(csr)
+                if eid >= 0:
+                    new.ch.update_edge(eid)  # 只重新定制受影响的弧
+            if eid >= 0:
+                self.sp_cache.apply_edge_change(old.version, new.version,
+                                                csr.node_id(from_node), csr.node_id(to_node),
+                                                old.edge_cost(eid), new.edge_cost(eid), graph=csr)
+            else:
+                self.sp_cache.apply_edge_change(old.version, new.version, graph=csr)
+            # 先记录再发布：读者看到的每个版本都能查到它的改动
+            self.change_log.record(new.version, ((tuple(from_node), tuple(to_node)),))
+            self._snapshot = new
+            return result
+
     def set_block_edge(self, from_node, to_node):
         """将某条边标记为封路（不可通行），并记录下来。"""
-        if self.graph.has_edge(from_node, to_node):
-            self.graph.remove_edge(from_node, to_node)
-            self.blocked_edges.add((from_node, to_node))
+        def change(csr, blocked_edges, eid):
+            if not self._snapshot.has_edge(from_node, to_node):
+                return None
+            if self.backend == "networkx":
+                # networkx 后端会真正删除边，CSR 中用无穷耗时表示
+                csr.set_edge(eid, weight=float("inf"))
+            csr.set_edge(eid, blocked=True)
+            blocked_edges.add((from_node, to_node))
+            return {"status": "blocked"}
+        self._write(from_node, to_node, change)
 
     def toggle_block_edge(self, from_node, to_node):
         """
         切换封路状态，不再从图中移除边，而是设置 blocked 状态，并在路径计算时忽略该边。
         """
-        if (from_node, to_node) in self.blocked_edges:
-            # ✅ 已经封路 → 解封
-            self.blocked_edges.remove((from_node, to_node))
-            return {"status": "unblocked"}
-        else:
+        def change(csr, blocked_edges, eid):
+            if (from_node, to_node) in blocked_edges:
+                # ✅ 已经封路 → 解封
+                blocked_edges.remove((from_node, to_node))
+                if eid >= 0:
+                    csr.set_edge(eid, blocked=False)
+                return {"status": "unblocked"}
             # ✅ 封路，但不删除边，仅标记为 blocked
-            self.blocked_edges.add((from_node, to_node))
+            blocked_edges.add((from_node, to_node))
+            if eid >= 0:
+                csr.set_edge(eid, blocked=True)
             return {"status": "blocked"}
+        return self._write(from_node, to_node, change)
 
     def set_edge_weight(self, from_node, to_node, weight):
         """设置某条边的耗时（仅在边存在的前提下）。"""
-        if self.graph.has_edge(from_node, to_node):
-            self.graph[from_node][to_node]["weight"] = weight
-            self.blocked_edges.discard((from_node, to_node))
+        def change(csr, blocked_edges, eid):
+            if not self._snapshot.has_edge(from_node, to_node):
+                return None
+            csr.set_edge(eid, weight=weight, blocked=False)
+            blocked_edges.discard((from_node, to_node))
             return {"status": "ok"}
-        return {"status": "error", "reason": "edge does not exist"}
+        return self._write(from_node, to_node, change) or {"status": "error", "reason": "edge does not exist"}
+
+    def load_edges(self, edges: List[Dict]):
+        """
+        批量设置边的耗时和封路状态（格式与 get_edges() 相同），只发布一个新版本。
+        改动较多，不做增量修复：清空最短路径缓存，收缩层次整体重新定制。
+        不存在的边忽略。
+        """
+        with self._write_lock:
+            old = self._snapshot
+            csr = old.csr.copy()
+            blocked_edges = set(old.blocked_edges)
+            changed = []
+            for edge in edges:
+                u, v = tuple(edge["from"]), tuple(edge["to"])
+                if not old.has_edge(u, v):
+                    continue
+                changed.append((u, v))
+                eid = csr.edge_index(u, v)
+                blocked = bool(edge.get("blocked", False))
+                csr.set_edge(eid, weight=edge["weight"], blocked=blocked)
+                if blocked:
+                    blocked_edges.add((u, v))
+                else:
+                    blocked_edges.discard((u, v))
+            new = MapSnapshot(old.version + 1, csr, frozenset(blocked_edges), old.removes_edges)
+            if old.ch is not None:
+                new.ch = old.ch.with_graph(csr)
+                new.ch.customize()
+            self.sp_cache.clear()
+            self.change_log.record(new.version, tuple(changed))
+            self._snapshot = new
+
+    def changes_since(self, version: int) -> Dict:
+        """
+        返回 version 之后改动过的边的当前状态（格式同 get_edges，另加 exists：
+        networkx 后端 set_block_edge 删除的边为 False）。
+        记录已被丢弃或 version 比当前版本还新时 reset 为 True，需要重新获取全部边。
+        """
+        snapshot = self._snapshot
+        edges = None
+        if version <= snapshot.version:
+            edges = self.change_log.since(version, snapshot.version)
+        if edges is None:
+            return {"version": snapshot.version, "since": version, "reset": True, "edges": []}
+        return {
+            "version": snapshot.version,
+            "since": version,
+            "reset": False,
+            "edges": [{
+                "from": u,
+                "to": v,
+                "exists": snapshot.has_edge(u, v),
+                "weight": self._edge_weight(u, v, snapshot) if snapshot.has_edge(u, v) else None,
+                "blocked": (u, v) in snapshot.blocked_edges
+            } for u, v in edges]
+        }
+
+    def nbytes(self) -> int:
+        """地图占用的内存字节数估算：CSR 数组 + 最短路径缓存 + 收缩层次。"""
+        snapshot = self._snapshot
+        total = snapshot.csr.nbytes() + self.sp_cache.nbytes()
+        if snapshot.ch is not None:
+            total += snapshot.ch.nbytes()
+        return total
 
     def neighbors(self, node):
         """获取某个节点当前所有可达的邻居节点（后继节点）。"""
-        return list(self.graph.successors(node))
+        snapshot = self._snapshot
+        return [v for v in snapshot.csr.successors(node) if snapshot.has_edge(node, v)]
 
     def print_edges(self):
         """调试用：打印所有边及其耗时。"""
-        for u, v, data in self.graph.edges(data=True):
-            print(f"{u} → {v}, time = {data['weight']:.3f}")
+        snapshot = self._snapshot
+        for u, v, w, _ in snapshot.csr.iter_edges():
+            if snapshot.has_edge(u, v):
+                print(f"{u} → {v}, time = {w:.3f}")
 
     def get_nodes(self):
         """返回所有节点坐标（供前端使用）。"""
-        return list(self.graph.nodes())
+        csr = self.csr
+        return [csr.node_xy(i) for i in range(csr.num_nodes)]
 
     def get_edges(self):
         """
         获取所有边的列表，包括起点、终点、耗时和是否封路。
         供前端展示路径网格使用。
         """
-        return [{
-            "from": u,
-            "to": v,
-            "weight": self.graph[u][v]["weight"],
-            "blocked": (u, v) in self.blocked_edges
-        } for u, v in self.graph.edges()]
+        return self._snapshot.edges()
 
     def get_edge_info(self, from_node, to_node):
         """
         查询单条边的状态：
         是否存在、是否被封路、当前耗时是多少。
         """
-        if not self.graph.has_edge(from_node, to_node):
+        snapshot = self._snapshot
+        if not snapshot.has_edge(from_node, to_node):
             return {"exists": False, "blocked": True, "weight": None}
         return {
             "exists": True,
-            "blocked": (from_node, to_node) in self.blocked_edges,
-            "weight": self.graph[from_node][to_node]["weight"]
+            "blocked": (from_node, to_node) in snapshot.blocked_edges,
+            "weight": self._edge_weight(from_node, to_node, snapshot)
         }
 
     def get_bidirectional_edge_info(self, a, b):
@@ -104,60 +426,122 @@ class GraphMap:
         获取节点 a 和 b 之间的两个方向的边（a→b 和 b→a），
         用于前端点击边后选择编辑哪一个方向。
         """
+        snapshot = self._snapshot
         result = []
-        if self.graph.has_edge(a, b):
+        if snapshot.has_edge(a, b):
             result.append({
                 "from": a,
                 "to": b,
-                "blocked": (a, b) in self.blocked_edges,
-                "weight": self.graph[a][b]["weight"],
+                "blocked": (a, b) in snapshot.blocked_edges,
+                "weight": self._edge_weight(a, b, snapshot),
                 "direction": "a→b"
             })
-        if self.graph.has_edge(b, a):
+        if snapshot.has_edge(b, a):
             result.append({
                 "from": b,
                 "to": a,
-                "blocked": (b, a) in self.blocked_edges,
-                "weight": self.graph[b][a]["weight"],
+                "blocked": (b, a) in snapshot.blocked_edges,
+                "weight": self._edge_weight(b, a, snapshot),
                 "direction": "b→a"
             })
         return result
 
     def get_effective_graph(self) -> nx.DiGraph:
         """
-        返回一个不包含被封路边的图副本，供路径规划等算法使用。
-        原图仍保留所有边（用于可视化）。
+        返回当前版本不包含被封路边的只读视图，供路径规划等算法使用。
+        视图属于当时的快照，之后的封路 / 改耗时不会影响它（需要新版本时重新调用）。
+        networkx 后端的图在每个版本首次调用时按需构建并缓存；csr 后端每次新建，
+        不挂在地图上，调用方用完即释放。
+        """
+        return self._snapshot.effective_graph()
+
+    def build_hierarchy(self) -> CustomizableCH:
+        """
+        构建收缩层次（预处理较慢，适合查询远多于修改的地图）。
+        之后的封路 / 改耗时只触发增量定制，距离矩阵和 method="ch" 的查询由它回答。
         """
-        g = self.graph.copy()
-        g.remove_edges_from(self.blocked_edges)
-        return g
+        with self._write_lock:
+            snapshot = self._snapshot
+            if snapshot.ch is None:
+                # 版本号不变：收缩层次只加速查询，不改变距离
+                snapshot = snapshot.with_ch(CustomizableCH(snapshot.csr))
+                self._snapshot = snapshot
+            return snapshot.ch
+
+    def drop_hierarchy(self) -> int:
+        """
+        丢弃收缩层次（内存超限时由 TenantRegistry.evict 调用），之后的查询回到 Dijkstra / A*。
+        版本号不变；正在使用旧快照查询的读者不受影响。返回释放的字节数估算。
+        """
+        with self._write_lock:
+            snapshot = self._snapshot
+            if snapshot.ch is None:
+                return 0
+            freed = snapshot.ch.nbytes()
+            self._snapshot = snapshot.with_ch(None)
+            return freed
+
+    def shortest_path(self, from_node, to_node, method: str = "astar"):
+        """
+        点到点最短路径，一次搜索同时得到路径和耗时。
+
+        :param method: "astar"（octile 启发函数）、"bidirectional"（双向 A*）
+                       "dijkstra"（单向，找到终点即停止）或 "ch"（收缩层次；未构建时按 "astar" 查询，
+                       只读的查询不触发构建，构建由 build_hierarchy() 显式完成）
+        :return: (坐标路径, 耗时)；不可达时为 ([], inf)
+        """
+        snapshot = self._snapshot
+        csr = snapshot.csr
+        for node in (from_node, to_node):
+            if not csr.has_node(node):
+                raise ValueError(f"node {node} is outside the map")
+        source, target = csr.node_id(from_node), csr.node_id(to_node)
+        if method == "ch" and snapshot.ch is None:
+            method = "astar"
+        if method in ("astar", "bidirectional"):
+            search = astar if method == "astar" else bidirectional_astar
+            cost, path, _ = search(csr, source, target, snapshot.step_weights())
+        elif method == "ch":
+            cost, path = snapshot.ch.path(source, target)
+        elif method == "dijkstra":
+            tree = ShortestPathTree(csr, source)
+            tree.settle([target])
+            cost, path = tree.distance(target), tree.path(target)
+        else:
+            raise ValueError(f"unknown method: {method}")
+        return [csr.node_xy(v) for v in path], cost
 
     def visualize(self,
                   deliveries: List['Delivery'],
                   start: Tuple[int, int],
                   path_result: Optional[Dict] = None,
-                  grid_size: Optional[Tuple[int, int]] = None):
+                  grid_size: Optional[Tuple[int, int]] = None,
+                  legs: Optional[List[List[Tuple[int, int]]]] = None):
         """
         使用 matplotlib 可视化地图结构：
         显示所有节点、路径、封路信息、送货点、到达时间和红色最短路径。
+        legs 为路线每一段的逐节点路径（KeyPointMatrix.legs），给出时直接绘制；
+        否则在同一快照去掉封路边的图上逐段搜索。
         """
-        pos = {node: node for node in self.graph.nodes()}
+        snapshot = self._snapshot
+        graph = snapshot.graph()
+        pos = {node: node for node in graph.nodes()}
         if grid_size is None:
             grid_size = (self.width, self.height)
 
         plt.figure(figsize=(8, 8))
-        nx.draw_networkx_edges(self.graph, pos, edge_color="lightgray", width=1)
-        edge_labels = nx.get_edge_attributes(self.graph, "weight")
-        nx.draw_networkx_edge_labels(self.graph, pos, edge_labels=edge_labels, font_size=7)
+        nx.draw_networkx_edges(graph, pos, edge_color="lightgray", width=1)
+        edge_labels = nx.get_edge_attributes(graph, "weight")
+        nx.draw_networkx_edge_labels(graph, pos, edge_labels=edge_labels, font_size=7)
 
         # 绘制虚线封路边
-        for i, (u, v) in enumerate(self.blocked_edges):
+        for i, (u, v) in enumerate(snapshot.blocked_edges):
             x0, y0 = u
             x1, y1 = v
             plt.plot([x0, x1], [y0, y1], color="black", linestyle="dashed", linewidth=2,
                      label="Blocked" if i == 0 else "")
 
-        nx.draw_networkx_nodes(self.graph, pos, node_size=50, node_color="lightblue")
+        nx.draw_networkx_nodes(graph, pos, node_size=50, node_color="lightblue")
         plt.scatter(*start, c="green", s=300, label="Start", zorder=5)
         plt.text(start[0], start[1], "Start", fontsize=10, ha="center", va="center", color="white",
                  bbox=dict(facecolor='green', edgecolor='black', boxstyle='circle'))
@@ -172,16 +556,17 @@ class GraphMap:
         if path_result:
             sequence = path_result["sequence"]
             arrival_times = path_result["arrival_times"]
-            full_path_nodes = [start] + [d.location for d in sequence]
-            real_edges = []
-            for i in range(len(full_path_nodes) - 1):
-                src, dst = full_path_nodes[i], full_path_nodes[i + 1]
-                try:
-                    path = nx.dijkstra_path(self.graph, source=src, target=dst, weight="weight")
-                    real_edges += list(zip(path, path[1:]))
-                except nx.NetworkXNoPath:
-                    continue
-            nx.draw_networkx_edges(self.graph, pos, edgelist=real_edges, edge_color="red", width=2.5)
+            if legs is None:
+                full_path_nodes = [start] + [d.location for d in sequence]
+                effective = snapshot.effective_graph(graph)
+                legs = []
+                for src, dst in zip(full_path_nodes, full_path_nodes[1:]):
+                    try:
+                        legs.append(nx.dijkstra_path(effective, source=src, target=dst, weight="weight"))
+                    except nx.NetworkXNoPath:
+                        continue
+            real_edges = [(tuple(u), tuple(v)) for path in legs for u, v in zip(path, path[1:])]
+            nx.draw_networkx_edges(graph, pos, edgelist=real_edges, edge_color="red", width=2.5)
 
             for i, d in enumerate(sequence):
                 x, y = d.location
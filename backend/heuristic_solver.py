@@ -0,0 +1,358 @@
+import random
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from delivery import Delivery
+from route_problem import RouteProblem
+from search_monitor import SearchMonitor
+
+
+class _RouteSearch:
+    """
+    时间窗感知的插入构造 + 局部搜索（relocate / or-opt / 2-opt）+ 扰动。
+    代价为 (迟到总量, 总耗时) 的字典序，迟到为 0 即可行，
+    因此同一套邻域既能修复不可行路线，也能优化可行路线。
+    """
+
+    def __init__(self, problem: RouteProblem, deadline: float, rng: random.Random,
+                 should_stop: Optional[Callable[[], bool]] = None):
+        self.problem = problem
+        self.dist = problem.dist
+        self.earliest = problem.earliest
+        self.latest = problem.latest
+        self.deadline = deadline
+        self.rng = rng
+        self.should_stop = should_stop
+
+    def timed_out(self) -> bool:
+        if self.should_stop is not None and self.should_stop():
+            return True
+        return time.perf_counter() > self.deadline
+
+    def cost(self, order: Sequence[int], bound: Optional[Tuple[float, float]] = None,
+             prefix: Optional[Tuple[List[float], List[float]]] = None, first: int = 0) -> Tuple[float, float]:
+        """
+        返回 (迟到总量, 总耗时)。给定 bound 时，一旦确定不优于 bound 就提前返回
+        （迟到量和时间都只增不减）。
+        prefix 为当前路线的 (到达时间, 累计迟到) 数组，first 为候选路线第一个改动的位置，
+        之前的部分直接复用，不再模拟。
+        """
+        dist, earliest, latest = self.dist, self.earliest, self.latest
+        if first > 0:
+            t, late, node = prefix[0][first - 1], prefix[1][first - 1], order[first - 1] + 1
+        else:
+            t, late, node = self.problem.start_time, 0.0, 0
+        for k in range(first, len(order)):
+            nxt = order[k] + 1
+            arrive = t + dist[node][nxt]
+            if arrive > latest[nxt]:
+                late += arrive - latest[nxt]
+            t = max(arrive, earliest[nxt])
+            node = nxt
+            if bound is not None and (late, t) >= bound:
+                return late, t
+        return late, t
+
+    def prefix(self, order: Sequence[int]) -> Tuple[List[float], List[float]]:
+        """当前路线每个位置的到达时间和累计迟到量，供 cost() 复用。"""
+        dist, earliest, latest = self.dist, self.earliest, self.latest
+        t, late, node = self.problem.start_time, 0.0, 0
+        times, lates = [], []
+        for i in order:
+            arrive = t + dist[node][i + 1]
+            if arrive > latest[i + 1]:
+                late += arrive - latest[i + 1]
+            t = max(arrive, earliest[i + 1])
+            node = i + 1
+            times.append(t)
+            lates.append(late)
+        return times, lates
+
+    # ===============================
+    # 构造
+    # ===============================
+    def construct(self) -> List[int]:
+        """
+        分别按最晚时间、最早时间、时间窗中点排序，
+        取排序本身、按该顺序插入构造的路线和贪心路线中代价最小的一条。
+        插入构造为 O(n³)，超时后不再构造，返回已得到的路线中最好的一条（至少有贪心路线和第一种排序）。
+        """
+        earliest, latest = self.earliest, self.latest
+        keys = [
+            lambda i: (latest[i + 1], earliest[i + 1]),
+            lambda i: (earliest[i + 1], latest[i + 1]),
+            lambda i: earliest[i + 1] + latest[i + 1],
+        ]
+        routes = [self._greedy_route()]
+        for key in keys:
+            pending = sorted(range(self.problem.n), key=key)
+            routes.append(pending)
+            if self.timed_out():
+                break
+            routes.append(self._insertion_route(pending))
+        return min(routes, key=self.cost)
+
+    def _greedy_route(self) -> List[int]:
+        """每次去最早可以开始服务的点（有不迟到的点时只在其中选），O(n²)。"""
+        dist, earliest, latest = self.dist, self.earliest, self.latest
+        pending = list(range(self.problem.n))
+        route: List[int] = []
+        t, node = self.problem.start_time, 0
+        while pending:
+            row = dist[node]
+            best_key, best = None, -1
+            for k, i in enumerate(pending):
+                arrive = t + row[i + 1]
+                key = (arrive > latest[i + 1], max(arrive, earliest[i + 1]))
+                if best_key is None or key < best_key:
+                    best_key, best = key, k
+            stop = pending.pop(best)
+            route.append(stop)
+            t, node = best_key[1], stop + 1
+        return route
+
+    def _insertion_route(self, pending: List[int]) -> List[int]:
+        """
+        依次把送货点插入使总耗时最小的可行位置。
+        超时后剩下的送货点按 pending 的顺序接在路线末尾，仍返回完整的路线。
+        """
+        problem = self.problem
+        route: List[int] = []
+        times: List[float] = []
+        failed = []
+        dist = self.dist
+        for k, stop in enumerate(pending):
+            if self.timed_out():
+                return route + pending[k:] + failed
+            # 总耗时相同时选绕路最少的位置，尽量不占用前面的等待时间
+            best_pos, best_key = -1, (float("inf"), float("inf"))
+            for pos in range(len(route) + 1):
+                t = self._insertion_time(route, times, stop, pos)
+                if t == float("inf"):
+                    continue
+                prev = route[pos - 1] + 1 if pos > 0 else 0
+                detour = dist[prev][stop + 1]
+                if pos < len(route):
+                    detour += dist[stop + 1][route[pos] + 1] - dist[prev][route[pos] + 1]
+                if (t, detour) < best_key:
+                    best_pos, best_key = pos, (t, detour)
+            if best_pos < 0:
+                failed.append(stop)
+                continue
+            route.insert(best_pos, stop)
+            times = problem.evaluate(route)[1]
+
+        # 无法可行插入的点放到迟到量最小的位置，交给局部搜索修复
+        for k, stop in enumerate(failed):
+            if self.timed_out():
+                return route + failed[k:]
+            candidates = [route[:pos] + [stop] + route[pos:] for pos in range(len(route) + 1)]
+            route = min(candidates, key=self.cost)
+        return route
+
+    def _insertion_time(self, route, times, stop, pos) -> float:
+        """把 stop 插在 pos 处后的总耗时；不可行返回 inf。后续到达时间不变时提前结束。"""
+        dist, earliest, latest = self.dist, self.earliest, self.latest
+        node = route[pos - 1] + 1 if pos > 0 else 0
+        t = times[pos - 1] if pos > 0 else self.problem.start_time
+        arrive = t + dist[node][stop + 1]
+        if arrive > latest[stop + 1]:
+            return float("inf")
+        t = max(arrive, earliest[stop + 1])
+        node = stop + 1
+        for k in range(pos, len(route)):
+            nxt = route[k] + 1
+            arrive = t + dist[node][nxt]
+            if arrive > latest[nxt]:
+                return float("inf")
+            t = max(arrive, earliest[nxt])
+            if t == times[k]:
+                return times[-1]
+            node = nxt
+        return t
+
+    # ===============================
+    # 局部搜索
+    # ===============================
+    def local_search(self, order: List[int], cost: Tuple[float, float]):
+        improved = True
+        while improved and not self.timed_out():
+            improved = False
+            for neighbourhood in (self._or_opt, self._two_opt):
+                order, cost, changed = neighbourhood(order, cost)
+                improved = improved or changed
+        return order, cost
+
+    def _or_opt(self, order, cost):
+        """把长度 1~3 的片段移动到其他位置（k=1 即 relocate）。"""
+        changed = False
+        n = len(order)
+        prefix = self.prefix(order)
+        for k in (1, 2, 3):
+            for i in range(n - k + 1):
+                if self.timed_out():
+                    return order, cost, changed
+                segment = order[i:i + k]
+                rest = order[:i] + order[i + k:]
+                for j in range(len(rest) + 1):
+                    if j == i:
+                        continue
+                    candidate = rest[:j] + segment + rest[j:]
+                    c = self.cost(candidate, cost, prefix, min(i, j))
+                    if c < cost:
+                        order, cost, changed = candidate, c, True
+                        prefix = self.prefix(order)
+                        break
+        return order, cost, changed
+
+    def _two_opt(self, order, cost):
+        """反转一段子路线。"""
+        changed = False
+        n = len(order)
+        prefix = self.prefix(order)
+        for i in range(n - 1):
+            if self.timed_out():
+                break
+            for j in range(i + 1, n):
+                candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                c = self.cost(candidate, cost, prefix, i)
+                if c < cost:
+                    order, cost, changed = candidate, c, True
+                    prefix = self.prefix(order)
+        return order, cost, changed
+
+    # ===============================
+    # 修复（增量重新规划 / 拼接后的路线）
+    # ===============================
+    def first_late(self, order: Sequence[int]) -> int:
+        """第一个迟到的位置，没有迟到返回 -1。"""
+        dist, earliest, latest = self.dist, self.earliest, self.latest
+        t, node = self.problem.start_time, 0
+        for k, i in enumerate(order):
+            arrive = t + dist[node][i + 1]
+            if arrive > latest[i + 1]:
+                return k
+            t = max(arrive, earliest[i + 1])
+            node = i + 1
+        return -1
+
+    def drop_late(self, order: Sequence[int]) -> Tuple[List[int], List[int]]:
+        """依次移出第一个迟到的送货点直到路线可行，返回 (可行路线, 移出的送货点)。"""
+        order, dropped = list(order), []
+        late = self.first_late(order)
+        while late >= 0:
+            dropped.append(order.pop(late))
+            late = self.first_late(order)
+        return order, dropped
+
+    def insert(self, routes: List[List[int]], stops: Sequence[int]) -> List[int]:
+        """
+        按最晚时间先后把 stops 逐个插入使所在路线总耗时增加最少的可行位置
+        （routes 为可行路线，原地修改），返回无法可行插入的送货点。
+        """
+        problem = self.problem
+        timelines = [problem.evaluate(route)[1] for route in routes]
+        unassigned = []
+        for stop in sorted(stops, key=lambda i: self.latest[i + 1]):
+            best = None
+            for v, route in enumerate(routes):
+                times = timelines[v]
+                total = times[-1] if times else problem.start_time
+                for pos in range(len(route) + 1):
+                    t = self._insertion_time(route, times, stop, pos)
+                    if t != float("inf") and (best is None or t - total < best[0]):
+                        best = (t - total, v, pos)
+            if best is None:
+                unassigned.append(stop)
+                continue
+            _, v, pos = best
+            routes[v].insert(pos, stop)
+            timelines[v] = problem.evaluate(routes[v])[1]
+        return unassigned
+
+    def perturb(self, order: List[int]) -> List[int]:
+        """double-bridge：把路线切成 A B C D 四段，重排为 A C B D。"""
+        a, b, c = sorted(self.rng.sample(range(1, len(order)), 3))
+        return order[:a] + order[b:c] + order[a:b] + order[c:]
+
+
+def repair_order(problem: RouteProblem, order: Sequence[int], time_budget: float = 0.05,
+                 seed: int = 0) -> Optional[List[int]]:
+    """
+    增量重新规划：order 为上次路线中仍然存在的送货点（下标，按原顺序）。
+    路线中迟到的点（时间窗或地图改变）先移出，和新增的送货点一起按最便宜的可行位置插入，
+    再在 time_budget 秒内局部搜索。返回可行的下标顺序，无法修复时返回 None。
+    """
+    search = _RouteSearch(problem, time.perf_counter() + time_budget, random.Random(seed))
+    present = set(order)
+    route, dropped = search.drop_late(order)
+    unassigned = search.insert([route], dropped + [i for i in range(problem.n) if i not in present])
+    for stop in unassigned:
+        # 无法可行插入的点放到迟到量最小的位置，交给局部搜索修复
+        route = min((route[:pos] + [stop] + route[pos:] for pos in range(len(route) + 1)), key=search.cost)
+    route, cost = search.local_search(route, search.cost(route))
+    return route if cost[0] == 0 else None
+
+
+def solve_heuristic(
+    start: Tuple[int, int],
+    deliveries: List[Delivery],
+    distance_matrix: Dict[Tuple, float],
+    start_time: int = 0,
+    time_budget: float = 1.0,
+    initial_orders: Optional[List[List[int]]] = None,
+    seed: int = 0,
+    max_stall: int = 100,
+    monitor: Optional[SearchMonitor] = None,
+    stats: Optional[Dict] = None
+) -> Optional[Dict]:
+    """
+    启发式求解：插入构造 + 局部搜索，剩余时间用扰动继续搜索（迭代局部搜索），
+    在 time_budget 秒内返回找到的最好的可行路线。适合 50~500 个送货点。
+
+    :param initial_orders: 额外的初始路线（送货点下标顺序），如贪心结果
+    :param max_stall: 连续多少次扰动没有改进后提前结束
+    :param monitor: 每次扰动后报告进度，找到更优的可行路线时回调，可提前停止
+    :param stats: 传入字典时填写扰动迭代次数（nodes）和改进次数
+    :return: 与 find_best_valid_path 相同格式的结果；找不到可行路线时返回 None
+    """
+    deadline = time.perf_counter() + time_budget
+    problem = RouteProblem(start, deliveries, distance_matrix, start_time)
+    if problem.n == 0:
+        return problem.to_result([], [], start_time)
+
+    search = _RouteSearch(problem, deadline, random.Random(seed),
+                          should_stop=monitor.should_stop if monitor is not None else None)
+    seeds = [search.construct()] + list(initial_orders or [])
+    order = min(seeds, key=search.cost)
+    order, cost = search.local_search(order, search.cost(order))
+    best_order, best_cost = order, cost
+
+    def report_improvement():
+        if monitor is not None and best_cost[0] == 0:
+            total_time, arrival_times = problem.evaluate(best_order)
+            monitor.on_improve(problem.to_result(best_order, arrival_times, total_time))
+
+    report_improvement()
+    stall = 0
+    iterations = improvements = 0
+    while problem.n >= 4 and stall < max_stall and not search.timed_out():
+        if monitor is not None:
+            monitor.on_progress(iterations, best_cost[1] if best_cost[0] == 0 else float("inf"))
+        iterations += 1
+        candidate = search.perturb(best_order)
+        candidate, c = search.local_search(candidate, search.cost(candidate))
+        if c < best_cost:
+            best_order, best_cost = candidate, c
+            stall = 0
+            improvements += 1
+            report_improvement()
+        else:
+            stall += 1
+
+    if stats is not None:
+        stats.update(nodes=iterations, window_prunes=0, bound_prunes=0, improvements=improvements)
+    if best_cost[0] > 0:
+        return None
+    total_time, arrival_times = problem.evaluate(best_order)
+    return problem.to_result(best_order, arrival_times, total_time)
@@ -0,0 +1,104 @@
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Point = Tuple[int, int]
+
+
+class LegPaths:
+    """
+    关键点之间的逐节点路径，随距离矩阵一起计算，不需要再搜索一次：
+    - trees：每个源点 id → 最短路径树中通往各关键点的部分（见 ShortestPathTree.path_tree）
+    - ch：地图已构建收缩层次时没有搜索树，按需展开该版本收缩层次中的捷径
+    """
+
+    def __init__(self, width: int, trees: Optional[Dict[int, Tuple[np.ndarray, np.ndarray]]] = None,
+                 ch=None):
+        self.width = width
+        self.trees = trees or {}
+        self.ch = ch
+
+    def node_path(self, source: int, target: int) -> List[int]:
+        """source → target 的节点 id 路径（含两端），不可达返回空列表。"""
+        if source == target:
+            return [source]
+        if self.ch is not None:
+            return self.ch.path(source, target)[1]
+        nodes, preds = self.trees[source]
+        path = [target]
+        while path[-1] != source:
+            i = int(np.searchsorted(nodes, path[-1]))
+            if i == len(nodes) or nodes[i] != path[-1]:
+                return []
+            path.append(int(preds[i]))
+        path.reverse()
+        return path
+
+
+class KeyPointMatrix:
+    """
+    关键点之间的稠密距离矩阵：array[i, j] 为 points[i] → points[j] 的最短耗时（不可达为 inf）。
+    同时兼容原来 {(p1, p2): time} 字典的 get / [] / items 用法（不含 p → p 自身）。
+    paths 为关键点之间的逐节点路径（compute_distance_matrix(paths=True) 时保存），
+    只在当前进程使用：传给求解进程时不带路径。
+    """
+
+    def __init__(self, points: Sequence[Point], array: np.ndarray, paths: Optional[LegPaths] = None):
+        self.points: List[Point] = [tuple(p) for p in points]
+        self.array = array
+        self.paths = paths
+        self.index: Dict[Point, int] = {}
+        for i, p in enumerate(self.points):
+            self.index.setdefault(p, i)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["paths"] = None
+        return state
+
+    def path(self, a: Point, b: Point) -> List[Point]:
+        """a → b 的逐节点路径（坐标，含两端），不可达返回空列表；没有保存路径时抛出 ValueError。"""
+        if self.paths is None:
+            raise ValueError("distance matrix was computed without paths")
+        width = self.paths.width
+        nodes = self.paths.node_path(a[1] * width + a[0], b[1] * width + b[0])
+        return [(node % width, node // width) for node in nodes]
+
+    def legs(self, start: Point, stops: Sequence[Point]) -> List[List[Point]]:
+        """路线每一段（起点 → 第一个送货点 → …）的逐节点路径。"""
+        points = [tuple(start)] + [tuple(p) for p in stops]
+        return [self.path(a, b) for a, b in zip(points, points[1:])]
+
+    def submatrix(self, points: Sequence[Point]) -> np.ndarray:
+        """按给定关键点顺序取出子矩阵（用于求解器按下标访问）。"""
+        rows = [self.index[tuple(p)] for p in points]
+        return self.array[np.ix_(rows, rows)]
+
+    def get(self, key: Tuple[Point, Point], default=None):
+        a, b = key
+        if a == b or a not in self.index or b not in self.index:
+            return default
+        return float(self.array[self.index[a], self.index[b]])
+
+    def __getitem__(self, key: Tuple[Point, Point]) -> float:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def keys(self) -> Iterator[Tuple[Point, Point]]:
+        points = list(self.index)
+        return ((a, b) for a in points for b in points if a != b)
+
+    def items(self) -> Iterator[Tuple[Tuple[Point, Point], float]]:
+        for a, b in self.keys():
+            yield (a, b), float(self.array[self.index[a], self.index[b]])
+
+    def __len__(self) -> int:
+        return len(self.index) * (len(self.index) - 1)
+
+    def to_dict(self) -> Dict[Tuple[Point, Point], float]:
+        return dict(self.items())
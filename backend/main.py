@@ -1,16 +1,50 @@
-from fastapi import FastAPI, Query
+import asyncio
+import io
+import json
+import os
+import re
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 from graph_map import GraphMap
+from delivery import valid_time
 from delivery_manager import DeliveryManager
+from tenants import DEFAULT_ID, TenantRegistry
+from map_store import load_map, read_header, save_map
 from dijkstra import compute_distance_matrix
-from planner import find_best_valid_path
-import networkx as nx
+from planner import SOLVERS
+from plan_jobs import PlanJobManager, format_plan
+import telemetry
 import time  # ✅ 加上这一行
 
+# 结构化追踪级别（环境变量 ORION_LOG_LEVEL：WARNING / INFO / DEBUG / TRACE）
+telemetry.configure()
+
+# 后台规划任务（求解器在独立进程中运行，不阻塞其他接口）
+plan_jobs = PlanJobManager()
+
+# 闲置地图的检查间隔（秒）
+EVICT_INTERVAL = 60
+
+async def evict_periodically():
+    while True:
+        await asyncio.sleep(EVICT_INTERVAL)
+        tenants.evict()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    evictor = asyncio.create_task(evict_periodically())
+    yield
+    evictor.cancel()
+    plan_jobs.shutdown()
+
 # 初始化 FastAPI 应用
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # 允许前端访问
 app.add_middleware(
@@ -20,10 +54,45 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 大响应（如整张地图的边表）gzip 压缩
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    """
+    按路由模板（而不是实际路径）记录请求耗时，避免 id 参数让指标的标签无限增长。
+    流式响应（SSE）记录的是开始返回响应头之前的耗时。
+    """
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        telemetry.REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                                          route=route.path if route is not None else "unmatched",
+                                          status=status)
+
+# 地图快照文件目录
+MAP_DIR = os.environ.get("ORION_MAP_DIR", "maps")
 
-# 初始化组件
-gmap = GraphMap(20, 10)
-delivery_manager = DeliveryManager()
+# 初始化组件：多地图 / 多会话注册表，默认地图和会话供不带 id 的请求使用
+tenants = TenantRegistry()
+tenants.create_map(20, 10, map_id=DEFAULT_ID, pinned=True)
+tenants.create_session(DEFAULT_ID, session_id=DEFAULT_ID)
+
+def not_found(kind: str):
+    return {"status": "error", "reason": f"{kind} not found"}
+
+def get_gmap(map_id: str) -> Optional[GraphMap]:
+    entry = tenants.get_map(map_id)
+    return entry.gmap if entry is not None else None
+
+def get_deliveries(session_id: str) -> Optional[DeliveryManager]:
+    session = tenants.get_session(session_id)
+    return session.deliveries if session is not None else None
 
 # ===============================
 # ✅ 请求模型定义
@@ -47,127 +116,504 @@ class WeightRequest(BaseModel):
     to_node: Tuple[int, int]
     weight: float
 
+class MapRequest(BaseModel):
+    width: int
+    height: int
+    backend: str = "networkx"
+    map_id: Optional[str] = None
+    edges: Optional[List[Dict]] = None  # 格式与 /map/edges 相同，用于载入已有地图
+
+class LoadMapRequest(BaseModel):
+    name: str  # MAP_DIR 下的快照文件名（不含扩展名）
+    map_id: Optional[str] = None
+    mmap: bool = True
+
+class SessionRequest(BaseModel):
+    map_id: str = DEFAULT_ID
+    base_time: str = "08:00"
+    session_id: Optional[str] = None
+
+# ===============================
+# ✅ 地图 / 会话管理接口
+# ===============================
+@app.post("/maps")
+def create_map(req: MapRequest):
+    try:
+        entry = tenants.create_map(req.width, req.height, backend=req.backend,
+                                   map_id=req.map_id, edges=req.edges)
+    except ValueError as e:
+        return {"status": "error", "reason": str(e)}
+    return entry.info()
+
+@app.get("/maps")
+def list_maps():
+    return {"maps": [entry.info() for entry in list(tenants.maps.values())], **tenants.stats()}
+
+@app.get("/maps/{map_id}")
+def get_map_info(map_id: str):
+    entry = tenants.get_map(map_id)
+    return entry.info() if entry is not None else not_found("map")
+
+@app.delete("/maps/{map_id}")
+def delete_map(map_id: str):
+    if map_id == DEFAULT_ID:
+        return {"status": "error", "reason": "default map cannot be deleted"}
+    return {"status": "deleted"} if tenants.delete_map(map_id) else not_found("map")
+
+def snapshot_path(name: str) -> str:
+    # 只允许简单文件名，避免路径穿越
+    if not re.fullmatch(r"[A-Za-z0-9_\-]+", name):
+        raise ValueError(f"invalid snapshot name: {name}")
+    return os.path.join(MAP_DIR, f"{name}.orionmap")
+
+@app.post("/maps/{map_id}/save")
+def save_map_snapshot(map_id: str, name: Optional[str] = None):
+    # ✅ 保存为二进制快照（CSR 数组原样写入，加载时可直接内存映射）
+    gmap = get_gmap(map_id)
+    if gmap is None:
+        return not_found("map")
+    try:
+        path = snapshot_path(name or map_id)
+    except ValueError as e:
+        return {"status": "error", "reason": str(e)}
+    os.makedirs(MAP_DIR, exist_ok=True)
+    save_map(gmap, path)
+    return {"status": "ok", "name": name or map_id, "version": gmap.version, "bytes": os.path.getsize(path)}
+
+@app.post("/maps/load")
+def load_map_snapshot(req: LoadMapRequest):
+    try:
+        path = snapshot_path(req.name)
+        if not os.path.exists(path):
+            return not_found("snapshot")
+        header = read_header(path)
+        tenants.check_size(header["width"], header["height"])
+        entry = tenants.add_map(load_map(path, mmap=req.mmap), map_id=req.map_id)
+    except ValueError as e:
+        return {"status": "error", "reason": str(e)}
+    return entry.info()
+
+@app.get("/maps/{map_id}/snapshot")
+def download_map_snapshot(map_id: str):
+    gmap = get_gmap(map_id)
+    if gmap is None:
+        return not_found("map")
+    buffer = io.BytesIO()
+    save_map(gmap, buffer)
+    return Response(buffer.getvalue(), media_type="application/octet-stream",
+                    headers={"Content-Disposition": f'attachment; filename="{map_id}.orionmap"'})
+
+@app.post("/sessions")
+def create_session(req: SessionRequest):
+    try:
+        session = tenants.create_session(req.map_id, base_time=req.base_time, session_id=req.session_id)
+    except ValueError as e:
+        return {"status": "error", "reason": str(e)}
+    return session.info()
+
+@app.get("/sessions/{session_id}")
+def get_session_info(session_id: str):
+    session = tenants.get_session(session_id)
+    return session.info() if session is not None else not_found("session")
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    if session_id == DEFAULT_ID:
+        return {"status": "error", "reason": "default session cannot be deleted"}
+    return {"status": "deleted"} if tenants.delete_session(session_id) else not_found("session")
+
+@app.post("/maps/evict")
+def evict_maps():
+    # ✅ 删除闲置地图，内存超限时清空最久未用地图的缓存和收缩层次
+    return {**tenants.evict(), **tenants.stats()}
+
 # ===============================
-# ✅ 地图相关接口
+# ✅ 地图相关接口（map_id 默认为 default 地图）
 # ===============================
 @app.get("/map/nodes")
-def get_nodes():
-    return gmap.get_nodes()
+def get_nodes(map_id: str = DEFAULT_ID):
+    gmap = get_gmap(map_id)
+    return gmap.get_nodes() if gmap is not None else not_found("map")
 
 @app.get("/map/edges")
-def get_edges():
-    return gmap.get_edges()
+def get_edges(request: Request, map_id: str = DEFAULT_ID, format: str = "records"):
+    """
+    format=records：逐条 {from, to, weight, blocked}（默认，兼容前端）；
+    format=columnar：列式数组，节点为 id（x = id % width, y = id // width），体积小得多。
+    响应带 ETag（地图 + 版本），地图未修改时对 If-None-Match 返回 304。
+    """
+    entry = tenants.get_map(map_id)
+    if entry is None:
+        return not_found("map")
+    if format not in ("records", "columnar"):
+        return {"status": "error", "reason": f"unknown format: {format}"}
+    snapshot = entry.gmap.snapshot()
+    etag = entry.etag(snapshot.version, format)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    body = snapshot.edges() if format == "records" else snapshot.edges_columnar()
+    return JSONResponse(body, headers={"ETag": etag})
+
+@app.get("/map/changes")
+def get_map_changes(since: int, map_id: str = DEFAULT_ID, tag: Optional[str] = None):
+    """
+    since 版本之后改动过的边（只含这些边的当前状态），前端据此增量更新边表。
+    tag 为上次响应中的 tag：地图被删除重建后 tag 不同，返回 reset，需要重新获取 /map/edges。
+    """
+    entry = tenants.get_map(map_id)
+    if entry is None:
+        return not_found("map")
+    changes = entry.gmap.changes_since(since)
+    if tag is not None and tag != entry.tag:
+        changes.update(reset=True, edges=[])
+    changes["tag"] = entry.tag
+    return changes
 
 @app.post("/block-edge")
-def block_edge(req: EdgeRequest):
+def block_edge(req: EdgeRequest, map_id: str = DEFAULT_ID):
+    gmap = get_gmap(map_id)
+    if gmap is None:
+        return not_found("map")
     return gmap.toggle_block_edge(req.from_node, req.to_node)
 
 @app.post("/set-weight")
-def set_edge_weight(req: WeightRequest):
+def set_edge_weight(req: WeightRequest, map_id: str = DEFAULT_ID):
+    gmap = get_gmap(map_id)
+    if gmap is None:
+        return not_found("map")
     return gmap.set_edge_weight(req.from_node, req.to_node, req.weight)
 
+@app.post("/map/hierarchy")
+def build_hierarchy(map_id: str = DEFAULT_ID):
+    gmap = get_gmap(map_id)
+    if gmap is None:
+        return not_found("map")
+    # ✅ 预处理收缩层次，之后的点到点查询和距离矩阵由它回答
+    start_time = time.time()
+    ch = gmap.build_hierarchy()
+    return {"status": "ok", "arcs": ch.num_arcs, "elapsed": round(time.time() - start_time, 3)}
+
 @app.get("/shortest-path")
-def get_shortest_path(from_: str = Query(..., alias="from"), to: str = Query(...)):
+def get_shortest_path(from_: str = Query(..., alias="from"), to: str = Query(...),
+                      method: str = "astar", map_id: str = DEFAULT_ID):
+    gmap = get_gmap(map_id)
+    if gmap is None:
+        return not_found("map")
     try:
         from_node = tuple(map(int, from_.split(",")))
         to_node = tuple(map(int, to.split(",")))
 
-        # ✅ 使用 networkx 提供的最短路径方法
-        effective_graph = gmap.get_effective_graph()
-        path = nx.dijkstra_path(effective_graph, source=from_node, target=to_node, weight="weight")
-        total_time = nx.dijkstra_path_length(effective_graph, source=from_node, target=to_node, weight="weight")
-
-
+        # ✅ 在 CSR 数组上一次搜索同时得到路径和耗时（默认 A*）
+        path, total_time = gmap.shortest_path(from_node, to_node, method=method)
         return {
             "path": path,
-            "total_time": round(total_time, 2)
+            "total_time": round(total_time, 2) if path else float("inf")
         }
-    except nx.NetworkXNoPath:
-        return {"path": [], "total_time": float("inf")}
     except Exception as e:
         return {"error": str(e)}
 
 # ===============================
-# ✅ 送货点接口
+# ✅ 送货点接口（session_id 默认为 default 会话）
 # ===============================
 @app.post("/add-delivery")
-def add_delivery(data: DeliveryInput):
+def add_delivery(data: DeliveryInput, session_id: str = DEFAULT_ID):
+    delivery_manager = get_deliveries(session_id)
+    if delivery_manager is None:
+        return not_found("session")
     location = tuple(data.location)
     time_window = tuple(data.time_window)
     delivery_manager.add_delivery(location, time_window)
     return {"status": "ok"}
 
+async def read_delivery_items(request: Request):
+    """
+    读取批量送货点：请求体为 JSON 数组，或 NDJSON（Content-Type: application/x-ndjson，
+    每行一个 {"location": [x, y], "time_window": ["08:30", "09:00"]}，边接收边解析）。
+    格式错误或时间不是合法的 "HH:MM" 时抛出 ValueError（指出第几条）。
+    """
+    def parse(i, item):
+        try:
+            location = tuple(int(v) for v in item["location"])
+            time_window = tuple(str(t) for t in item["time_window"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"invalid delivery #{i + 1}: {item}")
+        if len(location) != 2 or len(time_window) != 2:
+            raise ValueError(f"invalid delivery #{i + 1}: {item}")
+        for t in time_window:
+            if not valid_time(t):
+                raise ValueError(f"invalid time in delivery #{i + 1}: {t!r}")
+        return location, time_window
+
+    items = []
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    items.append(parse(len(items), json.loads(line)))
+        if buffer.strip():
+            items.append(parse(len(items), json.loads(buffer)))
+    else:
+        data = json.loads(await request.body() or b"[]")
+        if not isinstance(data, list):
+            raise ValueError("request body must be a JSON array")
+        items = [parse(i, item) for i, item in enumerate(data)]
+    return items
+
+@app.post("/deliveries/bulk")
+async def add_deliveries_bulk(request: Request, session_id: str = DEFAULT_ID, replace: bool = False):
+    delivery_manager = get_deliveries(session_id)
+    if delivery_manager is None:
+        return not_found("session")
+    try:
+        items = await read_delivery_items(request)
+    except ValueError as e:  # json.JSONDecodeError 也是 ValueError
+        return {"status": "error", "reason": str(e)}
+    # ✅ 全部解析成功后一次性发布，失败时不会留下一半的送货点
+    counts = delivery_manager.upsert_deliveries(items, replace=replace)
+    return {"status": "ok", **counts}
+
 @app.post("/remove-delivery")
-def remove_delivery(data: LocationInput):
+def remove_delivery(data: LocationInput, session_id: str = DEFAULT_ID):
+    delivery_manager = get_deliveries(session_id)
+    if delivery_manager is None:
+        return not_found("session")
     location = tuple(data.location)
     delivery_manager.remove_delivery(location)
     return {"status": "ok"}
 
 @app.post("/clear-deliveries")
-def clear_deliveries():
+def clear_deliveries(session_id: str = DEFAULT_ID):
+    delivery_manager = get_deliveries(session_id)
+    if delivery_manager is None:
+        return not_found("session")
     delivery_manager.clear_all()
     return {"status": "cleared"}
 
 @app.get("/deliveries")
-def get_deliveries():
+def list_deliveries(session_id: str = DEFAULT_ID):
+    delivery_manager = get_deliveries(session_id)
+    if delivery_manager is None:
+        return not_found("session")
     return delivery_manager.to_dict_list()
 
 @app.post("/base-time")
-def set_base_time(data: BaseTimeRequest):
+def set_base_time(data: BaseTimeRequest, session_id: str = DEFAULT_ID):
+    delivery_manager = get_deliveries(session_id)
+    if delivery_manager is None:
+        return not_found("session")
     delivery_manager.set_base_time(data.base_time)
     return {"status": "ok"}
 
 @app.get("/base-time")
-def get_base_time():
+def get_base_time(session_id: str = DEFAULT_ID):
+    delivery_manager = get_deliveries(session_id)
+    if delivery_manager is None:
+        return not_found("session")
     return {"base_time": delivery_manager.get_base_time()}
 
 # ===============================
 # ✅ 路径规划接口
 # ===============================
-@app.post("/compute-plan")
-def compute_plan(start: Tuple[int, int] = (0, 0)):
-    deliveries = delivery_manager.get_all()
+def submit_plan(start: Tuple[int, int], solver: str, time_budget: Optional[float],
+                workers: Optional[int], session_id: str = DEFAULT_ID, vehicles: int = 1,
+                incremental: bool = True, legs: bool = False):
+    """
+    在会话的地图上计算距离矩阵并提交后台规划任务，参数不合法时抛出 ValueError。
+    vehicles > 1（多车）只有 cluster 求解器支持。
+    incremental 为 True 且送货点相比会话的上次规划只有少量增删时，在上次路线上增量修复，
+    修复结果作为求解器的初始上界（solver=incremental 时直接返回修复结果）。
+    legs 为 True 时距离矩阵保留最短路径树中的前驱，结果中带上每一段的逐节点路径
+    （默认关闭：前驱数组与距离矩阵同样大小，只有需要画出路线的调用方才请求）。
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"unknown solver: {solver}")
+    if vehicles < 1 or (vehicles > 1 and solver != "cluster"):
+        raise ValueError("multiple vehicles require solver=cluster")
+    options = {"vehicles": vehicles} if solver == "cluster" else {}
+    session = tenants.get_session(session_id)
+    gmap = get_gmap(session.map_id) if session is not None else None
+    if gmap is None:
+        raise ValueError(f"session {session_id} not found")
+    # ✅ 读取当前版本的送货点快照，距离矩阵和求解使用同一份数据
+    snapshot = session.deliveries.snapshot()
+    deliveries = list(snapshot.deliveries)
+    warm_start = session.warm_start(start, snapshot) if incremental and vehicles == 1 else None
+    if warm_start is not None:
+        options["warm_start"] = warm_start
     key_points = [start] + [d.location for d in deliveries]
-    matrix = compute_distance_matrix(gmap, key_points)
+    matrix = compute_distance_matrix(gmap, key_points, dense=True, paths=legs)
+    job = plan_jobs.submit(start, deliveries, matrix, solver=solver,
+                           time_budget=time_budget, workers=workers, **options)
 
-    print("\n====== 🧪 路径调试信息 ======")
-    print(f"起点：{start}")
-    print("送货点：")
-    for i, d in enumerate(deliveries):
-        print(f"  {i+1}. {d.location} 时间窗 = [{d.earliest}, {d.latest}]")
+    def remember(future):
+        if not future.cancelled() and future.exception() is None:
+            session.remember_plan(start, snapshot.base, future.result())
+    job.future.add_done_callback(remember)
+    return job, matrix
 
-    print("\n距离矩阵：")
-    for (src, dst), dist in matrix.items():
-        print(f"  {src} → {dst} = {dist:.2f}")
+@app.post("/compute-plan")
+async def compute_plan(start: Tuple[int, int] = (0, 0), solver: str = "dfs",
+                       time_budget: Optional[float] = None, workers: Optional[int] = None,
+                       session_id: str = DEFAULT_ID, vehicles: int = 1, incremental: bool = True,
+                       legs: bool = False):
+    try:
+        # ✅ 距离矩阵是 CPU 密集的计算，放到线程池中，不阻塞事件循环上的其他请求
+        job, matrix = await run_in_threadpool(submit_plan, start, solver, time_budget, workers, session_id,
+                                              vehicles, incremental, legs)
+    except ValueError as e:
+        return {"status": "failed", "message": str(e)}
+    deliveries = job.deliveries
+    telemetry.trace("plan.submit", job_id=job.id, solver=solver, start=start, stops=len(deliveries),
+                    incremental=incremental)
+    if telemetry.enabled(telemetry.TRACE):
+        # 逐项的时间窗和 n² 个距离只在 TRACE 级别输出
+        telemetry.trace("plan.input", level=telemetry.TRACE, job_id=job.id,
+                        windows=[[d.location, d.earliest, d.latest] for d in deliveries],
+                        matrix=[[src, dst, dist] for (src, dst), dist in matrix.items()])
 
     # ✅ 开始计时
-    start_time = time.time()
+    start_time = time.perf_counter()
 
-    result = find_best_valid_path(start, deliveries, matrix)
+    # ✅ 求解器在进程池中运行，等待期间事件循环可以处理其他请求
+    try:
+        result = await asyncio.wrap_future(job.future)
+    except (ValueError, RuntimeError) as e:
+        return {"status": "failed", "message": str(e)}
+    except asyncio.CancelledError:
+        # 排队中的任务被 /plan-jobs/{job_id}/cancel 撤销；请求本身被取消（客户端断开）时照常抛出
+        if not job.future.cancelled():
+            raise
+        telemetry.trace("plan.cancelled", job_id=job.id)
+        return {"status": "cancelled", "job_id": job.id, "message": "Job cancelled before it started"}
 
     # ✅ 结束计时
-    elapsed = time.time() - start_time
+    elapsed = time.perf_counter() - start_time
+    telemetry.trace("plan.done", job_id=job.id, found=bool(result), seconds=round(elapsed, 6),
+                    total_time=result["total_time"] if result else None)
 
     if not result:
-        print("❌ 没有可行路径！")
-        print(f"🕒 耗时：{elapsed:.2f} 秒")
         return {"status": "failed", "message": "No valid path found"}
 
-    print("\n✅ 可行路径：")
-    for i, d in enumerate(result["sequence"]):
-        time_str = d.format_minutes(result["arrival_times"][i])
-        print(f"  {i+1}. {d.location} 到达时间 = {time_str}")
-    print(f"🕒 总耗时：{result['total_time']} 分钟")
-    print(f"⏱️ 规划耗时（秒）：{elapsed:.6f}")
-    print("=====================================\n")
-
-    return {
-        "status": "success",
-        "sequence": [d.location for d in result["sequence"]],
-        "arrival_times": [
-            d.format_minutes(result["arrival_times"][i])
-            for i, d in enumerate(result["sequence"])
-        ],
-        "arrival_minutes": result["arrival_times"],
-        "total_time": result["total_time"]
-    }
\ No newline at end of file
+    return format_plan(result, job.legs)
+
+# ===============================
+# ✅ 后台规划任务接口
+# ===============================
+@app.post("/plan-jobs")
+def create_plan_job(start: Tuple[int, int] = (0, 0), solver: str = "dfs",
+                    time_budget: Optional[float] = None, workers: Optional[int] = None,
+                    session_id: str = DEFAULT_ID, vehicles: int = 1, incremental: bool = True,
+                    legs: bool = False):
+    try:
+        job, _ = submit_plan(start, solver, time_budget, workers, session_id, vehicles, incremental, legs)
+    except ValueError as e:
+        return {"status": "failed", "message": str(e)}
+    return job.snapshot()
+
+@app.get("/plan-jobs/{job_id}")
+def get_plan_job(job_id: str):
+    job = plan_jobs.get(job_id)
+    if job is None:
+        return {"status": "error", "reason": "job not found"}
+    info = job.snapshot()
+    if job.result:
+        info["result"] = format_plan(job.result, job.legs)
+    return info
+
+@app.post("/plan-jobs/{job_id}/cancel")
+def cancel_plan_job(job_id: str):
+    job = plan_jobs.cancel(job_id)
+    if job is None:
+        return {"status": "error", "reason": "job not found"}
+    return job.snapshot()
+
+def sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def poll_job(job, sent: int):
+    """
+    读取任务状态、第 sent 个之后的更优解和进度。进度和解保存在 Manager 共享对象中，
+    每次读取都是一次阻塞的进程间通信，由 stream_job 放到线程池中调用。
+    """
+    finished = job.finished  # 先读状态，保证结束前找到的解都已读到
+    return finished, job.solutions_since(sent), job.snapshot()
+
+async def stream_job(request: Request, job, cancel_on_disconnect: bool, poll_interval: float = 0.05):
+    """
+    以 Server-Sent Events 推送任务进展：
+    job（任务信息）→ 每个更优解 solution（路线、到达时间、总耗时、elapsed）与 progress → done（最终状态和结果）。
+    cancel_on_disconnect 为 True 时，客户端断开或不再读取（生成器被关闭 / 取消）都会取消任务。
+    """
+    stopped = False  # 已推送 done 或已取消任务
+    try:
+        info = await run_in_threadpool(job.snapshot)
+        yield sse("job", info)
+        sent = 0
+        last_progress = (info["nodes"], info["best_time"])
+        while True:
+            if await request.is_disconnected():
+                # 客户端提前断开：不再需要更优解，停止求解
+                if cancel_on_disconnect:
+                    await run_in_threadpool(plan_jobs.cancel, job.id)
+                stopped = True
+                return
+            # ✅ 进程间通信不在事件循环上进行，连接数多时也不阻塞其他请求
+            finished, solutions, info = await run_in_threadpool(poll_job, job, sent)
+            for solution in solutions:
+                sent += 1
+                yield sse("solution", solution)
+            if (info["nodes"], info["best_time"]) != last_progress:
+                last_progress = (info["nodes"], info["best_time"])
+                yield sse("progress", info)
+            if finished:
+                if job.result:
+                    info["result"] = format_plan(job.result, job.legs)
+                stopped = True
+                yield sse("done", info)
+                return
+            await asyncio.sleep(poll_interval)
+    finally:
+        if cancel_on_disconnect and not stopped:
+            # 响应在 yield / 等待处被关闭或取消，此时不能再等待线程池，直接发出取消信号
+            plan_jobs.cancel(job.id)
+
+@app.get("/plan-jobs/{job_id}/events")
+def plan_job_events(job_id: str, request: Request):
+    job = plan_jobs.get(job_id)
+    if job is None:
+        return {"status": "error", "reason": "job not found"}
+    return StreamingResponse(stream_job(request, job, cancel_on_disconnect=False),
+                             media_type="text/event-stream")
+
+@app.get("/compute-plan/stream")
+def compute_plan_stream(request: Request, start: str = "0,0", solver: str = "dfs",
+                        time_budget: Optional[float] = None, workers: Optional[int] = None,
+                        session_id: str = DEFAULT_ID, vehicles: int = 1, incremental: bool = True,
+                        legs: bool = False):
+    """
+    提交规划并立即开始推送更优解（anytime）：前端可以先显示第一个可行路线。
+    想提前结束时调用 /plan-jobs/{job_id}/cancel（收到 done 和目前最好的解）或直接断开连接。
+    """
+    try:
+        start_node = tuple(map(int, start.split(",")))
+        job, _ = submit_plan(start_node, solver, time_budget, workers, session_id, vehicles, incremental,
+                             legs)
+    except ValueError as e:
+        return {"status": "failed", "message": str(e)}
+    return StreamingResponse(stream_job(request, job, cancel_on_disconnect=True),
+                             media_type="text/event-stream")
+
+# ===============================
+# ✅ 监控指标接口
+# ===============================
+@app.get("/metrics")
+def metrics():
+    """Prometheus 文本格式：请求耗时、各阶段耗时直方图，求解器计数，地图 / 会话数和内存占用"""
+    stats = tenants.stats()
+    telemetry.MAPS.set(stats["num_maps"])
+    telemetry.SESSIONS.set(stats["num_sessions"])
+    telemetry.MAP_BYTES.set(stats["nbytes"])
+    return PlainTextResponse(telemetry.REGISTRY.render(), media_type="text/plain; version=0.0.4")
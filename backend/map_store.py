@@ -0,0 +1,102 @@
+import json
+import os
+import struct
+from typing import BinaryIO, Dict, Union
+
+import numpy as np
+
+from csr_graph import CSRGraph
+from graph_map import GraphMap
+
+# 文件格式：MAGIC | uint32 格式版本 | uint32 头部长度 | JSON 头部 | 按 ALIGN 对齐的原始数组
+# 头部记录地图尺寸、后端、版本号和每个数组的 dtype / shape / 相对数据区的偏移，
+# 数组可以直接用 np.memmap 映射，加载大地图不需要读入和解析整份文件。
+MAGIC = b"ORIONMAP"
+FORMAT_VERSION = 1
+ALIGN = 64
+ARRAYS = ("offsets", "targets", "weights", "blocked")
+
+
+def _padding(position: int) -> int:
+    return -position % ALIGN
+
+
+def save_map(gmap: GraphMap, target: Union[str, BinaryIO]):
+    """
+    把地图当前版本的快照保存为二进制文件（或写入二进制文件对象）。
+    写文件时先写临时文件再替换，读者不会看到写了一半的文件。
+    """
+    if isinstance(target, (str, os.PathLike)):
+        tmp = f"{target}.tmp"
+        with open(tmp, "wb") as f:
+            save_map(gmap, f)
+        os.replace(tmp, target)
+        return
+
+    snapshot = gmap.snapshot()
+    csr = snapshot.csr
+    arrays = {name: np.ascontiguousarray(getattr(csr, name)) for name in ARRAYS}
+    # CSR 中不存在的边也可能被标记为封路（只影响前端显示），单独记录
+    extra_blocked = [[list(u), list(v)] for u, v in snapshot.blocked_edges if csr.edge_index(u, v) < 0]
+    header = {
+        "width": csr.width,
+        "height": csr.height,
+        "backend": gmap.backend,
+        "version": snapshot.version,
+        "extra_blocked": extra_blocked,
+        "arrays": {},
+    }
+    # 数组偏移相对于数据区起点（头部之后按 ALIGN 对齐的位置）
+    position = 0
+    for name, array in arrays.items():
+        position += _padding(position)
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": position}
+        position += array.nbytes
+    encoded = json.dumps(header).encode("utf-8")
+
+    target.write(MAGIC + struct.pack("<II", FORMAT_VERSION, len(encoded)) + encoded)
+    target.write(b"\0" * _padding(len(MAGIC) + 8 + len(encoded)))
+    position = 0
+    for name, array in arrays.items():
+        pad = header["arrays"][name]["offset"] - position
+        target.write(b"\0" * pad)
+        target.write(array.tobytes())
+        position += pad + array.nbytes
+
+
+def read_header(path: str) -> Dict:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a map snapshot")
+        version, length = struct.unpack("<II", f.read(8))
+        if version != FORMAT_VERSION:
+            raise ValueError(f"unsupported map snapshot format: {version}")
+        header = json.loads(f.read(length))
+    header["data_offset"] = len(MAGIC) + 8 + length + _padding(len(MAGIC) + 8 + length)
+    return header
+
+
+def load_map(path: str, mmap: bool = True) -> GraphMap:
+    """
+    从二进制文件加载地图。mmap=True 时数组以只读方式映射文件（按需分页读入，
+    多个进程加载同一文件时共享物理内存）；之后的封路 / 改耗时在写时复制的副本上进行，不会修改文件。
+    """
+    header = read_header(path)
+    arrays = {}
+    for name in ARRAYS:
+        spec = header["arrays"][name]
+        dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+        offset = header["data_offset"] + spec["offset"]
+        if mmap and int(np.prod(shape)) > 0:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+        else:
+            arrays[name] = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)),
+                                       offset=offset).reshape(shape)
+    csr = CSRGraph(header["width"], header["height"], arrays["offsets"], arrays["targets"],
+                   arrays["weights"], arrays["blocked"])
+    blocked_edges = {(csr.node_xy(u), csr.node_xy(v))
+                     for u, v in zip(csr.edge_sources()[csr.blocked].tolist(),
+                                     csr.targets[csr.blocked].tolist())}
+    blocked_edges.update((tuple(u), tuple(v)) for u, v in header["extra_blocked"])
+    return GraphMap.from_csr(csr, backend=header["backend"], blocked_edges=blocked_edges,
+                             version=header["version"])
@@ -0,0 +1,144 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+from branch_bound import BranchAndBound
+from delivery import Delivery
+from route_problem import RouteProblem
+from search_monitor import SearchMonitor
+
+# 工作进程内的全局状态，由 _init_worker 设置
+_worker_problem: Optional[RouteProblem] = None
+_worker_bound = "mst"
+_shared_best = None
+
+
+def _init_worker(problem: RouteProblem, bound: str, shared_best):
+    global _worker_problem, _worker_bound, _shared_best
+    _worker_problem = problem
+    _worker_bound = bound
+    _shared_best = shared_best
+
+
+def _publish(total_time, order, arrival_times):
+    """把更优解的耗时写入共享上界，供其他进程剪枝。"""
+    with _shared_best.get_lock():
+        if total_time < _shared_best.value:
+            _shared_best.value = total_time
+
+
+def _search_prefix(prefix: Tuple[int, ...]):
+    """
+    在工作进程中搜索以 prefix 开头的子树，
+    返回 ((总耗时, 顺序, 到达时间) 或 None, 搜索统计)。
+    """
+    search = BranchAndBound(_worker_problem, _worker_bound,
+                            best_time=_shared_best.value,
+                            external_best=lambda: _shared_best.value,
+                            on_improve=_publish)
+    search.search(prefix)
+    if search.best_order is None:
+        return None, search.stats()
+    return (search.best_time, search.best_order, search.best_arrival_times), search.stats()
+
+
+def split_prefixes(search: BranchAndBound, depth: int) -> List[Tuple[int, ...]]:
+    """
+    按搜索顺序枚举长度为 depth 的可行前缀（超出时间窗或下界不优的前缀直接丢弃），
+    并按下界从小到大排序，让更有希望的子树先被搜索。
+    """
+    problem = search.problem
+    depth = min(depth, problem.n)
+    bounded = []
+    stack = [()]
+    while stack:
+        prefix = stack.pop()
+        if len(prefix) == depth:
+            state = search.prefix_state(prefix)
+            for i in prefix:
+                search.lower_bound.visit(i)
+            estimate = search.lower_bound.estimate(state[0], state[1])
+            for i in prefix:
+                search.lower_bound.unvisit(i)
+            if estimate < search.best_time:
+                bounded.append((estimate, prefix))
+            continue
+        for i in search.search_order:
+            if i not in prefix and search.prefix_state(prefix + (i,)) is not None:
+                stack.append(prefix + (i,))
+    bounded.sort()
+    return [prefix for _, prefix in bounded]
+
+
+def solve_parallel(
+    start: Tuple[int, int],
+    deliveries: List[Delivery],
+    distance_matrix: Dict[Tuple, float],
+    start_time: int = 0,
+    incumbent: Optional[Dict] = None,
+    workers: Optional[int] = None,
+    split_depth: int = 2,
+    bound: str = "mst",
+    monitor: Optional[SearchMonitor] = None,
+    poll_interval: float = 0.2,
+    stats: Optional[Dict] = None
+) -> Optional[Dict]:
+    """
+    并行分支定界：按前 split_depth 个送货点把搜索树切分成子树，
+    交给 ProcessPoolExecutor 的多个进程搜索。各进程通过共享内存中的
+    multiprocessing.Value 共享当前最优耗时，使剪枝在进程之间依然有效。
+
+    :param incumbent: 已知可行解（如贪心结果），用作初始上界
+    :param workers: 进程数，默认为 CPU 核数
+    :param monitor: 每 poll_interval 秒报告进度；取消时把共享上界设为 -inf，
+                    让所有进程立即剪掉剩余分支
+    :param stats: 传入字典时累加各进程的搜索统计（见 BranchAndBound.stats）
+    :return: 与 find_best_valid_path 相同格式的结果；无可行解时返回 incumbent
+    """
+    problem = RouteProblem(start, deliveries, distance_matrix, start_time)
+    search = BranchAndBound(problem, bound)
+    if incumbent:
+        index = {id(d): i for i, d in enumerate(deliveries)}
+        search.best_time = incumbent["total_time"]
+        search.best_order = [index[id(d)] for d in incumbent["sequence"]]
+        search.best_arrival_times = list(incumbent["arrival_times"])
+
+    totals = search.stats()
+    if stats is not None:
+        stats.update(totals)
+    if problem.n == 0:
+        search.search()
+        return search.result()
+    prefixes = split_prefixes(search, split_depth)
+    if not prefixes:
+        return search.result()
+
+    shared_best = multiprocessing.Value("d", search.best_time)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, len(prefixes)),
+                             initializer=_init_worker,
+                             initargs=(problem, bound, shared_best)) as pool:
+        pending = {pool.submit(_search_prefix, prefix) for prefix in prefixes}
+        while pending:
+            done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled():
+                    continue
+                found, searched = future.result()
+                for key, value in searched.items():
+                    totals[key] += value
+                if stats is not None:
+                    stats.update(totals)
+                if found is not None and found[0] < search.best_time:
+                    search.best_time, search.best_order, search.best_arrival_times = found
+                    if monitor is not None:
+                        monitor.on_improve(search.result())
+            if monitor is not None:
+                monitor.on_progress(totals["nodes"], search.best_time)
+                if pending and monitor.should_stop():
+                    with shared_best.get_lock():
+                        shared_best.value = float("-inf")
+                    for future in pending:
+                        future.cancel()
+    return search.result()
@@ -0,0 +1,257 @@
+import itertools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import telemetry
+from delivery import Delivery, format_times
+from planner import plan_route
+from search_monitor import SearchMonitor
+
+# 保留的已结束任务数，超出后丢弃最早结束的任务
+MAX_FINISHED_JOBS = 100
+
+
+def format_plan(result: Dict, legs: Optional[List] = None) -> Dict:
+    """
+    把规划结果转换为 JSON 友好的格式（多车结果每辆车一条路线）。
+    legs 为 route_legs() 得到的逐节点路径，给出时一并返回。
+    """
+    if "routes" in result:
+        return {
+            "status": "success",
+            "routes": [format_plan(route, route_legs) for route, route_legs
+                       in zip(result["routes"], legs or [None] * len(result["routes"]))],
+            "unassigned": [d.location for d in result["unassigned"]],
+            "total_time": result["total_time"]
+        }
+    sequence = result["sequence"]
+    # 同一次规划的送货点出发时间相同，整条路线的到达时间一次格式化
+    base = sequence[0].base if sequence else 0
+    plan = {
+        "status": "success",
+        "sequence": [d.location for d in sequence],
+        "arrival_times": format_times(result["arrival_times"], base),
+        "arrival_minutes": result["arrival_times"],
+        "total_time": result["total_time"]
+    }
+    if legs is not None:
+        plan["legs"] = legs
+    return plan
+
+
+def route_legs(distance_matrix, start: Tuple[int, int], result: Dict) -> List:
+    """
+    从距离矩阵保存的路径（compute_distance_matrix(paths=True)）取出路线每一段的逐节点路径：
+    起点 → 第一个送货点 → …，每段为坐标列表（含两端）；多车结果每辆车一个列表。
+    """
+    if "routes" in result:
+        return [route_legs(distance_matrix, start, route) for route in result["routes"]]
+    return distance_matrix.legs(start, [d.location for d in result["sequence"]])
+
+
+class _SharedMonitor(SearchMonitor):
+    """
+    运行在工作进程中的 monitor：进度写入 Manager 共享字典（按 interval 秒节流），
+    每个更优解追加到共享列表 solutions，取消信号来自 Manager 共享 Event。
+    """
+
+    def __init__(self, progress, solutions, cancel_event, interval: float = 0.2):
+        self.progress = progress
+        self.solutions = solutions
+        self.cancel_event = cancel_event
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.best_time = float("inf")
+        self._next_report = 0.0
+        self._next_check = 0.0
+        self._cancelled = False
+
+    def should_stop(self) -> bool:
+        # 读取 Event 需要一次进程间通信，求解器内层循环会频繁调用，因此同样节流
+        if not self._cancelled:
+            now = time.monotonic()
+            if now >= self._next_check:
+                self._next_check = now + self.interval / 4
+                self._cancelled = self.cancel_event.is_set()
+        return self._cancelled
+
+    def on_progress(self, nodes: int, best_time: float):
+        now = time.monotonic()
+        if now >= self._next_report:
+            self._next_report = now + self.interval
+            self.progress.update(nodes=nodes, best_time=_finite(min(best_time, self.best_time)))
+
+    def on_improve(self, result: Dict):
+        if result["total_time"] >= self.best_time:
+            return
+        self.best_time = result["total_time"]
+        solution = format_plan(result)
+        solution["elapsed"] = round(time.perf_counter() - self.started, 6)
+        self.solutions.append(solution)
+        self.progress.update(best_time=self.best_time, improvements=len(self.solutions))
+
+
+def _finite(value: float) -> Optional[float]:
+    return None if value == float("inf") else value
+
+
+def _run_plan(start, deliveries, distance_matrix, start_time, options, progress, solutions, cancel_event):
+    """
+    工作进程入口：运行 plan_route，进度和取消通过共享对象与主进程交互。
+    求解器统计写入 progress["stats"]，由主进程记入指标（工作进程里的指标不会被 /metrics 看到）。
+    """
+    progress["status"] = "running"
+    progress["started_at"] = time.time()
+    monitor = _SharedMonitor(progress, solutions, cancel_event)
+    stats = {}
+    try:
+        result = plan_route(start, deliveries, distance_matrix, start_time, monitor=monitor,
+                            stats=stats, **options)
+    finally:
+        progress["stats"] = stats
+    progress["cancelled"] = cancel_event.is_set()
+    return result
+
+
+class PlanJob:
+    """一次后台规划任务：状态、进度、依次找到的更优解（solutions）和最终结果。"""
+
+    def __init__(self, job_id: str, deliveries: List[Delivery], progress, solutions, cancel_event,
+                 solver: str = "dfs"):
+        self.id = job_id
+        self.solver = solver
+        self.deliveries = deliveries
+        self.progress = progress
+        self.solutions = solutions
+        self.cancel_event = cancel_event
+        self.future: Optional[Future] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict] = None
+        self.legs: Optional[List] = None
+        self.error: Optional[str] = None
+        self.status = "queued"
+
+    def snapshot(self) -> Dict:
+        """当前状态和进度（不含结果）。"""
+        progress = dict(self.progress)
+        status = self.status
+        if status == "queued" and progress.get("status") == "running":
+            status = "running"
+        return {
+            "job_id": self.id,
+            "status": status,
+            "nodes": progress.get("nodes", 0),
+            "best_time": progress.get("best_time"),
+            "improvements": progress.get("improvements", 0),
+            "stats": progress.get("stats"),
+            "created_at": self.created_at,
+            "started_at": progress.get("started_at"),
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def solutions_since(self, index: int) -> List[Dict]:
+        """第 index 个之后找到的更优解（按找到的顺序，耗时递减）。"""
+        return list(self.solutions[index:])
+
+
+class PlanJobManager:
+    """
+    后台规划任务队列：任务在 ProcessPoolExecutor 中运行，不占用 API 进程的 CPU，
+    进度（搜索节点数、当前最优耗时）和取消信号通过 multiprocessing.Manager 共享。
+    进程池和 Manager 在第一次提交任务时才创建。
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers
+        self.jobs: Dict[str, PlanJob] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+
+    def _ensure_started(self):
+        if self._pool is None:
+            self._manager = multiprocessing.Manager()
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def submit(self, start: Tuple[int, int], deliveries: List[Delivery], distance_matrix,
+               start_time: int = 0, **options) -> PlanJob:
+        """
+        提交规划任务，立即返回 PlanJob。options 原样传给 plan_route
+        （solver / time_budget / workers / bound 等）。
+        """
+        with self._lock:
+            self._ensure_started()
+            job_id = f"job-{next(self._ids)}"
+            job = PlanJob(job_id, list(deliveries), self._manager.dict(), self._manager.list(),
+                          self._manager.Event(), solver=options.get("solver", "dfs"))
+            self.jobs[job_id] = job
+            self._evict_finished()
+        job.future = self._pool.submit(_run_plan, start, job.deliveries, distance_matrix, start_time,
+                                       options, job.progress, job.solutions, job.cancel_event)
+        # 距离矩阵带有路径时（只留在本进程，不传给求解进程），任务结束后取出最终路线的逐节点路径
+        paths = distance_matrix if getattr(distance_matrix, "paths", None) is not None else None
+        job.future.add_done_callback(lambda future: self._finish(job, future, start, paths))
+        return job
+
+    def _finish(self, job: PlanJob, future: Future, start: Tuple[int, int] = (0, 0), paths=None):
+        try:
+            job.result = future.result()
+            if job.result and paths is not None:
+                job.legs = route_legs(paths, start, job.result)
+            if job.progress.get("cancelled"):
+                job.status = "cancelled"
+            else:
+                job.status = "done" if job.result else "failed"
+                if not job.result:
+                    job.error = "No valid path found"
+        except CancelledError:
+            job.status = "cancelled"
+        except Exception as e:  # 求解器异常（如状态数超限）记录到任务中
+            job.status = "failed"
+            job.error = str(e)
+        job.finished_at = time.time()
+        try:
+            stats = dict(job.progress.get("stats") or {})
+        except Exception:  # Manager 已关闭（服务退出时）
+            stats = {}
+        stats.setdefault("solver", job.solver)
+        telemetry.record_plan(stats, job.status)
+
+    def _evict_finished(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[PlanJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[PlanJob]:
+        """取消任务：排队中的直接撤销，运行中的通知求解器停止（保留已找到的最好解）。"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        if job.future is not None:
+            job.future.cancel()
+        return job
+
+    def shutdown(self):
+        with self._lock:
+            for job in self.jobs.values():
+                job.cancel_event.set()
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._manager.shutdown()
+                self._pool = None
+                self._manager = None
@@ -1,41 +1,37 @@
-from typing import List, Tuple, Dict
+import time
+from typing import List, Sequence, Tuple, Dict, Optional
 from delivery import Delivery
-import copy
-
-def estimate_remaining_cost(current_point, deliveries, visited, distance_matrix):
-    """
-    估算当前点到所有未访问点的最小路径耗时总和（用于启发剪枝）
-    """
-    remaining = 0
-    for i, d in enumerate(deliveries):
-        if not visited[i]:
-            dist = distance_matrix.get((current_point, d.location), float("inf"))
-            remaining += dist
-    return remaining
-
-def construct_greedy_path(start, deliveries, distance_matrix, start_time):
+from branch_bound import BranchAndBound
+from dp_solver import solve_held_karp
+from heuristic_solver import repair_order, solve_heuristic
+from parallel_solver import solve_parallel
+from route_problem import RouteProblem
+from search_monitor import SearchMonitor
+
+def greedy_order(problem: RouteProblem):
     """
-    使用贪心策略构造一个初始可行路径，返回其耗时和到达时间列表
+    使用贪心策略（每次去最早可以开始服务的点）构造一个初始可行路径，
+    返回 (总耗时, 送货点下标顺序, 到达时间列表)，没有合法路径时返回 None
     """
-    visited = [False] * len(deliveries)
-    path = []
+    n = problem.n
+    dist, earliest, latest = problem.dist, problem.earliest, problem.latest
+    visited = [False] * n
+    order = []
     arrival_times = []
-    current = start
-    time = start_time
+    current = 0
+    time = problem.start_time
 
-    for _ in range(len(deliveries)):
+    for _ in range(n):
         best_idx = -1
         best_score = float("inf")
-        for i, d in enumerate(deliveries):
+        row = dist[current]
+        for i in range(n):
             if visited[i]:
                 continue
-            dist = distance_matrix.get((current, d.location), float("inf"))
-            if dist == float("inf"):
-                continue
-            arrive = time + dist
-            if arrive > d.latest:
+            arrive = time + row[i + 1]
+            if arrive > latest[i + 1]:
                 continue
-            wait = max(arrive, d.earliest)
+            wait = max(arrive, earliest[i + 1])
             if wait < best_score:
                 best_score = wait
                 best_idx = i
@@ -44,85 +40,190 @@ def construct_greedy_path(start, deliveries, distance_matrix, start_time):
             return None  # 没有合法路径
 
         visited[best_idx] = True
-        path.append(deliveries[best_idx])
+        order.append(best_idx)
         arrival_times.append(best_score)
-        current = deliveries[best_idx].location
+        current = best_idx + 1
         time = best_score
 
-    return time, path, arrival_times
+    return time, order, arrival_times
+
+def construct_greedy_path(start, deliveries, distance_matrix, start_time):
+    """
+    使用贪心策略构造一个初始可行路径，返回其耗时、路径和到达时间列表
+    """
+    result = greedy_order(RouteProblem(start, deliveries, distance_matrix, start_time))
+    if result is None:
+        return None
+    time, order, arrival_times = result
+    return time, [deliveries[i] for i in order], arrival_times
 
 def find_best_valid_path(
     start: Tuple[int, int],
     deliveries: List[Delivery],
     distance_matrix: Dict[Tuple, float],
-    start_time: int = 0
+    start_time: int = 0,
+    bound: str = "mst",
+    monitor: Optional[SearchMonitor] = None,
+    stats: Optional[Dict] = None,
+    incumbent: Optional[Dict] = None
 ) -> Dict:
+    """
+    深度优先搜索所有访问顺序，用贪心解作为初始上界，并用可插拔的下界剪枝。
+    搜索只在下标和扁平数组上进行，最优解的 Delivery 对象在最后才还原。
 
-    n = len(deliveries)
-    best_path = None
-    best_time = float("inf")
-    best_arrival_times = []
+    :param bound: 下界类型，见 bounds.BOUNDS（"min_edge" / "mst"）
+    :param monitor: 报告进度和每个更优解，可提前停止（返回已找到的最好解）
+    :param stats: 传入字典时填写搜索统计（见 BranchAndBound.stats）和各阶段耗时 stages
+    :param incumbent: 已知可行解（如增量修复的上次路线），比贪心解好时用作初始上界
+    """
+    problem = RouteProblem(start, deliveries, distance_matrix, start_time)
+    search = BranchAndBound(problem, bound)
 
     # ✅ 使用贪心初始化 best_time
-    greedy_result = construct_greedy_path(start, deliveries, distance_matrix, start_time)
+    started = time.perf_counter()
+    greedy_result = greedy_order(problem)
+    greedy_seconds = time.perf_counter() - started
+    if incumbent and (not greedy_result or incumbent["total_time"] < greedy_result[0]):
+        index = {id(d): i for i, d in enumerate(deliveries)}
+        greedy_result = (incumbent["total_time"], [index[id(d)] for d in incumbent["sequence"]],
+                         list(incumbent["arrival_times"]))
     if greedy_result:
-        best_time, best_path, best_arrival_times = greedy_result
-        best_path = copy.deepcopy(best_path)
-        best_arrival_times = copy.deepcopy(best_arrival_times)
-
-    # ✅ 按 earliest 时间 + 距离排序
-    sorted_indices = sorted(
-        range(n),
-        key=lambda i: (deliveries[i].earliest, distance_matrix.get((start, deliveries[i].location), float("inf")))
-    )
-    sorted_deliveries = [deliveries[i] for i in sorted_indices]
-
-    def dfs(current_point, visited, path, current_time, arrival_times, depth):
-        nonlocal best_path, best_time, best_arrival_times
-
-        if depth == n:
-            if current_time < best_time:
-                best_time = current_time
-                best_path = copy.deepcopy(path)
-                best_arrival_times = copy.deepcopy(arrival_times)
-            return
-
-        for i, delivery in enumerate(sorted_deliveries):
-            if visited[i]:
-                continue
+        search.best_time, search.best_order, search.best_arrival_times = greedy_result
 
-            travel_time = distance_matrix.get((current_point, delivery.location), float("inf"))
-            if travel_time == float("inf"):
-                continue
+    if monitor is not None:
+        def should_stop():
+            monitor.on_progress(search.nodes, search.best_time)
+            return monitor.should_stop()
 
-            arrive_time = current_time + travel_time
-            if arrive_time > delivery.latest:
-                continue
+        def on_improve(total_time, order, arrival_times):
+            monitor.on_improve(problem.to_result(order, arrival_times, total_time))
 
-            real_arrival = max(arrive_time, delivery.earliest)
+        search.should_stop = should_stop
+        search.on_improve = on_improve
+        if greedy_result:
+            monitor.on_improve(search.result())
 
-            # ✂️ 强剪枝：剩余估计+当前时间超过最优路径
-            estimate_rest = estimate_remaining_cost(delivery.location, sorted_deliveries, visited, distance_matrix)
-            if real_arrival + estimate_rest >= best_time:
-                continue
+    started = time.perf_counter()
+    search.search()
+    if stats is not None:
+        stats.update(search.stats())
+        stats.setdefault("stages", {}).update(greedy=greedy_seconds, search=time.perf_counter() - started)
+    if monitor is not None:
+        monitor.on_progress(search.nodes, search.best_time)
+    return search.result()
 
-            visited[i] = True
-            path.append(delivery)
-            arrival_times.append(real_arrival)
 
-            dfs(delivery.location, visited, path, real_arrival, arrival_times, depth + 1)
+def warm_start_path(
+    start: Tuple[int, int],
+    deliveries: List[Delivery],
+    distance_matrix: Dict[Tuple, float],
+    start_time: int = 0,
+    previous: Sequence[Tuple[int, int]] = (),
+    time_budget: float = 0.05
+) -> Optional[Dict]:
+    """
+    增量重新规划：previous 为上次路线的送货点坐标顺序（已删除的点自动跳过），
+    新增的点按最便宜的可行位置插入，再做 time_budget 秒的局部修复。
+    返回与 find_best_valid_path 相同格式的结果，无法修复时返回 None。
+    """
+    problem = RouteProblem(start, deliveries, distance_matrix, start_time)
+    index = {d.location: i for i, d in enumerate(deliveries)}
+    order = repair_order(problem, [index[p] for p in previous if p in index], time_budget)
+    if order is None:
+        return None
+    total_time, arrival_times = problem.evaluate(order)
+    return problem.to_result(order, arrival_times, total_time)
 
-            visited[i] = False
-            path.pop()
-            arrival_times.pop()
 
-    visited = [False] * n
-    dfs(start, visited, [], start_time, [], 0)
+SOLVERS = ("dfs", "dp", "heuristic", "parallel", "cluster", "incremental")
 
-    if best_path is None:
-        return None
-    return {
-        "sequence": best_path,
-        "arrival_times": best_arrival_times,
-        "total_time": best_time
-    }
\ No newline at end of file
+def plan_route(
+    start: Tuple[int, int],
+    deliveries: List[Delivery],
+    distance_matrix: Dict[Tuple, float],
+    start_time: int = 0,
+    solver: str = "dfs",
+    time_budget: Optional[float] = None,
+    workers: Optional[int] = None,
+    monitor: Optional[SearchMonitor] = None,
+    stats: Optional[Dict] = None,
+    warm_start: Optional[Sequence[Tuple[int, int]]] = None,
+    **options
+) -> Dict:
+    """
+    按 solver 选择求解器，返回格式与 find_best_valid_path 相同：
+    - "dfs"：深度优先搜索 + 下界剪枝（options 可传 bound）
+    - "dp"：Held-Karp 状态压缩 DP，精确解，适合 20~25 个以内的送货点
+    - "heuristic"：插入构造 + 局部搜索，在 time_budget 秒（默认 1 秒）内返回最好的可行解，
+      适合 50~500 个送货点
+    - "parallel"：多进程分支定界，workers 为进程数（默认 CPU 核数）
+    - "cluster"：先分簇后排路线，各簇并行求解再拼接修复，适合几百个送货点；
+      options 可传 vehicles（多车时结果按车辆分为 routes）、cluster_size、cluster_solver，
+      见 cluster_solver.solve_clustered
+    - "incremental"：只做 warm_start 的增量修复（毫秒级），修复失败或没有 warm_start 时按 "heuristic" 求解
+
+    warm_start 为上次路线的送货点坐标顺序（送货点只增删了少量时）：先在上次路线上插入 / 删除送货点
+    并局部修复（见 warm_start_path），得到的可行路线作为其他求解器的初始上界。
+    monitor 用于报告进度、推送更优解和提前停止，见 search_monitor.SearchMonitor。
+    stats 传入字典时填写求解器、搜索统计（nodes / window_prunes / bound_prunes / improvements）
+    和各阶段耗时 stages（warm_start / greedy / search，秒）。
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"unknown solver: {solver}")
+    stats = {} if stats is None else stats
+    stats["solver"] = solver
+    stages = stats.setdefault("stages", {})
+
+    warm = None
+    if warm_start is not None:
+        started = time.perf_counter()
+        warm = warm_start_path(start, deliveries, distance_matrix, start_time, warm_start)
+        stages["warm_start"] = time.perf_counter() - started
+        stats["warm_start"] = warm is not None
+        if warm is not None and monitor is not None:
+            monitor.on_improve(warm)
+    if solver == "incremental":
+        if warm is not None:
+            return warm
+        solver = "heuristic"
+
+    if solver == "dfs":
+        return find_best_valid_path(start, deliveries, distance_matrix, start_time,
+                                    monitor=monitor, stats=stats, incumbent=warm, **options)
+    if solver == "cluster":
+        # cluster_solver 用 plan_route 求解每个簇，在这里才导入以避免循环导入
+        from cluster_solver import solve_clustered
+        return solve_clustered(start, deliveries, distance_matrix, start_time,
+                               time_budget=1.0 if time_budget is None else time_budget,
+                               workers=workers, incumbent=warm, monitor=monitor, stats=stats, **options)
+
+    started = time.perf_counter()
+    greedy_result = construct_greedy_path(start, deliveries, distance_matrix, start_time)
+    stages["greedy"] = time.perf_counter() - started
+    incumbent = warm
+    if greedy_result and (warm is None or greedy_result[0] < warm["total_time"]):
+        total_time, path, arrival_times = greedy_result
+        incumbent = {"sequence": path, "arrival_times": arrival_times, "total_time": total_time}
+        if monitor is not None:
+            monitor.on_improve(incumbent)
+
+    started = time.perf_counter()
+    try:
+        if solver == "dp":
+            return solve_held_karp(start, deliveries, distance_matrix, start_time,
+                                   incumbent=incumbent, monitor=monitor, stats=stats, **options)
+        if solver == "parallel":
+            return solve_parallel(start, deliveries, distance_matrix, start_time, incumbent=incumbent,
+                                  workers=workers, monitor=monitor, stats=stats, **options)
+
+        index = {id(d): i for i, d in enumerate(deliveries)}
+        initial_orders = []
+        if greedy_result:
+            initial_orders.append([index[id(d)] for d in greedy_result[1]])
+        if warm is not None:
+            initial_orders.append([index[id(d)] for d in warm["sequence"]])
+        return solve_heuristic(start, deliveries, distance_matrix, start_time,
+                               time_budget=1.0 if time_budget is None else time_budget,
+                               initial_orders=initial_orders, monitor=monitor, stats=stats, **options)
+    finally:
+        stages["search"] = time.perf_counter() - started
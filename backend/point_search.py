@@ -0,0 +1,153 @@
+import heapq
+from typing import List, Tuple
+
+import numpy as np
+
+from csr_graph import CSRGraph
+
+INF = float("inf")
+
+
+def step_weights(graph: CSRGraph) -> Tuple[float, float]:
+    """
+    网格上每走一步的最小耗时下界 (直线, 对角线)，用于 octile 启发函数。
+    取所有未封路边中直线 / 对角线方向的最小耗时，并保证
+    直线 ≤ 对角线 ≤ 2 × 直线（绕行也不可能更便宜），使启发函数可采纳且一致。
+    """
+    open_ = ~graph.blocked & np.isfinite(graph.weights)
+    sources = graph.edge_sources()
+    width = graph.width
+    diagonal = (sources % width != graph.targets % width) & (sources // width != graph.targets // width)
+    weights = graph.weights
+    min_diagonal = float(weights[open_ & diagonal].min()) if (open_ & diagonal).any() else INF
+    min_straight = float(weights[open_ & ~diagonal].min()) if (open_ & ~diagonal).any() else INF
+    straight = max(min(min_straight, min_diagonal), 0.0)
+    if straight == INF:
+        return 0.0, 0.0  # 没有可通行的边
+    return straight, min(min_diagonal, 2 * straight)
+
+
+def octile(graph: CSRGraph, target: int, weights: Tuple[float, float]):
+    """返回到 target 的 octile 距离函数 h(v)，按 weights = (直线, 对角线) 每步耗时缩放。"""
+    width = graph.width
+    straight, diagonal = weights
+    extra = diagonal - straight
+    tx, ty = target % width, target // width
+
+    def h(v):
+        dx, dy = abs(v % width - tx), abs(v // width - ty)
+        return straight * dx + extra * dy if dx >= dy else straight * dy + extra * dx
+    return h
+
+
+def astar(graph: CSRGraph, source: int, target: int,
+          weights: Tuple[float, float]) -> Tuple[float, List[int], int]:
+    """
+    A* 点到点最短路径，启发函数为按 weights 缩放的 octile 距离。
+    f 相同时优先扩展 g 更大（更接近终点）的节点，减少网格上等价路径的重复扩展。
+
+    :param weights: step_weights(graph) 的结果
+    :return: (耗时, 节点 id 路径, 扩展节点数)；不可达时为 (inf, [], 扩展节点数)
+    """
+    offsets, tgt_arr, w_arr, blocked = graph.offsets, graph.targets, graph.weights, graph.blocked
+    h = octile(graph, target, weights)
+
+    dist = {source: 0.0}
+    pred = {source: -1}
+    closed = set()
+    heap = [(h(source), -0.0, source)]
+    while heap:
+        _, neg_d, u = heapq.heappop(heap)
+        d = -neg_d
+        if u in closed or d != dist[u]:
+            continue
+        closed.add(u)
+        if u == target:
+            return d, _trace(pred, target), len(closed)
+        start, end = offsets[u], offsets[u + 1]
+        for v, w, b in zip(tgt_arr[start:end].tolist(), w_arr[start:end].tolist(),
+                           blocked[start:end].tolist()):
+            if b:
+                continue
+            nd = d + w
+            if nd < dist.get(v, INF):
+                dist[v] = nd
+                pred[v] = u
+                heapq.heappush(heap, (nd + h(v), -nd, v))
+    return INF, [], len(closed)
+
+
+def bidirectional_astar(graph: CSRGraph, source: int, target: int,
+                        weights: Tuple[float, float] = (0.0, 0.0)) -> Tuple[float, List[int], int]:
+    """
+    双向 A*：从起点沿出边、从终点沿入边交替扩展（每次扩展键值较小的一侧）。
+    两侧使用平均势函数 p(v) = (h_t(v) - h_s(v)) / 2，正向键为 d + p(v)，反向键为 d - p(v)，
+    两侧堆顶键之和不小于已知最短路径时停止。weights 为 (0, 0) 时即双向 Dijkstra。
+
+    :return: (耗时, 节点 id 路径, 扩展节点数)；不可达时为 (inf, [], 扩展节点数)
+    """
+    if source == target:
+        return 0.0, [source], 1
+    offsets, targets = graph.offsets, graph.targets
+    rev_offsets, rev_sources, rev_edges = graph.reverse_index()
+    w_arr, blocked = graph.weights, graph.blocked
+    to_target, to_source = octile(graph, target, weights), octile(graph, source, weights)
+
+    def forward(u):
+        start, end = offsets[u], offsets[u + 1]
+        return zip(targets[start:end].tolist(), w_arr[start:end].tolist(), blocked[start:end].tolist())
+
+    def backward(u):
+        start, end = rev_offsets[u], rev_offsets[u + 1]
+        edges = rev_edges[start:end]
+        return zip(rev_sources[start:end].tolist(), w_arr[edges].tolist(), blocked[edges].tolist())
+
+    def potential(v):
+        return (to_target(v) - to_source(v)) / 2
+
+    # 下标 0 为正向，1 为反向
+    sign = (1.0, -1.0)
+    dist = ({source: 0.0}, {target: 0.0})
+    pred = ({source: -1}, {target: -1})
+    closed = (set(), set())
+    heaps = ([(potential(source), 0.0, source)], [(-potential(target), 0.0, target)])
+    expand = (forward, backward)
+    best, meet = INF, -1
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        _, d, u = heapq.heappop(heaps[side])
+        if u in closed[side] or d != dist[side][u]:
+            continue
+        closed[side].add(u)
+        mine, other = dist[side], dist[1 - side]
+        for v, w, b in expand[side](u):
+            if b:
+                continue
+            nd = d + w
+            if nd < mine.get(v, INF):
+                mine[v] = nd
+                pred[side][v] = u
+                heapq.heappush(heaps[side], (nd + sign[side] * potential(v), nd, v))
+            if v in other and nd + other[v] < best:
+                best, meet = nd + other[v], v
+
+    visited = len(closed[0]) + len(closed[1])
+    if meet < 0:
+        return INF, [], visited
+    path = _trace(pred[0], meet)
+    node = pred[1][meet]
+    while node >= 0:
+        path.append(node)
+        node = pred[1][node]
+    return best, path, visited
+
+
+def _trace(pred, target) -> List[int]:
+    path = [target]
+    while pred[path[-1]] >= 0:
+        path.append(pred[path[-1]])
+    path.reverse()
+    return path
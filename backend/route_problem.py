@@ -0,0 +1,69 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from delivery import Delivery
+
+
+class RouteProblem:
+    """
+    把起点、送货点和 (from, to) 距离表整理为按下标访问的结构，供各求解器使用。
+    下标 0 为起点，下标 i + 1 对应 deliveries[i]。
+    距离保存为 NumPy 稠密矩阵 matrix，求解器内层循环使用其 list 形式 dist
+    （按下标取单个元素时 list 比 NumPy 标量快），时间窗为扁平数组 earliest / latest。
+    """
+
+    def __init__(self, start: Tuple[int, int], deliveries: List[Delivery],
+                 distance_matrix: Dict[Tuple, float], start_time: int = 0):
+        self.start = start
+        self.deliveries = deliveries
+        self.n = len(deliveries)
+        self.start_time = start_time
+
+        points = [start] + [d.location for d in deliveries]
+        inf = float("inf")
+        if hasattr(distance_matrix, "submatrix"):
+            # KeyPointMatrix：直接按下标取子矩阵，同一位置之间耗时为 0
+            self.matrix = distance_matrix.submatrix(points)
+            same = np.array([[a == b for b in points] for a in points], dtype=bool).reshape(len(points), len(points))
+            self.matrix[same] = 0.0
+        else:
+            self.matrix = np.array([[0.0 if a == b else distance_matrix.get((a, b), inf) for b in points]
+                                    for a in points], dtype=np.float64).reshape(len(points), len(points))
+        self.dist = self.matrix.tolist()
+        self.earliest = [0] + [d.earliest for d in deliveries]
+        self.latest = [inf] + [d.latest for d in deliveries]
+
+    def closure(self) -> List[List[float]]:
+        """
+        关键点之间经任意中转的最短耗时（Floyd-Warshall），
+        即使距离表因取整不满足三角不等式，也是可靠的下界。
+        """
+        closure = self.matrix.copy()
+        for k in range(self.n + 1):
+            np.minimum(closure, closure[:, k, None] + closure[None, k, :], out=closure)
+        return closure.tolist()
+
+    def evaluate(self, order: Sequence[int]):
+        """
+        按送货点下标顺序模拟行驶，返回 (总耗时, 到达时间列表)；违反时间窗返回 None。
+        """
+        time = self.start_time
+        current = 0
+        arrival_times = []
+        for i in order:
+            arrive = time + self.dist[current][i + 1]
+            if arrive > self.latest[i + 1]:
+                return None
+            time = max(arrive, self.earliest[i + 1])
+            arrival_times.append(time)
+            current = i + 1
+        return time, arrival_times
+
+    def to_result(self, order: Sequence[int], arrival_times: List[float], total_time: float) -> Dict:
+        """把下标顺序还原为与 find_best_valid_path 相同格式的结果。"""
+        return {
+            "sequence": [self.deliveries[i] for i in order],
+            "arrival_times": list(arrival_times),
+            "total_time": total_time
+        }
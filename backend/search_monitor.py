@@ -0,0 +1,20 @@
+from typing import Dict
+
+
+class SearchMonitor:
+    """
+    求解器的进度 / 取消接口，求解器在搜索过程中定期调用：
+    - should_stop()：返回 True 时尽快结束，返回已找到的最好解
+    - on_progress(nodes, best_time)：已搜索的节点（状态 / 迭代）数和当前最优耗时
+    - on_improve(result)：找到更优的可行解（与 find_best_valid_path 相同格式）
+    默认实现什么都不做，调用方（如后台规划任务）按需覆盖。
+    """
+
+    def should_stop(self) -> bool:
+        return False
+
+    def on_progress(self, nodes: int, best_time: float):
+        pass
+
+    def on_improve(self, result: Dict):
+        pass
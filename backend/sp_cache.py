@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from csr_graph import CSRGraph, ShortestPathTree
+
+
+class ShortestPathCache:
+    """
+    以 (地图版本号, 源点 id) 为键缓存单源最短路径树，LRU 淘汰并限制总内存。
+    地图被修改（版本号变化）后，旧版本的条目在下次访问时统一清除；
+    incremental 模式下由 apply_edge_change 对单条边的改动做增量修复并迁移到新版本。
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, max_entries: int = 1024,
+                 incremental: bool = True):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.incremental = incremental
+        self._entries: "OrderedDict[Tuple[int, int], ShortestPathTree]" = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version: int, source: int) -> Optional[ShortestPathTree]:
+        """取出 (version, source) 对应的搜索树，不存在时返回 None。"""
+        with self._lock:
+            if not self._drop_stale(version):
+                return None
+            tree = self._entries.get((version, source))
+            if tree is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((version, source))
+            self.hits += 1
+            return tree
+
+    def put(self, version: int, source: int, tree: ShortestPathTree):
+        with self._lock:
+            if self._drop_stale(version):
+                self._entries[(version, source)] = tree
+
+    def apply_edge_change(self, old_version: int, new_version: int,
+                          u: Optional[int] = None, v: Optional[int] = None,
+                          old_cost: Optional[float] = None, new_cost: Optional[float] = None,
+                          graph: Optional[CSRGraph] = None):
+        """
+        地图从 old_version 变为 new_version，唯一的改动是边 u→v 的耗时 old_cost → new_cost
+        （封路为 inf）。u 为 None 表示改动不影响任何边。
+        incremental 模式下，只修复受影响的那部分最短路径树，其余距离原样保留；
+        graph 为新版本的图（写时复制）时，树随之迁移到新图上。
+        """
+        if not self.incremental:
+            return
+        with self._lock:
+            entries = OrderedDict()
+            for (version, source), tree in self._entries.items():
+                if version != old_version:
+                    continue
+                if u is not None:
+                    tree.repair_edge(u, v, old_cost, new_cost, graph)
+                elif graph is not None:
+                    with tree.lock:
+                        tree.graph = graph
+                entries[(new_version, source)] = tree
+            self._entries = entries
+            self._version = new_version
+
+    def trim(self):
+        """按 LRU 顺序淘汰条目，直到条目数和内存都不超过上限。"""
+        with self._lock:
+            total = self._nbytes_unlocked()
+            while self._entries and (len(self._entries) > self.max_entries or total > self.max_bytes):
+                _, tree = self._entries.popitem(last=False)
+                total -= tree.nbytes()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return self._nbytes_unlocked()
+
+    def _nbytes_unlocked(self) -> int:
+        return sum(tree.nbytes() for tree in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop_stale(self, version: int) -> bool:
+        """
+        切换到更新的版本时清除旧条目。版本号只增不减，
+        比当前版本还旧的请求（地图已在计算过程中被修改）返回 False，不读写缓存。
+        """
+        if self._version is not None and version < self._version:
+            return False
+        if self._version != version:
+            for key in [k for k in self._entries if k[0] != version]:
+                del self._entries[key]
+            self._version = version
+        return True
@@ -0,0 +1,206 @@
+import abc
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# ===============================
+# 结构化追踪（按日志级别开关）
+# ===============================
+# 比 DEBUG 更详细的级别：逐项输出距离矩阵等大块数据
+TRACE = 5
+logging.addLevelName(TRACE, "TRACE")
+
+logger = logging.getLogger("orionpath")
+
+
+def configure(level: Optional[str] = None):
+    """
+    设置追踪级别（默认读取环境变量 ORION_LOG_LEVEL，未设置时为 WARNING，即不输出追踪）。
+    每条追踪为一行 JSON，便于日志系统检索。
+    """
+    level = (level or os.environ.get("ORION_LOG_LEVEL", "WARNING")).upper()
+    logger.setLevel(TRACE if level == "TRACE" else getattr(logging, level, logging.WARNING))
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+
+
+def enabled(level: int = logging.DEBUG) -> bool:
+    return logger.isEnabledFor(level)
+
+
+def trace(event: str, level: int = logging.DEBUG, **fields):
+    """输出一条结构化追踪；级别未开启时只做一次级别判断，不构造消息。"""
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"ts": round(time.time(), 6), "level": logging.getLevelName(level),
+                                      "event": event, **fields}, default=str, ensure_ascii=False))
+
+
+# ===============================
+# Prometheus 指标
+# ===============================
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric(abc.ABC):
+    """指标基类：子类给出 kind 并实现 _samples（每个标签组合输出的样本行）"""
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        ...
+
+
+class Counter(_Metric):
+    """只增不减的计数器（按标签分组）"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in items]
+
+
+class Gauge(Counter):
+    """可设置的瞬时值"""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """累积直方图：每个桶记录不超过上界的观测次数，另有总和与总数"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Iterable[float] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                                             1, 2.5, 5, 10, 30, 60)):
+        super().__init__(name, help, labels)
+        self.buckets = sorted(buckets)
+        self._series: Dict[Tuple, List] = {}  # 标签 → [各桶计数, 总和, 总数]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = sorted((key, ([*counts], total, n)) for key, (counts, total, n) in self._series.items())
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {n}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "orion_http_request_duration_seconds", "HTTP 请求耗时", ("method", "route", "status")))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "orion_stage_duration_seconds", "规划各阶段耗时（matrix / effective_graph / greedy / search）", ("stage",)))
+PLAN_JOBS = REGISTRY.register(Counter(
+    "orion_plan_jobs_total", "结束的规划任务数", ("solver", "status")))
+PLANNER_NODES = REGISTRY.register(Counter(
+    "orion_planner_nodes_total", "求解器扩展的节点（状态 / 迭代）数", ("solver",)))
+PLANNER_PRUNES = REGISTRY.register(Counter(
+    "orion_planner_prunes_total", "求解器剪枝次数，reason 为 window（时间窗）或 bound（下界）", ("solver", "reason")))
+PLANNER_IMPROVEMENTS = REGISTRY.register(Counter(
+    "orion_planner_incumbent_updates_total", "搜索中最优解被更新的次数", ("solver",)))
+MAPS = REGISTRY.register(Gauge("orion_maps", "已加载的地图数"))
+SESSIONS = REGISTRY.register(Gauge("orion_sessions", "会话数"))
+MAP_BYTES = REGISTRY.register(Gauge("orion_map_bytes", "地图占用的内存（CSR + 缓存 + 收缩层次）"))
+
+
+@contextmanager
+def span(stage: str, **fields):
+    """计时一个阶段：耗时记入 orion_stage_duration_seconds，DEBUG 级别下输出追踪"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace("stage", stage=stage, seconds=round(elapsed, 6), **fields)
+
+
+def record_plan(stats: Dict, status: str):
+    """记录一次规划的求解器计数和阶段耗时（stats 由 planner.plan_route 填写）"""
+    solver = stats.get("solver", "")
+    PLAN_JOBS.inc(solver=solver, status=status)
+    PLANNER_NODES.inc(stats.get("nodes", 0), solver=solver)
+    PLANNER_PRUNES.inc(stats.get("window_prunes", 0), solver=solver, reason="window")
+    PLANNER_PRUNES.inc(stats.get("bound_prunes", 0), solver=solver, reason="bound")
+    PLANNER_IMPROVEMENTS.inc(stats.get("improvements", 0), solver=solver)
+    for stage, seconds in stats.get("stages", {}).items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    trace("plan.stats", status=status, **stats)
@@ -0,0 +1,256 @@
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from delivery_manager import DeliveryManager, DeliverySnapshot
+from graph_map import GraphMap
+
+# 默认地图 / 会话的 id：不带 map_id / session_id 的旧接口使用它们，不会被淘汰
+DEFAULT_ID = "default"
+
+# 与上次规划相比增删 / 修改的送货点不超过这个数时，在上次路线上增量重新规划
+WARM_START_MAX_DELTA = 5
+
+# 单张地图的节点数上限（2000 x 2000，CSR 数组约 250 MB），防止一个请求耗尽所有租户共用的内存
+MAX_MAP_NODES = 4_000_000
+
+
+class MapEntry:
+    """注册表中的一张地图：GraphMap（自带最短路径缓存）和最近访问时间。"""
+
+    def __init__(self, map_id: str, gmap: GraphMap, pinned: bool = False):
+        self.id = map_id
+        self.gmap = gmap
+        self.pinned = pinned
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        # ETag 前缀：同一 id 的地图被删除后重建时不会与旧地图的版本号混淆
+        self.tag = f"{map_id}-{int(self.created_at * 1000):x}"
+
+    def etag(self, version: int, variant: str = "") -> str:
+        return f'"{self.tag}-{version}{"-" + variant if variant else ""}"'
+
+    def info(self) -> Dict:
+        return {
+            "map_id": self.id,
+            "width": self.gmap.width,
+            "height": self.gmap.height,
+            "backend": self.gmap.backend,
+            "version": self.gmap.version,
+            "hierarchy": self.gmap.ch is not None,
+            "cached_trees": len(self.gmap.sp_cache),
+            "nbytes": self.gmap.nbytes(),
+            "created_at": self.created_at,
+        }
+
+
+class Session:
+    """一个客户端的规划会话：绑定一张地图，拥有独立的送货点列表和出发时间。"""
+
+    def __init__(self, session_id: str, map_id: str, base_time: str = "08:00"):
+        self.id = session_id
+        self.map_id = map_id
+        self.deliveries = DeliveryManager(base_time)
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        # 最近一次单车规划的路线：起点、出发时间、送货点坐标顺序和当时的时间窗（绝对分钟数）
+        self.last_plan: Optional[Dict] = None
+
+    def remember_plan(self, start: Tuple[int, int], base: int, result: Optional[Dict]):
+        """记录规划结果，供下次增量重新规划（多车结果和无解时不记录）"""
+        if not result or "sequence" not in result:
+            return
+        self.last_plan = {
+            "start": tuple(start),
+            "base": base,
+            "sequence": [d.location for d in result["sequence"]],
+            "windows": {d.location: (d.start, d.end) for d in result["sequence"]},
+        }
+
+    def warm_start(self, start: Tuple[int, int], snapshot: DeliverySnapshot) -> Optional[List[Tuple[int, int]]]:
+        """
+        与上次规划相比起点和出发时间不变、送货点的增删 / 时间窗修改不超过 WARM_START_MAX_DELTA 个时，
+        返回上次路线中仍然存在的送货点坐标（按原顺序），否则返回 None。
+        """
+        last = self.last_plan
+        if last is None or last["start"] != tuple(start) or last["base"] != snapshot.base:
+            return None
+        kept = [location for location in last["sequence"] if location in snapshot.index]
+        delta = len(last["sequence"]) - len(kept) + len(snapshot.entries) - len(kept)
+        for location in kept:
+            if snapshot.entries[snapshot.index[location]][1:] != last["windows"][location]:
+                delta += 1
+        return kept if delta <= WARM_START_MAX_DELTA else None
+
+    def info(self) -> Dict:
+        return {
+            "session_id": self.id,
+            "map_id": self.map_id,
+            "base_time": self.deliveries.get_base_time(),
+            "deliveries": len(self.deliveries.get_all()),
+            "created_at": self.created_at,
+        }
+
+
+class TenantRegistry:
+    """
+    按 id 管理多张地图和多个会话，一个进程可以同时服务多个配送站。
+    每张地图有自己的 CSR 数组、最短路径缓存和收缩层次，互不影响。
+
+    淘汰策略：
+    - 所有地图的内存（GraphMap.nbytes）超过 max_bytes 时，按最近访问顺序清空最久未用地图的缓存，
+      仍然超限时再丢弃最久未用地图的收缩层次
+    - 超过 idle_seconds 未访问的地图连同它的会话一起删除（pinned 的地图除外，如默认地图）
+    """
+
+    def __init__(self, max_bytes: int = 1024 * 1024 * 1024, idle_seconds: Optional[float] = 3600,
+                 cache_bytes: int = 256 * 1024 * 1024, max_nodes: int = MAX_MAP_NODES):
+        """
+        :param max_bytes: 所有地图的内存上限
+        :param idle_seconds: 地图闲置多久后删除，None 表示不删除
+        :param cache_bytes: 每张地图最短路径缓存的内存上限
+        :param max_nodes: 单张地图的节点数（width * height）上限
+        """
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.cache_bytes = cache_bytes
+        self.max_nodes = max_nodes
+        self.maps: Dict[str, MapEntry] = {}
+        self.sessions: Dict[str, Session] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    # ===============================
+    # 地图
+    # ===============================
+    def check_size(self, width: int, height: int):
+        """地图尺寸不合法（非正数或节点数超过 max_nodes）时抛出 ValueError，在分配数组之前调用。"""
+        if width <= 0 or height <= 0:
+            raise ValueError(f"invalid map size: {width}x{height}")
+        if width * height > self.max_nodes:
+            raise ValueError(f"map {width}x{height} exceeds the limit of {self.max_nodes} nodes")
+
+    def create_map(self, width: int, height: int, backend: str = "networkx",
+                   map_id: Optional[str] = None, edges: Optional[List[Dict]] = None,
+                   pinned: bool = False) -> MapEntry:
+        """
+        创建地图；edges（格式与 /map/edges 相同）不为空时载入其中的耗时和封路状态。
+        尺寸不合法或 map_id 已存在时抛出 ValueError。
+        """
+        self.check_size(width, height)
+        gmap = GraphMap(width, height, backend=backend)
+        if edges:
+            gmap.load_edges(edges)
+        return self.add_map(gmap, map_id, pinned)
+
+    def add_map(self, gmap: GraphMap, map_id: Optional[str] = None, pinned: bool = False) -> MapEntry:
+        """登记已构建好的地图（如从快照文件加载的地图）；map_id 已存在时抛出 ValueError。"""
+        gmap.sp_cache.max_bytes = self.cache_bytes
+        with self._lock:
+            if map_id is None:
+                map_id = f"map-{next(self._ids)}"
+            if map_id in self.maps:
+                raise ValueError(f"map {map_id} already exists")
+            entry = MapEntry(map_id, gmap, pinned)
+            self.maps[map_id] = entry
+        self.evict()
+        return entry
+
+    def get_map(self, map_id: str) -> Optional[MapEntry]:
+        """取出地图并刷新访问时间，不存在时返回 None。"""
+        entry = self.maps.get(map_id)
+        if entry is not None:
+            entry.last_used = time.monotonic()
+        return entry
+
+    def delete_map(self, map_id: str) -> bool:
+        """删除地图和绑定在它上面的会话。"""
+        with self._lock:
+            return self._delete_map(map_id)
+
+    def _delete_map(self, map_id: str) -> bool:
+        entry = self.maps.pop(map_id, None)
+        if entry is None:
+            return False
+        for session_id in [s.id for s in self.sessions.values() if s.map_id == map_id]:
+            del self.sessions[session_id]
+        return True
+
+    # ===============================
+    # 会话
+    # ===============================
+    def create_session(self, map_id: str, base_time: str = "08:00",
+                       session_id: Optional[str] = None) -> Session:
+        """在地图 map_id 上创建会话；地图不存在或 session_id 已存在时抛出 ValueError。"""
+        with self._lock:
+            if map_id not in self.maps:
+                raise ValueError(f"map {map_id} not found")
+            if session_id is None:
+                session_id = f"session-{next(self._ids)}"
+            if session_id in self.sessions:
+                raise ValueError(f"session {session_id} already exists")
+            session = Session(session_id, map_id, base_time)
+            self.sessions[session_id] = session
+        self.evict()
+        return session
+
+    def get_session(self, session_id: str) -> Optional[Session]:
+        """取出会话并刷新它和所用地图的访问时间，不存在时返回 None。"""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_used = time.monotonic()
+            self.get_map(session.map_id)
+        return session
+
+    def delete_session(self, session_id: str) -> bool:
+        with self._lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    # ===============================
+    # 内存统计与淘汰
+    # ===============================
+    def nbytes(self) -> int:
+        return sum(entry.gmap.nbytes() for entry in list(self.maps.values()))
+
+    def evict(self) -> Dict[str, List[str]]:
+        """
+        删除闲置的地图；总内存超限时先清空最久未用地图的最短路径缓存，
+        仍然超限时再丢弃最久未用地图的收缩层次（查询回到 Dijkstra / A*，需要时可重新构建）。
+        :return: {"deleted": 被删除的地图 id, "cleared": 被清空缓存的地图 id,
+                  "dropped": 被丢弃收缩层次的地图 id}
+        """
+        deleted, cleared, dropped = [], [], []
+        with self._lock:
+            if self.idle_seconds is not None:
+                deadline = time.monotonic() - self.idle_seconds
+                for entry in list(self.maps.values()):
+                    if not entry.pinned and entry.last_used < deadline:
+                        self._delete_map(entry.id)
+                        deleted.append(entry.id)
+            entries = sorted(self.maps.values(), key=lambda e: e.last_used)
+        total = sum(entry.gmap.nbytes() for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            freed = entry.gmap.sp_cache.nbytes()
+            if freed:
+                entry.gmap.sp_cache.clear()
+                total -= freed
+                cleared.append(entry.id)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            freed = entry.gmap.drop_hierarchy()
+            if freed:
+                total -= freed
+                dropped.append(entry.id)
+        return {"deleted": deleted, "cleared": cleared, "dropped": dropped}
+
+    def stats(self) -> Dict:
+        return {
+            "num_maps": len(self.maps),
+            "num_sessions": len(self.sessions),
+            "nbytes": self.nbytes(),
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,137 @@
+from fastapi.testclient import TestClient
+from delivery import Delivery
+from plan_jobs import PlanJobManager
+import asyncio
+import json
+import random
+import threading
+import time
+import main
+
+def read_events(text):
+    """把 SSE 响应拆成 (event, data) 列表"""
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def wait_finished(job, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while not job.finished and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    return job.finished
+
+def occupy_workers(jobs, count):
+    """提交 count 个长时间运行的任务，占住进程池（已进入调用队列的任务无法撤销，需要多占几个）"""
+    rng = random.Random(1)
+    points = rng.sample([(x, y) for x in range(40) for y in range(40)], 300)
+    start = (20, 20)
+    matrix = {(a, b): abs(a[0] - b[0]) + abs(a[1] - b[1]) for a in [start] + points for b in [start] + points}
+    deliveries = [Delivery(p, ("08:00", "23:59")) for p in points]
+    return [jobs.submit(start, deliveries, matrix, solver="heuristic", time_budget=30) for _ in range(count)]
+
+def test_compute_plan_cancelled_while_queued():
+    client = TestClient(main.app)
+    jobs, main.plan_jobs = main.plan_jobs, PlanJobManager(workers=1)
+    try:
+        blockers = occupy_workers(main.plan_jobs, 3)
+        response = {}
+        waiting = threading.Thread(target=lambda: response.update(client.post("/compute-plan").json()))
+        waiting.start()
+        deadline = time.perf_counter() + 30
+        while len(main.plan_jobs.jobs) < 4 and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        job_id = next(job_id for job_id in main.plan_jobs.jobs if job_id not in {b.id for b in blockers})
+
+        # ✅ 排队中的任务被撤销时，等待中的 /compute-plan 返回 cancelled 而不是 500
+        assert client.post(f"/plan-jobs/{job_id}/cancel").json()["job_id"] == job_id
+        waiting.join(timeout=30)
+        assert response == {"status": "cancelled", "job_id": job_id, "message": "Job cancelled before it started"}
+        assert main.plan_jobs.get(job_id).status == "cancelled"
+        for blocker in blockers:
+            main.plan_jobs.cancel(blocker.id)
+    finally:
+        main.plan_jobs.shutdown()
+        main.plan_jobs = jobs
+
+def test_plan_stream_events():
+    client = TestClient(main.app)
+    session = main.tenants.create_session(main.DEFAULT_ID)
+    session.deliveries.add_deliveries([((5, 2), ("08:20", "10:00")), ((9, 9), ("08:30", "10:30")),
+                                       ((1, 8), ("08:10", "09:40")), ((7, 5), ("08:00", "10:30"))])
+    try:
+        # ✅ 依次收到 job → 每个更优解 solution → done，最后一个解即最终结果
+        events = read_events(client.get("/compute-plan/stream", params={"session_id": session.id, "solver": "dfs"}).text)
+        names = [name for name, _ in events]
+        assert names[0] == "job" and names[-1] == "done" and "solution" in names
+        job_id = events[0][1]["job_id"]
+        solutions = [data for name, data in events if name == "solution"]
+        for solution in solutions:
+            assert sorted(solution["sequence"]) == sorted(list(d.location) for d in session.deliveries.get_all())
+            assert len(solution["arrival_times"]) == len(solution["sequence"]) == 4
+            assert all(len(t) == 5 and t[2] == ":" for t in solution["arrival_times"])
+            assert solution["total_time"] == solution["arrival_minutes"][-1] and solution["elapsed"] >= 0
+        assert [s["total_time"] for s in solutions] == sorted((s["total_time"] for s in solutions), reverse=True)
+        done = events[-1][1]
+        assert done["job_id"] == job_id and done["status"] == "done"
+        assert done["result"]["total_time"] == solutions[-1]["total_time"]
+        assert done["result"]["sequence"] == solutions[-1]["sequence"]
+
+        # ✅ 已结束的任务：/plan-jobs/{job_id}/events 补发全部解和 done
+        replay = read_events(client.get(f"/plan-jobs/{job_id}/events").text)
+        assert [data for name, data in replay if name == "solution"] == solutions and replay[-1][0] == "done"
+    finally:
+        main.tenants.delete_session(session.id)
+
+def test_plan_stream_cancelled_on_disconnect():
+    class Request:
+        disconnected = False
+
+        async def is_disconnected(self):
+            return self.disconnected
+
+    async def first_event(stream):
+        return await stream.__anext__()
+
+    jobs, main.plan_jobs = main.plan_jobs, PlanJobManager(workers=3)
+    try:
+        # 超过时间预算前不会结束的任务
+        watched, disconnected, stopped = occupy_workers(main.plan_jobs, 3)
+
+        # ✅ /plan-jobs/{job_id}/events 只是旁观：停止读取不取消任务
+        stream = main.stream_job(Request(), watched, cancel_on_disconnect=False)
+        assert asyncio.run(first_event(stream))[:len("event: job")] == "event: job"
+        asyncio.run(stream.aclose())
+        assert not watched.cancel_event.is_set()
+
+        # ✅ 客户端断开：下一次检查时取消任务
+        request = Request()
+        stream = main.stream_job(request, disconnected, cancel_on_disconnect=True)
+
+        async def disconnect():
+            await stream.__anext__()
+            request.disconnected = True
+            return [event async for event in stream]
+        assert asyncio.run(disconnect()) == []
+
+        # ✅ 客户端停止读取（响应被关闭）：同样取消任务
+        stream = main.stream_job(Request(), stopped, cancel_on_disconnect=True)
+
+        async def stop_early():
+            await stream.__anext__()
+            await stream.aclose()
+        asyncio.run(stop_early())
+
+        for job in (disconnected, stopped):
+            assert wait_finished(job) and job.status == "cancelled"
+        assert not watched.finished
+        main.plan_jobs.cancel(watched.id)
+    finally:
+        main.plan_jobs.shutdown()
+        main.plan_jobs = jobs
+
+if __name__ == "__main__":
+    test_compute_plan_cancelled_while_queued()
+    test_plan_stream_events()
+    test_plan_stream_cancelled_on_disconnect()
@@ -60,5 +60,167 @@ def test_visual_distance_matrix():
     plt.grid(True)
     plt.show()
 
+def test_distance_matrix_cache():
+    gmap = GraphMap(8, 8)
+    key_points = [(0, 0), (3, 4), (7, 7)]
+
+    # ✅ 地图未变时第二次计算全部命中缓存，结果一致
+    first = compute_distance_matrix(gmap, key_points)
+    misses = gmap.sp_cache.misses
+    assert compute_distance_matrix(gmap, key_points) == first
+    assert gmap.sp_cache.misses == misses
+
+    # ✅ 新增关键点只为新源点建树，旧树续算
+    key_points.append((6, 1))
+    extended = compute_distance_matrix(gmap, key_points)
+    assert gmap.sp_cache.misses == misses + 1
+    assert all(extended[k] == v for k, v in first.items())
+
+    # ✅ 改耗时后版本号变化，缓存结果随之更新
+    gmap.set_edge_weight((0, 0), (1, 1), 100)
+    updated = compute_distance_matrix(gmap, key_points)
+    assert updated == compute_distance_matrix(gmap, key_points, use_cache=False)
+    assert len(gmap.sp_cache) == len(key_points)
+
+def test_incremental_repair_after_edge_changes():
+    gmap = GraphMap(8, 8, backend="csr")
+    key_points = [(0, 0), (4, 3), (7, 7), (2, 6)]
+    compute_distance_matrix(gmap, key_points)
+
+    # ✅ 封路 / 解封 / 改耗时后，修复后的缓存树与重新计算结果一致，且不重新建树
+    edits = [
+        lambda: gmap.toggle_block_edge((0, 0), (1, 1)),
+        lambda: gmap.set_edge_weight((1, 0), (2, 1), 1),
+        lambda: gmap.toggle_block_edge((3, 3), (4, 3)),
+        lambda: gmap.set_edge_weight((4, 4), (5, 5), 40),
+        lambda: gmap.toggle_block_edge((0, 0), (1, 1)),
+    ]
+    misses = gmap.sp_cache.misses
+    for edit in edits:
+        edit()
+        assert compute_distance_matrix(gmap, key_points) == \
+            compute_distance_matrix(gmap, key_points, use_cache=False)
+    assert gmap.sp_cache.misses == misses
+
+def test_dense_matrix_matches_dict():
+    import dijkstra
+    gmap = GraphMap(10, 6)
+    gmap.set_block_edge((2, 2), (3, 3))
+    gmap.set_block_edge((4, 0), (4, 1))
+    key_points = [(0, 0), (9, 5), (4, 1), (0, 0)]
+
+    # ✅ 稠密矩阵与字典结果一致；scipy 批量、进程池、逐个搜索三条路径结果相同
+    dense = compute_distance_matrix(gmap, key_points, use_cache=False, dense=True)
+    assert dense.to_dict() == compute_distance_matrix(gmap, key_points, use_cache=False)
+    assert dense[((0, 0), (9, 5))] == dense.array[0, 1]
+    scipy_dijkstra = dijkstra.csgraph_dijkstra
+    try:
+        dijkstra.csgraph_dijkstra = None
+        for workers in (None, 2):
+            other = compute_distance_matrix(gmap, key_points, use_cache=False, dense=True, workers=workers)
+            assert (other.array == dense.array).all()
+    finally:
+        dijkstra.csgraph_dijkstra = scipy_dijkstra
+
+def test_scipy_trees_limited_and_compact():
+    import numpy as np
+    import dijkstra
+    from csr_graph import ShortestPathTree
+    gmap = GraphMap(40, 40, backend="csr")
+    for y in range(1, 39):
+        gmap.toggle_block_edge((20, y), (21, y))
+    csr = gmap.csr
+    sources = [csr.node_id(p) for p in [(0, 0), (5, 5), (19, 20)]]
+    targets = sources + [csr.node_id((30, 2))]
+
+    # ✅ 带距离上限搜索：关键点距离正确，上限外的节点未确定，之后可从边界继续搜索到整张图
+    trees = dict(dijkstra._scipy_trees(csr, sources, targets))
+    for source, tree in trees.items():
+        full = ShortestPathTree(csr, source)
+        full.settle()
+        assert [tree.dist[t] for t in targets] == [full.dist[t] for t in targets]
+        assert isinstance(tree.dist, np.ndarray)
+        # ✅ 内存估算即数组的实际大小
+        assert tree.nbytes() >= tree.dist.nbytes + tree.pred.nbytes + len(tree.settled)
+        if source == sources[1]:
+            assert tree.heap and not all(tree.settled)
+        tree.settle()
+        assert np.array_equal(tree.dist, np.array(full.dist))
+
+def test_hierarchy_matches_dijkstra():
+    plain = GraphMap(9, 7)
+    hierarchy = GraphMap(9, 7)
+    hierarchy.build_hierarchy()
+    key_points = [(0, 0), (8, 6), (4, 3), (1, 5)]
+
+    # ✅ 收缩层次在封路 / 改耗时后增量定制，结果与 Dijkstra 一致
+    edits = [
+        lambda g: g.toggle_block_edge((4, 3), (4, 4)),
+        lambda g: g.set_edge_weight((0, 0), (1, 1), 2),
+        lambda g: g.set_block_edge((4, 3), (5, 3)),
+        lambda g: g.set_edge_weight((4, 4), (4, 3), 30),
+        lambda g: g.toggle_block_edge((4, 3), (4, 4)),
+    ]
+    for edit in edits:
+        edit(plain)
+        edit(hierarchy)
+        assert compute_distance_matrix(hierarchy, key_points) == \
+            compute_distance_matrix(plain, key_points, use_cache=False)
+        path, cost = hierarchy.shortest_path((8, 6), (0, 0), method="ch")
+        assert (path, cost) != ([], float("inf"))
+        assert cost == plain.shortest_path((8, 6), (0, 0), method="dijkstra")[1]
+
+    # ✅ 没有收缩层次时 method="ch" 按 A* 查询，不会在读请求中构建
+    assert plain.shortest_path((8, 6), (0, 0), method="ch")[1] == cost and plain.ch is None
+
+def test_matrix_leg_paths():
+    import dijkstra
+    import pickle
+
+    def check(gmap, matrix, key_points):
+        # 每一段路径首尾正确、不经过封路边，耗时之和等于矩阵中的距离
+        snapshot = gmap.snapshot()
+        for a in key_points:
+            for b in key_points:
+                path = matrix.path(a, b)
+                assert path[0] == a and path[-1] == b
+                cost = sum(snapshot.edge_cost(snapshot.csr.edge_index(u, v)) for u, v in zip(path, path[1:]))
+                assert round(cost, 2) == matrix.array[matrix.index[a], matrix.index[b]]
+
+    gmap = GraphMap(10, 6, backend="csr")
+    gmap.set_block_edge((2, 2), (3, 3))
+    gmap.set_block_edge((4, 0), (4, 1))
+    key_points = [(0, 0), (9, 5), (4, 1), (7, 2)]
+
+    # ✅ scipy 批量 / 逐个搜索 / 缓存命中三条路径都能还原逐节点路径
+    check(gmap, compute_distance_matrix(gmap, key_points, dense=True, paths=True), key_points)
+    scipy_dijkstra = dijkstra.csgraph_dijkstra
+    try:
+        dijkstra.csgraph_dijkstra = None
+        check(gmap, compute_distance_matrix(gmap, key_points, use_cache=False, dense=True, paths=True), key_points)
+    finally:
+        dijkstra.csgraph_dijkstra = scipy_dijkstra
+    misses = gmap.sp_cache.misses
+    matrix = compute_distance_matrix(gmap, key_points, dense=True, paths=True)
+    assert gmap.sp_cache.misses == misses
+    check(gmap, matrix, key_points)
+
+    # ✅ 之后的封路不影响已取出的路径；传给求解进程时不带路径
+    leg = matrix.path((0, 0), (9, 5))
+    gmap.set_block_edge(leg[1], leg[2])
+    assert matrix.path((0, 0), (9, 5)) == leg
+    assert matrix.legs((0, 0), [(4, 1), (9, 5)]) == [matrix.path((0, 0), (4, 1)), matrix.path((4, 1), (9, 5))]
+    assert pickle.loads(pickle.dumps(matrix)).paths is None
+
+    # ✅ 收缩层次：按需展开捷径
+    gmap.build_hierarchy()
+    check(gmap, compute_distance_matrix(gmap, key_points, dense=True, paths=True), key_points)
+
 if __name__ == "__main__":
-    test_visual_distance_matrix()
\ No newline at end of file
+    test_visual_distance_matrix()
+    test_distance_matrix_cache()
+    test_incremental_repair_after_edge_changes()
+    test_dense_matrix_matches_dict()
+    test_scipy_trees_limited_and_compact()
+    test_hierarchy_matches_dijkstra()
+    test_matrix_leg_paths()
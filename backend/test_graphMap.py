@@ -1,4 +1,14 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+
 from graph_map import GraphMap
+from delivery_manager import DeliveryManager
+from dijkstra import compute_distance_matrix
+from map_store import load_map, save_map
+from tenants import TenantRegistry
 import networkx as nx
 import matplotlib.pyplot as plt
 
@@ -60,5 +70,210 @@ def test_graph_visual():
     plt.grid(True)
     plt.show()
 
+def test_csr_backend_matches_networkx():
+    # ✅ 两种后端在相同操作后应给出一致的边信息
+    nx_map = GraphMap(6, 6)
+    csr_map = GraphMap(6, 6, backend="csr")
+    for gmap in (nx_map, csr_map):
+        gmap.toggle_block_edge((2, 2), (3, 3))
+        gmap.set_edge_weight((1, 1), (1, 2), 9)
+
+    assert sorted(nx_map.get_nodes()) == sorted(csr_map.get_nodes())
+    nx_edges = sorted((e["from"], e["to"], e["weight"], e["blocked"]) for e in nx_map.get_edges())
+    csr_edges = sorted((e["from"], e["to"], e["weight"], e["blocked"]) for e in csr_map.get_edges())
+    assert nx_edges == csr_edges
+
+    for u, v in [((2, 2), (3, 3)), ((1, 1), (1, 2)), ((0, 0), (5, 5))]:
+        assert nx_map.get_edge_info(u, v) == csr_map.get_edge_info(u, v)
+
+    # ✅ csr 后端的 networkx 视图由调用方持有，不缓存在地图的快照上
+    assert not csr_map.get_effective_graph().has_edge((2, 2), (3, 3))
+    assert csr_map.snapshot()._graph is None and csr_map.snapshot()._effective_view is None
+
+    assert csr_map.toggle_block_edge((2, 2), (3, 3)) == {"status": "unblocked"}
+    assert not csr_map.csr.blocked[csr_map.csr.edge_index((2, 2), (3, 3))]
+
+def test_point_to_point_search():
+    gmap = GraphMap(12, 8)
+    for x in range(1, 8):
+        gmap.toggle_block_edge((x, 3), (x, 4))
+        gmap.toggle_block_edge((x, 3), (x - 1, 4))
+        gmap.toggle_block_edge((x, 3), (x + 1, 4))
+    gmap.set_edge_weight((9, 3), (9, 4), 1)
+
+    # ✅ A* / 双向 A* / Dijkstra 与 networkx 给出相同的最短耗时，路径首尾正确
+    effective = gmap.get_effective_graph()
+    for a, b in [((0, 0), (4, 7)), ((11, 0), (0, 7)), ((5, 5), (5, 5)), ((3, 2), (9, 4))]:
+        expected = nx.dijkstra_path_length(effective, a, b, weight="weight")
+        for method in ("astar", "bidirectional", "dijkstra"):
+            path, cost = gmap.shortest_path(a, b, method=method)
+            assert cost == expected and path[0] == a and path[-1] == b
+            assert sum(effective[u][v]["weight"] for u, v in zip(path, path[1:])) == cost
+
+    # ✅ 不可达时返回空路径和 inf
+    gmap.toggle_block_edge((0, 0), (1, 0))
+    gmap.toggle_block_edge((0, 0), (0, 1))
+    gmap.toggle_block_edge((0, 0), (1, 1))
+    assert gmap.shortest_path((0, 0), (4, 7)) == ([], float("inf"))
+
+def test_snapshot_isolation():
+    gmap = GraphMap(10, 6)
+    before = gmap.snapshot()
+    view = gmap.get_effective_graph()
+    gmap.toggle_block_edge((2, 2), (3, 2))
+    gmap.set_edge_weight((4, 4), (5, 4), 1)
+    gmap.set_block_edge((6, 1), (7, 1))
+
+    # ✅ 旧快照和它的视图不受之后的修改影响，新版本可见全部修改
+    assert before.version == 0 and not before.blocked_edges
+    assert view.has_edge((2, 2), (3, 2)) and view[(4, 4)][(5, 4)]["weight"] == 5
+    assert before.has_edge((6, 1), (7, 1)) and before.csr.weights[before.csr.edge_index((4, 4), (5, 4))] == 5
+    after = gmap.snapshot()
+    assert after.version == 3 and after.blocked_edges == {((2, 2), (3, 2)), ((6, 1), (7, 1))}
+    assert not gmap.get_effective_graph().has_edge((2, 2), (3, 2)) and not gmap.has_edge((6, 1), (7, 1))
+
+    # ✅ 写线程不断封路 / 解封时，读线程每次读到的都是某个完整版本：同一快照内封路集合与 CSR 一致
+    errors = []
+    def writer():
+        for i in range(200):
+            gmap.toggle_block_edge((i % 9, 3), (i % 9 + 1, 3))
+    def reader():
+        for _ in range(200):
+            snapshot = gmap.snapshot()
+            blocked = {(u, v) for u, v, _, b in snapshot.csr.iter_edges() if b}
+            if blocked != set(snapshot.blocked_edges):
+                errors.append(snapshot.version)
+    threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+
+    # ✅ 大地图的单次修改只复制被改的一页，其余页与旧快照共享；收缩层次同样分页
+    large = GraphMap(100, 100, backend="csr")
+    large.build_hierarchy()
+    old = large.snapshot()
+    large.set_edge_weight((50, 50), (51, 50), 1)
+    new = large.snapshot()
+    pages = list(zip(old.csr._weights.pages, new.csr._weights.pages))
+    assert len(pages) > 1 and sum(a is not b for a, b in pages) == 1
+    arc_pages = list(zip(old.ch.up_weight.pages, new.ch.up_weight.pages))
+    assert sum(a is not b for a, b in arc_pages) < len(arc_pages) // 2
+    eid = new.csr.edge_index((50, 50), (51, 50))
+    assert old.csr.weights[eid] == 5 and new.csr.weights[eid] == 1 and not new.csr.weights.flags.writeable
+
+    # ✅ 送货点快照同样不随之后的增删变化
+    manager = DeliveryManager()
+    manager.add_delivery((1, 1), ("08:10", "09:00"))
+    snapshot = manager.snapshot()
+    manager.remove_delivery((1, 1))
+    manager.set_base_time("09:00")
+    assert [d.location for d in snapshot.deliveries] == [(1, 1)] and snapshot.base_time == "08:00"
+    assert manager.get_all() == [] and manager.version == snapshot.version + 2
+
+def test_tenant_registry():
+    registry = TenantRegistry(idle_seconds=60)
+    registry.create_map(20, 10, map_id="default", pinned=True)
+    depot = registry.create_map(8, 8, backend="csr", edges=[{"from": (0, 0), "to": (1, 0), "weight": 1, "blocked": False},
+                                                            {"from": (1, 0), "to": (2, 0), "weight": 5, "blocked": True}])
+    # ✅ 载入的耗时 / 封路只作用于这张地图
+    assert depot.gmap.get_edge_info((0, 0), (1, 0))["weight"] == 1
+    assert depot.gmap.get_edge_info((1, 0), (2, 0))["blocked"]
+    assert registry.get_map("default").gmap.get_edge_info((0, 0), (1, 0))["weight"] == 5
+
+    # ✅ 每个会话有独立的送货点和出发时间
+    a = registry.create_session(depot.id, base_time="09:00")
+    b = registry.create_session(depot.id)
+    a.deliveries.add_delivery((3, 3), ("09:30", "10:00"))
+    assert len(b.deliveries.get_all()) == 0 and a.info()["base_time"] == "09:00"
+
+    # ✅ 每张地图有自己的缓存和内存统计；超出内存上限时清空最久未用地图的缓存
+    compute_distance_matrix(depot.gmap, [(0, 0), (3, 3)])
+    assert len(depot.gmap.sp_cache) > 0 and depot.info()["nbytes"] > depot.gmap.csr.nbytes()
+    registry.max_bytes = 0
+    assert registry.evict()["cleared"] == [depot.id] and len(depot.gmap.sp_cache) == 0
+
+    # ✅ 清空缓存后仍超限时丢弃收缩层次，查询回到 A*，结果不变
+    cost = depot.gmap.shortest_path((0, 0), (7, 7))[1]
+    depot.gmap.build_hierarchy()
+    assert registry.evict()["dropped"] == [depot.id] and depot.gmap.ch is None
+    assert depot.gmap.shortest_path((0, 0), (7, 7), method="ch")[1] == cost
+    registry.max_bytes = 1024 * 1024 * 1024
+
+    # ✅ 超出节点数上限的地图在分配数组之前拒绝
+    for width, height in [(registry.max_nodes + 1, 1), (0, 10)]:
+        try:
+            registry.create_map(width, height, backend="csr")
+            assert False, "oversized map accepted"
+        except ValueError:
+            pass
+
+    # ✅ 闲置地图连同会话一起删除，固定的默认地图保留
+    depot.last_used -= 120
+    assert registry.evict()["deleted"] == [depot.id]
+    assert registry.get_session(a.id) is None and registry.get_map("default") is not None
+
+def test_map_snapshot_file():
+    gmap = GraphMap(9, 7)
+    gmap.set_block_edge((1, 1), (2, 1))
+    gmap.toggle_block_edge((3, 3), (3, 4))
+    gmap.set_edge_weight((5, 5), (6, 6), 2)
+    path = os.path.join(tempfile.mkdtemp(), "depot.orionmap")
+    save_map(gmap, path)
+
+    # ✅ 加载后（内存映射）边、封路、版本与原地图一致，最短路径相同
+    loaded = load_map(path)
+    assert isinstance(loaded.csr.weights, np.memmap)
+    assert loaded.version == gmap.version and loaded.blocked_edges == gmap.blocked_edges
+    assert loaded.get_edges() == gmap.get_edges() and not loaded.has_edge((1, 1), (2, 1))
+    assert loaded.shortest_path((0, 0), (8, 6)) == gmap.shortest_path((0, 0), (8, 6))
+    columnar = loaded.snapshot().edges_columnar()
+    assert len(columnar["from"]) == len(gmap.get_edges()) and sum(columnar["blocked"]) == 1  # set_block_edge 删除的边不在边表中
+
+    # ✅ 修改在副本上进行，文件内容不变
+    loaded.set_edge_weight((0, 0), (1, 0), 1)
+    assert loaded.get_edge_info((0, 0), (1, 0))["weight"] == 1
+    assert load_map(path, mmap=False).get_edge_info((0, 0), (1, 0))["weight"] == 5
+
+def test_change_log():
+    gmap = GraphMap(6, 6)
+    gmap.toggle_block_edge((0, 0), (1, 0))
+    v1 = gmap.version
+    gmap.set_edge_weight((2, 2), (3, 2), 1)
+    gmap.set_block_edge((4, 4), (5, 5))
+    gmap.toggle_block_edge((0, 0), (1, 0))
+
+    # ✅ 只返回 v1 之后改动过的边及其当前状态
+    changes = gmap.changes_since(v1)
+    assert changes["version"] == 4 and not changes["reset"]
+    edges = {(e["from"], e["to"]): e for e in changes["edges"]}
+    assert set(edges) == {((2, 2), (3, 2)), ((4, 4), (5, 5)), ((0, 0), (1, 0))}
+    assert edges[((2, 2), (3, 2))]["weight"] == 1 and not edges[((4, 4), (5, 5))]["exists"]
+    assert not edges[((0, 0), (1, 0))]["blocked"]
+    assert gmap.changes_since(gmap.version)["edges"] == []
+
+    # ✅ 增量应用到旧的边表后与完整边表一致
+    gmap.load_edges([{"from": (1, 1), "to": (2, 2), "weight": 9, "blocked": True}])
+    table = {(e["from"], e["to"]): e for e in GraphMap(6, 6).get_edges()}
+    for e in gmap.changes_since(0)["edges"]:
+        if e["exists"]:
+            table[(e["from"], e["to"])] = {k: e[k] for k in ("from", "to", "weight", "blocked")}
+        else:
+            table.pop((e["from"], e["to"]), None)
+    assert sorted(table.values(), key=str) == sorted(gmap.get_edges(), key=str)
+
+    # ✅ 记录被丢弃或版本号超前时需要重新获取全部边
+    gmap.change_log.max_edges = 1
+    gmap.set_edge_weight((3, 3), (3, 4), 2)
+    assert gmap.changes_since(v1)["reset"] and not gmap.changes_since(gmap.version - 1)["reset"]
+    assert gmap.changes_since(gmap.version + 1)["reset"]
+
 if __name__ == "__main__":
-    test_graph_visual()
\ No newline at end of file
+    test_graph_visual()
+    test_csr_backend_matches_networkx()
+    test_point_to_point_search()
+    test_snapshot_isolation()
+    test_tenant_registry()
+    test_map_snapshot_file()
+    test_change_log()
\ No newline at end of file
@@ -1,7 +1,14 @@
-from delivery import Delivery
+from delivery import Delivery, format_times, valid_time
+from delivery_manager import DeliveryManager
 from graph_map import GraphMap
 from dijkstra import compute_distance_matrix
-from planner import find_best_valid_path
+from planner import find_best_valid_path, plan_route
+from plan_jobs import PlanJobManager, format_plan
+from route_problem import RouteProblem
+from search_monitor import SearchMonitor
+from tenants import DEFAULT_ID, Session
+import itertools
+import telemetry
 
 def test_dfs_path_planning():
     # ✅ 1. 构建地图
@@ -40,5 +47,265 @@ def test_dfs_path_planning():
     # ✅ 7. 可视化地图 + 路径 + 时间窗
     gmap.visualize(deliveries, start=start, path_result=result)
 
+def test_exact_and_heuristic_solvers():
+    # ✅ 小规模实例上与穷举所有顺序的结果对比
+    gmap = GraphMap(10, 10)
+    deliveries = [
+        Delivery((5, 2), ("08:20", "10:00")),
+        Delivery((9, 9), ("08:30", "10:30")),
+        Delivery((1, 8), ("08:10", "09:40")),
+        Delivery((7, 5), ("08:00", "10:30")),
+        Delivery((3, 3), ("08:40", "09:20")),
+    ]
+    start = (0, 0)
+    matrix = compute_distance_matrix(gmap, [start] + [d.location for d in deliveries])
+
+    problem = RouteProblem(start, deliveries, matrix)
+    feasible = [problem.evaluate(order) for order in itertools.permutations(range(len(deliveries)))]
+    optimum = min(r[0] for r in feasible if r)
+
+    for solver in ("dfs", "dp", "heuristic", "parallel"):
+        result = plan_route(start, deliveries, matrix, solver=solver, time_budget=0.5, workers=2)
+        assert result["total_time"] == optimum
+        assert len(result["sequence"]) == len(deliveries)
+
+def test_heuristic_respects_time_budget():
+    import random
+    import time
+    from heuristic_solver import solve_heuristic
+    # 300 个送货点，插入构造（O(n³)）本身就超过时间预算
+    rng = random.Random(1)
+    points = rng.sample([(x, y) for x in range(40) for y in range(40)], 300)
+    start = (20, 20)
+    matrix = {(a, b): abs(a[0] - b[0]) + abs(a[1] - b[1]) for a in [start] + points for b in [start] + points}
+    for window in [("08:00", "23:59"), ("08:00", "08:30")]:
+        deliveries = [Delivery(p, window) for p in points]
+
+        # ✅ 可行 / 不可行实例都在预算内返回，构造超时时退回贪心路线继续搜索
+        started = time.perf_counter()
+        result = solve_heuristic(start, deliveries, matrix, time_budget=0.5)
+        assert time.perf_counter() - started < 0.5 + 0.3
+        assert (result is not None) == (window[1] == "23:59")
+
+def test_mst_bound_admissible():
+    import random
+    from bounds import make_bound
+    gmap = GraphMap(10, 10)
+    rng = random.Random(3)
+    points = rng.sample([(x, y) for x in range(10) for y in range(10) if (x, y) != (0, 0)], 6)
+    deliveries = [Delivery(p, (f"08:{rng.randrange(0, 40):02d}", f"{rng.randrange(10, 12)}:00")) for p in points]
+    start = (0, 0)
+    problem = RouteProblem(start, deliveries, compute_distance_matrix(gmap, [start] + points))
+    dist, earliest, latest = problem.dist, problem.earliest, problem.latest
+
+    def optimal_completion(current, time, remaining):
+        # 穷举剩余送货点的所有顺序，满足时间窗的最短完成时间
+        best = float("inf")
+        for order in itertools.permutations(remaining):
+            t, node = time, current
+            for i in order:
+                if t + dist[node][i + 1] > latest[i + 1]:
+                    break
+                t, node = max(t + dist[node][i + 1], earliest[i + 1]), i + 1
+            else:
+                best = min(best, t)
+        return best
+
+    # ✅ 任意前缀之后的下界都不超过穷举得到的最优完成时间；增量维护的 MST 与重新计算的一致
+    for name in ("min_edge", "mst"):
+        bound = make_bound(name, problem)
+        for depth in range(4):
+            for prefix in itertools.permutations(range(problem.n), depth):
+                state = problem.evaluate(prefix)
+                if state is None:
+                    continue
+                time = state[0] if prefix else 0.0
+                current = prefix[-1] + 1 if prefix else 0
+                for i in prefix:
+                    bound.visit(i)
+                remaining = [i for i in range(problem.n) if i not in prefix]
+                assert bound.estimate(current, time) <= optimal_completion(current, time, remaining)
+                if name == "mst":
+                    assert abs(bound.mst() - sum(w for w, _, _ in bound._prim(remaining))) < 1e-9
+                # 与 branch_bound 的 finally 一样按正序回溯（不是后进先出）
+                for i in prefix:
+                    bound.unvisit(i)
+
+def test_cluster_solver():
+    gmap = GraphMap(20, 20)
+    start = (10, 10)
+    # 四个方向各一组送货点，时间窗按方向错开
+    deliveries = []
+    for k, (dx, dy) in enumerate([(1, 1), (-1, 1), (-1, -1), (1, -1)]):
+        for j in range(5):
+            location = (10 + dx * (2 + j % 3), 10 + dy * (2 + j // 3 * 3))
+            deliveries.append(Delivery(location, (f"{8 + k}:00", f"{10 + k}:00")))
+    matrix = compute_distance_matrix(gmap, [start] + [d.location for d in deliveries])
+    problem = RouteProblem(start, deliveries, matrix)
+    index = {id(d): i for i, d in enumerate(deliveries)}
+
+    # ✅ 单车：所有送货点都在时间窗内送达，不差于贪心解
+    stats = {}
+    result = plan_route(start, deliveries, matrix, solver="cluster", cluster_size=4, workers=1, stats=stats)
+    order = [index[id(d)] for d in result["sequence"]]
+    assert sorted(order) == list(range(len(deliveries)))
+    assert problem.evaluate(order) == (result["total_time"], result["arrival_times"])
+    assert stats["clusters"] >= 5 and {"partition", "clusters", "repair"} <= set(stats["stages"])
+
+    # ✅ 多车：每个送货点恰好出现一次，每条路线都可行
+    result = plan_route(start, deliveries, matrix, solver="cluster", vehicles=2, cluster_size=4, workers=2)
+    orders = [[index[id(d)] for d in route["sequence"]] for route in result["routes"]]
+    assert len(orders) == 2 and not result["unassigned"]
+    assert sorted(sum(orders, [])) == list(range(len(deliveries)))
+    assert all(problem.evaluate(order) is not None for order in orders)
+    assert result["total_time"] == max(route["total_time"] for route in result["routes"])
+    assert format_plan(result)["routes"][0]["sequence"] == [d.location for d in result["routes"][0]["sequence"]]
+
+def test_incremental_replanning():
+    gmap = GraphMap(10, 10)
+    start = (0, 0)
+    session = Session("s", DEFAULT_ID)
+    session.deliveries.add_deliveries([((5, 2), ("08:20", "10:00")), ((9, 9), ("08:30", "10:30")),
+                                       ((1, 8), ("08:10", "09:40")), ((7, 5), ("08:00", "10:30"))])
+
+    def plan(solver, warm_start=None):
+        snapshot = session.deliveries.snapshot()
+        deliveries = list(snapshot.deliveries)
+        matrix = compute_distance_matrix(gmap, [start] + [d.location for d in deliveries])
+        stats = {}
+        result = plan_route(start, deliveries, matrix, solver=solver, warm_start=warm_start, stats=stats)
+        return result, stats, RouteProblem(start, deliveries, matrix), deliveries
+
+    first, _, _, _ = plan("dfs")
+    session.remember_plan(start, session.deliveries.snapshot().base, first)
+    assert session.warm_start(start, session.deliveries.snapshot()) == [d.location for d in first["sequence"]]
+
+    # ✅ 新增一个送货点：在上次路线上插入并修复，不重新搜索
+    session.deliveries.add_delivery((3, 3), ("08:40", "09:20"))
+    warm_start = session.warm_start(start, session.deliveries.snapshot())
+    assert warm_start == [d.location for d in first["sequence"]]
+    result, stats, problem, deliveries = plan("incremental", warm_start)
+    assert stats["warm_start"] and "greedy" not in stats["stages"]
+    order = [deliveries.index(d) for d in result["sequence"]]
+    assert sorted(order) == list(range(5)) and problem.evaluate(order)[0] == result["total_time"]
+
+    # ✅ 修复结果作为精确搜索的初始上界，最优解不变
+    exact, _, _, _ = plan("dfs", warm_start)
+    assert exact["total_time"] == plan("dfs")[0]["total_time"] <= result["total_time"]
+
+    # ✅ 删除送货点同样走增量；改动过多或出发时间改变时放弃增量
+    session.remember_plan(start, session.deliveries.snapshot().base, exact)
+    session.deliveries.remove_delivery((9, 9))
+    assert (9, 9) not in session.warm_start(start, session.deliveries.snapshot())
+    session.deliveries.add_deliveries([((x, 6), ("08:00", "12:00")) for x in range(6)])
+    assert session.warm_start(start, session.deliveries.snapshot()) is None
+    session.deliveries.set_base_time("08:30")
+    assert session.warm_start(start, session.deliveries.snapshot()) is None
+
+def test_plan_jobs_and_monitor():
+    gmap = GraphMap(10, 10)
+    deliveries = [Delivery((x, y), ("08:00", "12:00")) for x, y in [(5, 2), (9, 9), (1, 8), (7, 5), (3, 3), (8, 1)]]
+    start = (0, 0)
+    matrix = compute_distance_matrix(gmap, [start] + [d.location for d in deliveries], dense=True)
+    expected = plan_route(start, deliveries, matrix)["total_time"]
+
+    # ✅ 每个求解器都通过 monitor 推送可行解，其中最好的即最终结果
+    class Recorder(SearchMonitor):
+        def __init__(self):
+            self.times = []
+
+        def on_improve(self, result):
+            self.times.append(result["total_time"])
+
+    for solver in ("dfs", "dp", "heuristic", "parallel"):
+        recorder = Recorder()
+        result = plan_route(start, deliveries, matrix, solver=solver, time_budget=0.2, workers=2, monitor=recorder)
+        assert recorder.times and min(recorder.times) == result["total_time"] == expected
+
+    # ✅ 后台任务在进程池中运行，结果与直接调用一致
+    jobs = PlanJobManager(workers=1)
+    try:
+        job = jobs.submit(start, deliveries, matrix, solver="dfs")
+        assert job.future.result(timeout=30)["total_time"] == expected
+        assert job.snapshot()["best_time"] == expected
+        assert jobs.get(job.id) is job and jobs.get("missing") is None
+    finally:
+        jobs.shutdown()
+
+def test_delivery_manager_bulk_and_index():
+    manager = DeliveryManager(base_time="08:00")
+    manager.add_delivery((1, 1), ("08:10", "09:00"))
+    total = manager.add_deliveries([((2, 2), ("08:20", "09:10")), ((1, 1), ("08:30", "09:20")),
+                                    ((3, 3), ("08:40", "09:30"))])
+
+    # ✅ 同一坐标只保留一个送货点（时间窗被更新），按坐标索引查询
+    assert total == 3 and [d.location for d in manager.get_all()] == [(1, 1), (2, 2), (3, 3)]
+    assert manager.get((1, 1)).earliest == 30 and manager.exists((3, 3)) and not manager.exists((4, 4))
+    earliest, latest = manager.windows()
+    assert earliest.tolist() == [30, 20, 40] and latest.tolist() == [80, 70, 90]
+
+    manager.remove_delivery((2, 2))
+    assert [d.location for d in manager.get_all()] == [(1, 1), (3, 3)] and manager.get((3, 3)).latest == 90
+    assert manager.add_deliveries([((5, 5), ("09:00", "10:00"))], replace=True) == 1
+    assert manager.to_dict_list() == [{"location": (5, 5), "earliest": 60, "latest": 120}]
+
+    # ✅ 批量导入分别统计新增和更新的数量，重复坐标只计一次
+    counts = manager.upsert_deliveries([((5, 5), ("09:00", "10:00")), ((6, 6), ("09:00", "10:00")),
+                                        ((6, 6), ("09:30", "10:00"))])
+    assert counts == {"added": 1, "updated": 1, "total": 2}
+    manager.remove_delivery((6, 6))
+    assert valid_time("23:59") and not valid_time("24:00") and not valid_time("10:60") and not valid_time("9am")
+
+    # ✅ 修改出发时间后已有送货点按新的出发时间重新计算偏移（绝对时间不变）
+    before = manager.snapshot()
+    manager.set_base_time("08:30")
+    # 只发布新的出发时间，送货点和索引原样复用；旧快照的偏移不变
+    assert manager.snapshot().entries is before.entries and manager.snapshot().index is before.index
+    assert before.get((5, 5)).earliest == 60 and before.windows()[0].tolist() == [60]
+    d = manager.get((5, 5))
+    assert (d.earliest, d.latest) == (30, 90) and manager.windows()[0].tolist() == [30]
+    assert manager.snapshot().format_times([0, 45.7, 1000]) == ["08:30", "09:15", "25:10"]
+    assert format_times([12, 75], base=480) == [d.format_minutes(12 - 30), d.format_minutes(75 - 30)]
+
+def test_solver_stats_and_metrics():
+    gmap = GraphMap(10, 10)
+    deliveries = [
+        Delivery((5, 2), ("08:20", "10:00")),
+        Delivery((9, 9), ("08:30", "10:30")),
+        Delivery((1, 8), ("08:10", "09:40")),
+        Delivery((3, 3), ("08:40", "09:20")),
+    ]
+    start = (0, 0)
+    matrix = compute_distance_matrix(gmap, [start] + [d.location for d in deliveries])
+
+    # ✅ 每个求解器都填写同一组计数和阶段耗时
+    for solver in ("dfs", "dp", "heuristic", "parallel"):
+        stats = {}
+        plan_route(start, deliveries, matrix, solver=solver, time_budget=0.2, workers=2, stats=stats)
+        assert stats["solver"] == solver and set(stats["stages"]) == {"greedy", "search"}
+        assert {"nodes", "window_prunes", "bound_prunes", "improvements"} <= set(stats)
+        before = telemetry.PLANNER_NODES.value(solver=solver)
+        telemetry.record_plan(stats, "done")
+        assert telemetry.PLANNER_NODES.value(solver=solver) == before + stats["nodes"]
+
+    # ✅ 时间窗太紧时剪枝计入 window
+    stats = {}
+    tight = [Delivery((9, 9), ("08:00", "08:01")), Delivery((5, 2), ("08:20", "10:00"))]
+    plan_route(start, tight, compute_distance_matrix(gmap, [start, (9, 9), (5, 2)]), stats=stats)
+    assert stats["window_prunes"] > 0 and stats["improvements"] == 0
+
+    text = telemetry.REGISTRY.render()
+    assert 'orion_planner_prunes_total{solver="dfs",reason="window"}' in text
+    assert 'orion_stage_duration_seconds_bucket{stage="matrix",le="+Inf"}' in text
+    assert "# TYPE orion_http_request_duration_seconds histogram" in text
+
 if __name__ == "__main__":
-    test_dfs_path_planning()
\ No newline at end of file
+    test_dfs_path_planning()
+    test_exact_and_heuristic_solvers()
+    test_heuristic_respects_time_budget()
+    test_mst_bound_admissible()
+    test_cluster_solver()
+    test_incremental_replanning()
+    test_plan_jobs_and_monitor()
+    test_delivery_manager_bulk_and_index()
+    test_solver_stats_and_metrics()